@@ -1,4 +1,5 @@
 
+import time
 import chainlit as cl
 from typing import Optional
 from pathlib import Path
@@ -6,48 +7,82 @@ from src.hr_agent.agent import agent
 from src.shared.schemas import ProfileContext
 from src.shared.chat_history import ChatHistoryManager
 from src.shared.pdf_processor import PDFProcessor
+from src.shared.usage_tracker import usage_tracker
 from src.shared.logger_config import (
     setup_logfire,
     log_user_message,
     log_agent_response,
     log_database_operation,
-    log_pdf_operation
+    log_pdf_operation,
+    flush_logs
 )
+from src.shared.metrics import observe_phase, start_metrics_server, timed
 from src.auth import auth_manager
 # Инициализация logfire
 setup_logfire()
 
-# Глобальная переменная для отслеживания инициализации БД
-_database_initialized = False
+# Endpoint /metrics для Prometheus (если задан METRICS_PORT)
+start_metrics_server()
 
 # Инициализация базы данных
 async def init_database():
     """Initialize database tables on startup"""
-    global _database_initialized
-    if _database_initialized:
-        return
-
     try:
-        from src.database.config import create_tables
-        await create_tables()
-        print("✅ Database tables created successfully")
-        _database_initialized = True
+        from src.database.config import init_schema
+        # Схема создается один раз на процесс (под блокировкой)
+        if await init_schema():
+            print("✅ Database tables created successfully")
     except Exception as e:
         print(f"❌ Failed to create database tables: {e}")
         raise
 
-# Используем встроенный Chainlit SQLAlchemy data layer для сессий
+@cl.on_app_startup
+async def on_app_startup():
+    await init_database()
+    from src.database.data_layer import get_shared_data_layer
+    # Инвалидация кэшей между воркерами через LISTEN/NOTIFY (DB_CACHE_NOTIFY)
+    await get_shared_data_layer().start_invalidation_listener()
+    # Фоновая архивация неактивных диалогов (THREAD_ARCHIVE_AFTER_DAYS)
+    get_shared_data_layer().start_archiver()
+    # Доставка профилей из outbox в Google Sheets и другие приемники (PROFILE_EXPORT_SINKS)
+    get_shared_data_layer().start_outbox_dispatcher()
+    # Периодическая сверка листа Google Sheets с БД (SHEETS_RECONCILE_INTERVAL)
+    get_shared_data_layer().start_sheets_reconciler()
+    # Прогрев клиента Google Sheets и обновление токена заранее (SHEETS_WARMUP)
+    from src.shared.google_sheets import start_sheets_warmup
+    start_sheets_warmup()
+    # Токенизатор, провайдер OpenAI и пул БД - в фоне, когда сервер уже слушает порт
+    from src.shared.startup import schedule_prewarm
+    schedule_prewarm()
+
+@cl.on_app_shutdown
+async def on_app_shutdown():
+    from src.database.config import dispose_engine
+    from src.database.data_layer import get_shared_data_layer
+    from src.shared.google_sheets import stop_sheets_warmup
+    from src.shared.sheets_queue import get_sheets_queue
+    from src.shared.startup import stop_prewarm
+    stop_prewarm()
+    # Отправляем профили из очереди Google Sheets
+    await get_sheets_queue().close()
+    stop_sheets_warmup()
+    # Сначала дописываем буфер шагов и профилей, затем закрываем пул
+    try:
+        await get_shared_data_layer().close()
+    finally:
+        flush_logs()
+        await dispose_engine()
+
+# Один data layer и один пул соединений на процесс: общий для Chainlit и нашего кода
 @cl.data_layer
 def get_data_layer():
-    from chainlit.data.sql_alchemy import SQLAlchemyDataLayer
-    from src.shared.database_url import get_database_url
+    from src.database.data_layer import get_shared_data_layer
 
-    conninfo = get_database_url()
-    return SQLAlchemyDataLayer(conninfo=conninfo)
+    return get_shared_data_layer()
 
 @cl.password_auth_callback
-def auth_callback(username: str, password: str) -> Optional[cl.User]:
-    """Callback для авторизации Chainlit"""
+async def auth_callback(username: str, password: str) -> Optional[cl.User]:
+    """Callback для авторизации Chainlit (bcrypt - в пуле потоков)"""
     # Валидация входных данных
     if not username or not password:
         return None
@@ -59,7 +94,7 @@ def auth_callback(username: str, password: str) -> Optional[cl.User]:
     if len(password) < 4:
         return None
 
-    return auth_manager.authenticate(username.strip(), password.strip())
+    return await auth_manager.authenticate_async(username.strip(), password.strip())
 
 @cl.on_chat_start
 async def start():
@@ -97,6 +132,8 @@ async def start():
 
 @cl.on_message
 async def main(message: cl.Message):
+    turn_started = time.perf_counter()
+
     # Получаем контекст профиля и менеджер истории из сессии
     profile_context = cl.user_session.get("profile_context")
     chat_manager = cl.user_session.get("chat_manager")
@@ -165,7 +202,7 @@ async def main(message: cl.Message):
     log_user_message(
         session_id=session_id,
         message=message.content,
-        profile_context=profile_context.model_dump() if profile_context else None
+        profile_context=profile_context
     )
 
     # Формируем сообщение с историей для агента
@@ -185,16 +222,20 @@ async def main(message: cl.Message):
     cl.user_session.set("message_history", message_history)
 
     # Запускаем агент с контекстом и историей
-    result = await agent.run(
-        message_with_history,
-        deps=profile_context
-    )
+    with timed("agent_run"):
+        result = await agent.run(
+            message_with_history,
+            deps=profile_context
+        )
+
+    # Сохраняем расход токенов по thread и пользователю
+    await usage_tracker.record_run(result)
 
     # Логируем ответ агента
     log_agent_response(
         session_id=session_id,
         response=result.output,
-        profile_context=profile_context.model_dump() if profile_context else None
+        profile_context=profile_context
     )
 
     # Обновляем историю в user_session для следующих сообщений (Chainlit автоматически сохраняет в UI)
@@ -216,6 +257,8 @@ async def main(message: cl.Message):
 
     await cl.Message(content=final_response).send()
 
+    observe_phase("turn", time.perf_counter() - turn_started)
+
 from chainlit.types import ThreadDict
 
 @cl.on_chat_resume
@@ -261,7 +304,14 @@ async def on_chat_resume(thread: ThreadDict):
 
         print(f"Restored profile context for session {session_id}")
         print(f"Current stage: {profile_context.current_stage}")
-        print(f"Profile completion: {profile_context.get_completion_percentage():.1f}%")
+        profile = profile_context.profile
+        completed_sections = sum([
+            profile.is_position_complete(),
+            profile.is_hard_skills_complete(),
+            profile.is_soft_skills_complete(),
+            profile.is_work_conditions_complete(),
+        ])
+        print(f"Profile completion: {completed_sections}/4 sections")
     else:
         # Создаем новый контекст если не найден
         profile_context = ProfileContext()
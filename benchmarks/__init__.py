@@ -0,0 +1 @@
+"""Performance tooling for AI HR Assistant (load tests and benchmarks)."""
@@ -0,0 +1,106 @@
+"""
+Login burst: bcrypt on the event loop vs the auth thread pool.
+
+Creates ``--users`` users, then logs each of them in ``--repeats`` times
+concurrently, while one attacker tries ``--brute-force`` wrong passwords for
+the first user. For both modes the report shows how long the burst takes,
+the event-loop lag seen by everything else on the worker (websockets,
+streaming) and how the attempts ended.
+
+Usage:
+    uv run python -m benchmarks.auth_login --users 20 --repeats 3
+    uv run python -m benchmarks.auth_login --brute-force 200 --json-out auth.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+os.environ.setdefault("LOGFIRE_IGNORE_NO_CONFIG", "1")
+
+from benchmarks.load_test import summarize  # noqa: E402
+from benchmarks.sheets_export import measure_lag  # noqa: E402
+
+
+async def run_mode(args: argparse.Namespace, mode: str, auth) -> Dict[str, Any]:
+    users = [f"user{index}" for index in range(args.users)]
+    for name in users:
+        await auth.add_user(name, f"password-{name}")
+    results: Counter = Counter()
+    lags: List[float] = []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(measure_lag(lags, stop))
+
+    async def login(username: str, password: str):
+        if mode == "blocking":
+            # Как раньше: синхронный callback, bcrypt прямо в event loop
+            user = await auth.get_user(username)
+            user = user if user and auth.check_password(user, password) else None
+        else:
+            user = await auth.authenticate_async(username, password)
+        results["ok" if user else "rejected"] += 1
+
+    attempts = [(name, f"password-{name}") for name in users] * args.repeats
+    attempts += [(users[0], f"wrong-{index}") for index in range(args.brute_force)]
+    started = time.perf_counter()
+    await asyncio.gather(*(login(name, password) for name, password in attempts))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler
+
+    return {
+        "mode": mode,
+        "attempts": len(attempts),
+        "ok": results["ok"],
+        "rejected": results["rejected"],
+        "burst_s": elapsed,
+        "loop_lag": summarize(lags),
+    }
+
+
+def print_result(result: Dict[str, Any]):
+    lag = result["loop_lag"]
+    print(
+        f"{result['mode']:<9} attempts={result['attempts']:<5} ok={result['ok']:<5} "
+        f"rejected={result['rejected']:<5} burst={result['burst_s']:7.2f}s  "
+        f"loop_lag p95={lag.get('p95_ms', 0):8.1f}ms max={lag.get('max_ms', 0):8.1f}ms"
+    )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument(
+        "--repeats", type=int, default=3, help="logins per user in the burst"
+    )
+    parser.add_argument(
+        "--brute-force", type=int, default=50, help="wrong passwords for user0"
+    )
+    parser.add_argument("--json-out", help="write the results to a JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    os.environ.setdefault("LOGFIRE_CONSOLE", "false")
+    from src.auth import AuthManager
+    from src.auth.store import MemoryCredentialStore
+
+    results = []
+    for mode in ("blocking", "async"):
+        auth = AuthManager(store=MemoryCredentialStore())
+        result = asyncio.run(run_mode(args, mode, auth))
+        print_result(result)
+        results.append(result)
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
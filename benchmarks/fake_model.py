@@ -0,0 +1,71 @@
+"""Fake LLM for load tests: a pydantic-ai FunctionModel with configurable latency."""
+
+import asyncio
+import itertools
+import random
+from typing import Any, Dict, List, Tuple
+
+from pydantic_ai.messages import (
+    ModelMessage,
+    ModelResponse,
+    TextPart,
+    ToolCallPart,
+    ToolReturnPart,
+)
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+# Scripted tool calls that walk a profile through every stage
+SCRIPTED_TOOL_CALLS: List[Tuple[str, Dict[str, Any]]] = [
+    (
+        "update_position_info",
+        {"title": "Python Developer", "experience_years": 3, "company_field": "IT"},
+    ),
+    (
+        "update_hard_skills",
+        {"programming_languages": ["Python", "SQL"], "frameworks": ["FastAPI"]},
+    ),
+    (
+        "update_soft_skills",
+        {"personal_qualities": ["Ответственность"], "team_skills": ["Scrum"]},
+    ),
+    (
+        "update_work_conditions",
+        {"work_format": "remote", "salary_expectations": "250 000 ₽"},
+    ),
+    ("get_profile_status", {}),
+]
+
+
+def make_fake_model(
+    latency: float = 0.5, jitter: float = 0.0, tool_calls: bool = True
+) -> FunctionModel:
+    """
+    Build a FunctionModel that imitates the OpenAI model used by the agent.
+
+    Args:
+        latency: Base latency of every model request, seconds
+        jitter: Extra uniformly distributed latency, seconds
+        tool_calls: Whether every turn first calls one of the agent tools
+
+    Returns:
+        FunctionModel usable with ``agent.override(model=...)``
+    """
+    scripted = itertools.cycle(SCRIPTED_TOOL_CALLS)
+
+    async def respond(messages: List[ModelMessage], info: AgentInfo) -> ModelResponse:
+        await asyncio.sleep(latency + random.uniform(0, jitter))  # nosec B311
+
+        last_parts = messages[-1].parts if messages else []
+        tool_returned = any(isinstance(part, ToolReturnPart) for part in last_parts)
+        available = {tool.name for tool in info.function_tools}
+
+        if tool_calls and not tool_returned:
+            tool_name, args = next(scripted)
+            if tool_name in available:
+                return ModelResponse(parts=[ToolCallPart(tool_name, args)])
+
+        return ModelResponse(
+            parts=[TextPart("Спасибо! Расскажите подробнее о требованиях к кандидату.")]
+        )
+
+    return FunctionModel(respond, model_name="fake-gpt-4o-mini")
@@ -0,0 +1,245 @@
+"""Synthetic inputs and local fakes shared by benchmarks."""
+
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import a1_to_rowcol
+
+from src.shared.google_sheets import HEADERS
+from src.shared.schemas import (
+    CandidateProfile,
+    HardSkills,
+    PositionInfo,
+    ProfileContext,
+    SoftSkills,
+    WorkConditions,
+)
+
+LOREM = (
+    "Lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua"
+)
+
+
+def make_pdf(path: Path, pages: int, lines_per_page: int = 40) -> Path:
+    """Write a minimal valid PDF with extractable text on every page"""
+    objects: List[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",  # Pages, filled in below
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for page in range(pages):
+        lines = [
+            f"({page + 1}.{line + 1} {LOREM}) Tj 0 -14 Td"
+            for line in range(lines_per_page)
+        ]
+        stream = ("BT /F1 10 Tf 40 800 Td " + " ".join(lines) + " ET").encode()
+        objects.append(
+            b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        )
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref_offset,
+    )
+
+    path.write_bytes(bytes(output))
+    return path
+
+
+def make_history(length: int) -> List[Dict[str, Any]]:
+    """Alternating user/assistant messages as stored in user_session"""
+    return [
+        {
+            "type": "user" if index % 2 == 0 else "assistant",
+            "content": f"Сообщение {index}: {LOREM}",
+            "timestamp": None,
+        }
+        for index in range(length)
+    ]
+
+
+def make_profile_context(pdf_chars: int = 0) -> ProfileContext:
+    """Fully filled profile, optionally with company PDF text of given size"""
+    profile = CandidateProfile(
+        position=PositionInfo(
+            title="Senior Python Developer", experience_years=5, company_field="FinTech"
+        ),
+        hard_skills=HardSkills(
+            programming_languages=["Python", "SQL", "Go"],
+            frameworks=["FastAPI", "Django", "SQLAlchemy"],
+            tools=["Docker", "Kubernetes", "PostgreSQL"],
+            certifications=["AWS Solutions Architect"],
+        ),
+        soft_skills=SoftSkills(
+            personal_qualities=["Ответственность", "Проактивность"],
+            communication_skills=["Презентации", "Переговоры"],
+            team_skills=["Scrum", "Код-ревью"],
+            leadership_skills=["Менторство"],
+        ),
+        work_conditions=WorkConditions(
+            work_format="hybrid",
+            salary_expectations="350 000 ₽",
+            benefits=["ДМС", "Обучение"],
+            travel_readiness=False,
+        ),
+    )
+    text = (LOREM + "\n") * (pdf_chars // (len(LOREM) + 1) + 1)
+    return ProfileContext(
+        profile=profile, company_info_pdf=text[:pdf_chars] if pdf_chars else None
+    )
+
+
+class FakeResponse:
+    """Minimal requests.Response for gspread.exceptions.APIError"""
+
+    def __init__(self, status_code: int, headers: Optional[Dict[str, str]] = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = ""
+
+    def json(self) -> Dict[str, Any]:
+        return {
+            "error": {
+                "code": self.status_code,
+                "message": "Quota exceeded for quota metric 'Write requests'",
+                "status": "RESOURCE_EXHAUSTED",
+            }
+        }
+
+
+class FakeWorksheet:
+    """In-memory stand-in for gspread.Worksheet; API calls go to its spreadsheet"""
+
+    def __init__(self, title: str, spreadsheet: "FakeSpreadsheet"):
+        self.title = title
+        self.rows: List[List[Any]] = []
+        self.spreadsheet = spreadsheet
+
+    def _request(self):
+        self.spreadsheet._request()
+
+    def append_row(self, values: List[Any], **kwargs) -> Dict[str, Any]:
+        return self.append_rows([values], **kwargs)
+
+    def append_rows(self, values: List[List[Any]], **kwargs) -> Dict[str, Any]:
+        self._request()
+        start = len(self.rows) + 1
+        self.rows.extend(list(row) for row in values)
+        end = len(self.rows)
+        return {"updates": {"updatedRange": f"{self.title}!A{start}:F{end}"}}
+
+    def _write(self, range_name: str, values: List[List[Any]]):
+        """Write a grid of values starting at the top-left cell of the range"""
+        row, col = a1_to_rowcol(range_name.split("!")[-1].split(":")[0])
+        for row_offset, row_values in enumerate(values):
+            while len(self.rows) < row - 1 + row_offset + 1:
+                self.rows.append([])
+            target = self.rows[row - 1 + row_offset]
+            for col_offset, value in enumerate(row_values):
+                while len(target) < col - 1 + col_offset + 1:
+                    target.append("")
+                target[col - 1 + col_offset] = value
+
+
+class FakeSpreadsheet:
+    """
+    In-memory stand-in for gspread.Spreadsheet holding FakeWorksheets.
+
+    ``latency`` simulates the HTTP round trip of every call (blocking, like
+    gspread) and the first ``quota_errors`` calls fail with a 429 APIError.
+    Both, and the ``calls`` counter, are shared by all worksheets, like the
+    per-project quota of the real API.
+    """
+
+    def __init__(
+        self,
+        titles: Tuple[str, ...] = ("Лист1",),
+        latency: float = 0.0,
+        quota_errors: int = 0,
+    ):
+        self.latency = latency
+        self.quota_errors = quota_errors
+        self.calls = 0
+        self.sheets = {title: FakeWorksheet(title, self) for title in titles}
+
+    def _request(self):
+        """One API call: simulated latency, then maybe a quota error"""
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.quota_errors:
+            self.quota_errors -= 1
+            raise APIError(FakeResponse(429))  # type: ignore[arg-type]
+
+    @property
+    def rows_written(self) -> int:
+        """Data rows in all worksheets (header rows excluded)"""
+        return sum(
+            1
+            for sheet in self.sheets.values()
+            for row in sheet.rows
+            if row and row[0] != HEADERS[0]
+        )
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        self._request()
+        if title not in self.sheets:
+            raise WorksheetNotFound(title)
+        return self.sheets[title]
+
+    def worksheets(self, **kwargs) -> List[FakeWorksheet]:
+        self._request()
+        return list(self.sheets.values())
+
+    def add_worksheet(self, title: str, rows: int = 1000, cols: int = 26, **kwargs):
+        self._request()
+        self.sheets[title] = FakeWorksheet(title, self)
+        return self.sheets[title]
+
+    def _split_range(self, range_name: str) -> Tuple[FakeWorksheet, Optional[str]]:
+        """'Title'!A1:B2 -> (worksheet, "A1:B2"); no cells means the whole sheet"""
+        title, _, cells = range_name.partition("!")
+        title = title[1:-1].replace("''", "'") if title.startswith("'") else title
+        return self.sheets[title], cells or None
+
+    def values_batch_get(self, ranges: List[str], **kwargs) -> Dict[str, Any]:
+        self._request()
+        value_ranges = []
+        for range_name in ranges:
+            sheet, cells = self._split_range(range_name)
+            if cells == "A:A":
+                values = [row[:1] for row in sheet.rows]
+            else:
+                values = [list(row) for row in sheet.rows]
+            value_ranges.append({"range": range_name, "values": values})
+        return {"valueRanges": value_ranges}
+
+    def values_batch_update(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        self._request()
+        for item in body["data"]:
+            sheet, cells = self._split_range(item["range"])
+            sheet._write(cells or "A1", item["values"])
+        return {"totalUpdatedRanges": len(body["data"])}
@@ -0,0 +1,330 @@
+"""
+Load test: N simulated recruiters driving the real Chainlit handlers of app.py.
+
+The OpenAI model is replaced with a pydantic-ai FunctionModel with configurable
+latency, persistence goes to whatever DATABASE_URL points at (run
+``docker-compose up -d postgres`` for a local stand-in), to an SQLite file with
+``--sqlite`` (no server needed) or is disabled with ``--no-persistence``.
+
+Usage:
+    uv run python -m benchmarks.load_test --sessions 50 --turns 5 --latency 0.5
+    uv run python -m benchmarks.load_test --sqlite /tmp/load_test.db
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+# Настройки окружения должны быть выставлены до импорта app.py
+os.environ.setdefault("OPENAI_API_KEY", "sk-load-test")
+os.environ.setdefault("LOGFIRE_IGNORE_NO_CONFIG", "1")
+
+
+@dataclass
+class LoadTestStats:
+    """Raw measurements collected during a run"""
+
+    turn_latencies: List[float] = field(default_factory=list)
+    start_latencies: List[float] = field(default_factory=list)
+    resume_latencies: List[float] = field(default_factory=list)
+    loop_lags: List[float] = field(default_factory=list)
+    errors: int = 0
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile, q in [0, 100]"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/mean/max in milliseconds"""
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": statistics.fmean(values) * 1000,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": max(values) * 1000,
+    }
+
+
+def rss_bytes() -> int:
+    """Current resident set size of the process"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def monitor_event_loop(
+    stats: LoadTestStats, stop: asyncio.Event, interval: float = 0.05
+):
+    """Measure how late the event loop wakes up a sleeping task"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        stats.loop_lags.append(max(0.0, loop.time() - expected))
+
+
+def build_thread(thread_id: str, history: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Build a ThreadDict the way Chainlit passes it to on_chat_resume"""
+    steps = []
+    for index, msg in enumerate(history):
+        is_user = msg["type"] == "user"
+        steps.append(
+            {
+                "id": f"{thread_id}-{index}",
+                "threadId": thread_id,
+                "type": "user_message" if is_user else "assistant_message",
+                "input": msg["content"] if is_user else "",
+                "output": "" if is_user else msg["content"],
+                "createdAt": f"2025-01-01T00:00:{index:02d}.000Z",
+            }
+        )
+    return {"id": thread_id, "name": "load-test", "metadata": {}, "steps": steps}
+
+
+async def run_session(
+    app_module: Any,
+    index: int,
+    args: argparse.Namespace,
+    stats: LoadTestStats,
+):
+    """One simulated recruiter: chat start, N turns, optional resume"""
+    import chainlit as cl
+    from chainlit.context import init_http_context
+
+    await asyncio.sleep(args.ramp_up * index / max(1, args.sessions))
+
+    user = cl.User(identifier=f"loadtest-{index}", metadata={"role": "user"})
+    context = init_http_context(user=user)
+    thread_id = context.session.thread_id
+
+    try:
+        started = time.perf_counter()
+        await app_module.start()
+        stats.start_latencies.append(time.perf_counter() - started)
+
+        for turn in range(args.turns):
+            if args.think_time:
+                await asyncio.sleep(args.think_time)
+
+            message = cl.Message(
+                content=f"Сообщение {turn + 1} от пользователя {index}",
+                author=user.identifier,
+                type="user_message",
+            )
+            if turn == 0 and args.pdf:
+                message.elements = [
+                    cl.File(name=os.path.basename(args.pdf), path=args.pdf)
+                ]
+            await message.send()
+
+            started = time.perf_counter()
+            await app_module.main(message)
+            stats.turn_latencies.append(time.perf_counter() - started)
+
+        if args.resume:
+            history = cl.user_session.get("message_history", [])
+            init_http_context(thread_id=thread_id, user=user)
+            started = time.perf_counter()
+            await app_module.on_chat_resume(build_thread(thread_id, history))
+            stats.resume_latencies.append(time.perf_counter() - started)
+    except Exception as e:
+        stats.errors += 1
+        print(f"session {index} failed: {e!r}", file=sys.stderr)
+
+
+def disable_persistence():
+    """Make chainlit.data.get_data_layer() return None and skip schema creation"""
+    import chainlit.data as cl_data
+
+    from src.database import config as db_config
+
+    cl_data._data_layer = None
+    cl_data._data_layer_initialized = True
+    db_config._schema_initialized = True
+
+
+async def run_load_test(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run all sessions concurrently and build the report"""
+    if args.trace_memory:
+        tracemalloc.start()
+
+    import app as app_module
+    from benchmarks.fake_model import make_fake_model
+    from src.database.write_behind import WRITE_BEHIND_TASK
+    from src.hr_agent.agent import agent
+
+    if args.no_persistence:
+        disable_persistence()
+
+    stats = LoadTestStats()
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_event_loop(stats, stop))
+
+    rss_before = rss_bytes()
+    traced_before = tracemalloc.get_traced_memory()[0] if args.trace_memory else 0
+
+    model = make_fake_model(args.latency, args.jitter, tool_calls=not args.no_tools)
+    started = time.perf_counter()
+    with agent.override(model=model):
+        await asyncio.gather(
+            *(run_session(app_module, i, args, stats) for i in range(args.sessions))
+        )
+    elapsed = time.perf_counter() - started
+
+    rss_after = rss_bytes()
+    traced_after = tracemalloc.get_traced_memory()[0] if args.trace_memory else 0
+
+    stop.set()
+    await monitor
+
+    # Дожидаемся фоновых задач сохранения шагов, запущенных Chainlit
+    pending = [
+        task
+        for task in asyncio.all_tasks()
+        if task is not asyncio.current_task() and task.get_name() != WRITE_BEHIND_TASK
+    ]
+    if pending:
+        await asyncio.wait(pending, timeout=args.drain_timeout)
+    if not args.no_persistence:
+        from src.database.config import dispose_engine
+        from src.database.data_layer import get_shared_data_layer
+
+        await get_shared_data_layer().close()
+        await dispose_engine()
+
+    report: Dict[str, Any] = {
+        "sessions": args.sessions,
+        "turns_per_session": args.turns,
+        "model_latency_s": args.latency,
+        "elapsed_s": elapsed,
+        "errors": stats.errors,
+        "throughput_turns_per_s": len(stats.turn_latencies) / elapsed
+        if elapsed
+        else 0.0,
+        "turn_latency": summarize(stats.turn_latencies),
+        "chat_start_latency": summarize(stats.start_latencies),
+        "resume_latency": summarize(stats.resume_latencies),
+        "event_loop_lag": summarize(stats.loop_lags),
+        "memory_per_session_kb": {
+            "rss": (rss_after - rss_before) / args.sessions / 1024,
+        },
+    }
+    if args.trace_memory:
+        report["memory_per_session_kb"]["python_heap"] = (
+            (traced_after - traced_before) / args.sessions / 1024
+        )
+    return report
+
+
+def print_report(report: Dict[str, Any]):
+    """Human-readable report"""
+    print()
+    print(
+        f"Sessions: {report['sessions']} x {report['turns_per_session']} turns, "
+        f"model latency {report['model_latency_s']}s, errors: {report['errors']}"
+    )
+    print(
+        f"Elapsed: {report['elapsed_s']:.2f}s, "
+        f"throughput: {report['throughput_turns_per_s']:.2f} turns/s"
+    )
+    for key in (
+        "turn_latency",
+        "chat_start_latency",
+        "resume_latency",
+        "event_loop_lag",
+    ):
+        summary = report[key]
+        if not summary.get("count"):
+            continue
+        print(
+            f"{key:<20} n={summary['count']:<6} "
+            f"p50={summary['p50_ms']:8.1f}ms p95={summary['p95_ms']:8.1f}ms "
+            f"p99={summary['p99_ms']:8.1f}ms max={summary['max_ms']:8.1f}ms"
+        )
+    memory = ", ".join(
+        f"{name}={value:.1f}KB"
+        for name, value in report["memory_per_session_kb"].items()
+    )
+    print(f"Memory per session: {memory}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=20, help="concurrent sessions")
+    parser.add_argument("--turns", type=int, default=5, help="messages per session")
+    parser.add_argument(
+        "--latency", type=float, default=0.5, help="fake model latency, seconds"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.1, help="extra random model latency"
+    )
+    parser.add_argument(
+        "--think-time", type=float, default=0.0, help="pause before each message"
+    )
+    parser.add_argument(
+        "--ramp-up", type=float, default=0.0, help="spread session starts, seconds"
+    )
+    parser.add_argument("--pdf", help="PDF attached to the first message")
+    parser.add_argument(
+        "--resume", action="store_true", help="resume every session after its turns"
+    )
+    parser.add_argument(
+        "--no-tools", action="store_true", help="fake model answers without tools"
+    )
+    parser.add_argument(
+        "--no-persistence", action="store_true", help="disable the Chainlit data layer"
+    )
+    parser.add_argument(
+        "--sqlite", metavar="PATH", help="persist to this SQLite file (WAL mode)"
+    )
+    parser.add_argument(
+        "--trace-memory", action="store_true", help="also measure Python heap"
+    )
+    parser.add_argument(
+        "--drain-timeout", type=float, default=30.0, help="wait for pending DB writes"
+    )
+    parser.add_argument("--json-out", help="write the report to a JSON file")
+    parser.add_argument(
+        "--verbose", action="store_true", help="keep logfire console output"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    if not args.verbose:
+        os.environ.setdefault("LOGFIRE_CONSOLE", "false")
+    if args.sqlite:
+        # До импорта src.database: движок создается при импорте config
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{args.sqlite}"
+
+    report = asyncio.run(run_load_test(args))
+    print_report(report)
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""
+Micro-benchmarks for the hot paths with regression baselines.
+
+Every case is timed ``--repeat`` times; the median time per operation is
+compared with the stored baseline and the run fails (exit code 1) if any case
+is slower by more than ``--threshold``.
+
+Usage:
+    uv run python -m benchmarks.micro --save-baseline   # record baselines
+    uv run python -m benchmarks.micro                   # compare with baselines
+    uv run python -m benchmarks.micro --filter history --skip-db
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+os.environ.setdefault("LOGFIRE_IGNORE_NO_CONFIG", "1")
+
+DEFAULT_BASELINE = Path(__file__).with_name("baselines.json")
+
+
+@dataclass
+class Case:
+    """Single benchmark: ``func`` is called ``number`` times per round"""
+
+    name: str
+    func: Callable[[], Union[Any, Awaitable[Any]]]
+    number: int = 100
+
+
+async def measure(case: Case, repeat: int) -> Dict[str, float]:
+    """Time a case and return per-operation statistics in seconds"""
+    is_async = inspect.iscoroutinefunction(case.func)
+
+    async def run_round() -> float:
+        started = time.perf_counter()
+        for _ in range(case.number):
+            if is_async:
+                await case.func()  # type: ignore[misc]
+            else:
+                case.func()
+        return (time.perf_counter() - started) / case.number
+
+    await run_round()  # прогрев
+    rounds = [await run_round() for _ in range(repeat)]
+    return {
+        "median_s": statistics.median(rounds),
+        "min_s": min(rounds),
+        "stdev_s": statistics.stdev(rounds) if len(rounds) > 1 else 0.0,
+    }
+
+
+def pdf_cases(workdir: Path) -> List[Case]:
+    from benchmarks.fixtures import make_pdf
+    from src.shared.pdf_processor import process_pdf_file
+
+    cases = []
+    for pages, number in ((1, 20), (10, 5), (50, 2)):
+        path = make_pdf(workdir / f"company_{pages}.pdf", pages)
+        text, status = process_pdf_file(str(path))
+        if text is None:
+            # Иначе замеряли бы ветку с ошибкой (например, нет кэша tiktoken)
+            print(f"Skipping PDF benchmarks: {status}", file=sys.stderr)
+            return []
+        cases.append(
+            Case(
+                f"pdf.process_pdf_file[pages={pages}]",
+                lambda path=path: process_pdf_file(str(path)),
+                number,
+            )
+        )
+    return cases
+
+
+def history_cases() -> List[Case]:
+    import chainlit as cl
+    from chainlit.context import init_http_context
+
+    from benchmarks.fixtures import make_history, make_profile_context
+    from src.shared.chat_history import ChatHistoryManager
+
+    init_http_context()
+    manager = ChatHistoryManager()
+    profile_context = make_profile_context(pdf_chars=50_000)
+
+    cases = []
+    for length, number in ((10, 500), (100, 200), (1000, 20)):
+        history = make_history(length)
+
+        async def format_history(history=history):
+            cl.user_session.set("message_history", history)
+            await manager.format_history_for_agent(
+                session_id="benchmark",
+                current_message="Нужен Python разработчик",
+                profile_context=profile_context,
+            )
+
+        cases.append(
+            Case(
+                f"history.format_history_for_agent[n={length}]", format_history, number
+            )
+        )
+    return cases
+
+
+def profile_context_cases() -> List[Case]:
+    from benchmarks.fixtures import make_profile_context
+    from src.shared.schemas import ProfileContext
+
+    cases = []
+    for pdf_chars in (0, 100_000):
+        context = make_profile_context(pdf_chars)
+        dumped = context.model_dump()
+        dumped_json = context.model_dump_json()
+        suffix = f"[pdf={pdf_chars}]"
+        cases += [
+            Case(f"profile_context.model_dump{suffix}", context.model_dump, 2000),
+            Case(
+                f"profile_context.model_dump_json{suffix}",
+                context.model_dump_json,
+                2000,
+            ),
+            Case(
+                f"profile_context.from_dict{suffix}",
+                lambda dumped=dumped: ProfileContext(**dumped),
+                2000,
+            ),
+            Case(
+                f"profile_context.round_trip_json{suffix}",
+                lambda dumped_json=dumped_json: ProfileContext.model_validate_json(
+                    dumped_json
+                ).model_dump_json(),
+                1000,
+            ),
+        ]
+    return cases
+
+
+def sheets_cases() -> List[Case]:
+    from benchmarks.fixtures import FakeSpreadsheet, make_profile_context
+    from src.shared.google_sheets import GoogleSheetsManager
+
+    manager = GoogleSheetsManager("benchmark", shard_by="none")
+    spreadsheet = FakeSpreadsheet((manager.worksheet,))
+    manager._spreadsheet = spreadsheet  # type: ignore[assignment]
+    worksheet = spreadsheet.sheets[manager.worksheet]
+    profile = make_profile_context().profile
+
+    def save_profile():
+        manager.save_profile(profile, "bench-id")
+        worksheet.rows.clear()
+
+    return [Case("sheets.save_profile_row", save_profile, 2000)]
+
+
+async def data_layer_cases() -> List[Case]:
+    # Cases time the database round trip, not a put into the write-behind
+    # queue or a read cache hit (timed separately as get_thread[cached])
+    os.environ["DB_WRITE_BEHIND"] = "false"
+    os.environ["DB_CACHE_TTL"] = "0"
+    from src.database.cache import TTLCache, copy_thread, run_with_cache
+    from src.database.data_layer import get_data_layer
+
+    data_layer = await get_data_layer()
+
+    thread_id = str(uuid.uuid4())
+    await data_layer.create_thread(
+        {"id": thread_id, "name": "benchmark", "metadata": {}, "tags": []}  # type: ignore[typeddict-item]
+    )
+    profile_context = {"profile": {}, "current_stage": "position"}
+
+    async def create_thread():
+        await data_layer.create_thread(
+            {"id": str(uuid.uuid4()), "name": "benchmark", "metadata": {}, "tags": []}  # type: ignore[typeddict-item]
+        )
+
+    async def create_step():
+        await data_layer.create_step(
+            {  # type: ignore[typeddict-item]
+                "id": str(uuid.uuid4()),
+                "name": "benchmark",
+                "type": "user_message",
+                "threadId": thread_id,
+                "input": "Нужен Python разработчик",
+                "output": "",
+            }
+        )
+
+    async def get_thread():
+        await data_layer.get_thread(thread_id)
+
+    thread_cache = TTLCache("thread", 200, ttl=3600, copier=copy_thread)
+
+    async def get_thread_cached():
+        await run_with_cache(
+            thread_cache, thread_id, lambda: data_layer._load_thread(thread_id)
+        )
+
+    async def update_thread():
+        await data_layer.update_thread(thread_id, profile_context=profile_context)
+
+    async def update_thread_profile_context():
+        await data_layer.update_thread_profile_context(thread_id, profile_context)
+
+    async def update_thread_name():
+        await data_layer.update_thread_name(thread_id, "benchmark")
+
+    async def get_thread_steps():
+        await data_layer.get_thread_steps(thread_id)
+
+    await create_step()
+    return [
+        Case("data_layer.create_thread", create_thread, 50),
+        Case("data_layer.create_step", create_step, 50),
+        Case("data_layer.get_thread", get_thread, 50),
+        Case("data_layer.get_thread[cached]", get_thread_cached, 2000),
+        Case("data_layer.update_thread", update_thread, 50),
+        Case(
+            "data_layer.update_thread_profile_context",
+            update_thread_profile_context,
+            50,
+        ),
+        Case("data_layer.update_thread_name", update_thread_name, 50),
+        Case("data_layer.get_thread_steps", get_thread_steps, 20),
+    ]
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    threshold: float,
+) -> List[str]:
+    """Print the comparison table and return names of regressed cases"""
+    regressions = []
+    print(f"{'case':<55} {'median':>12} {'baseline':>12} {'change':>9}")
+    for name, stats in results.items():
+        current = stats["median_s"]
+        base = baseline.get(name, {}).get("median_s")
+        if base:
+            change = current / base - 1
+            status = "REGRESSED" if change > threshold else ""
+            if status:
+                regressions.append(name)
+            print(
+                f"{name:<55} {current * 1e6:10.1f}us {base * 1e6:10.1f}us "
+                f"{change:+8.1%} {status}"
+            )
+        else:
+            print(f"{name:<55} {current * 1e6:10.1f}us {'-':>12} {'new':>9}")
+    return regressions
+
+
+async def collect_cases(args: argparse.Namespace, workdir: Path) -> List[Case]:
+    cases = pdf_cases(workdir) + history_cases() + profile_context_cases()
+    cases += sheets_cases()
+    if not args.skip_db:
+        cases += await data_layer_cases()
+    if args.filter:
+        cases = [case for case in cases if args.filter in case.name]
+    return cases
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            cases = await collect_cases(args, Path(tmp))
+            results = {}
+            for case in cases:
+                results[case.name] = await measure(case, args.repeat)
+            return results
+    finally:
+        if not args.skip_db:
+            from src.database.config import dispose_engine
+            from src.database.data_layer import get_shared_data_layer
+
+            # Дописать буфер отложенной записи и закрыть пул до закрытия
+            # event loop (иначе aiosqlite не дает процессу завершиться)
+            try:
+                await get_shared_data_layer().close()
+            finally:
+                await dispose_engine()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Hot path micro-benchmarks")
+    parser.add_argument(
+        "--baseline", type=Path, default=DEFAULT_BASELINE, help="baseline JSON file"
+    )
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="store results as the baseline"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=float(os.getenv("BENCHMARK_THRESHOLD", "0.2")),
+        help="allowed slowdown before failing, 0.2 = 20%%",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="rounds per case")
+    parser.add_argument("--filter", help="run only cases containing this substring")
+    parser.add_argument(
+        "--skip-db", action="store_true", help="skip data layer CRUD cases"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    os.environ.setdefault("LOGFIRE_CONSOLE", "false")
+
+    results = asyncio.run(run(args))
+
+    baseline: Dict[str, Any] = {}
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    regressions = compare(results, baseline.get("results", {}), args.threshold)
+
+    if args.save_baseline:
+        merged = {**baseline.get("results", {}), **results}
+        database = baseline.get("database")
+        if not args.skip_db:
+            from src.database.dialect import backend
+
+            database = backend()
+        args.baseline.write_text(
+            json.dumps(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "database": database,
+                    "results": merged,
+                },
+                indent=2,
+            ),
+            encoding="utf-8",
+        )
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if regressions:
+        print(
+            f"\n{len(regressions)} case(s) regressed by more than "
+            f"{args.threshold:.0%}: {', '.join(regressions)}"
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""
+Connection pool stress test: concurrent DB work at multiples of the pool size.
+
+Each worker repeatedly checks out a connection, holds it for ``--hold``
+seconds (``SELECT pg_sleep``) and returns it. For every multiplier the report
+shows checkout wait percentiles, timeouts and the peak number of connections
+in use / in overflow, i.e. what the pool metrics on /metrics look like when
+the pool saturates.
+
+Usage:
+    uv run python -m benchmarks.pool_stress --pool-size 5 --max-overflow 5
+    uv run python -m benchmarks.pool_stress --multipliers 2,10 --pool-timeout 2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+os.environ.setdefault("LOGFIRE_IGNORE_NO_CONFIG", "1")
+
+from benchmarks.load_test import summarize  # noqa: E402
+
+
+async def sample_pool(pool: Any, peaks: Dict[str, int], stop: asyncio.Event):
+    """Track the highest checked-out and overflow counts during a scenario"""
+    while not stop.is_set():
+        peaks["checked_out"] = max(peaks["checked_out"], pool.checkedout())
+        peaks["overflow"] = max(peaks["overflow"], pool.overflow())
+        await asyncio.sleep(0.005)
+
+
+async def run_scenario(args: argparse.Namespace, multiplier: int) -> Dict[str, Any]:
+    """Run ``multiplier * pool_size`` workers against a fresh engine"""
+    from sqlalchemy import text
+    from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+    from src.database.config import create_engine_from_settings, get_database_url
+
+    engine = create_engine_from_settings(
+        get_database_url(),
+        pool_size=args.pool_size,
+        max_overflow=args.max_overflow,
+        pool_timeout=args.pool_timeout,
+    )
+    engine.pool.pool_name = f"stress-{multiplier}x"  # type: ignore[attr-defined]
+
+    workers = args.pool_size * multiplier
+    waits: List[float] = []
+    queries: List[float] = []
+    timeouts = 0
+    errors = 0
+
+    async def worker():
+        nonlocal timeouts, errors
+        for _ in range(args.queries):
+            started = time.perf_counter()
+            try:
+                async with engine.connect() as conn:
+                    acquired = time.perf_counter()
+                    waits.append(acquired - started)
+                    await conn.execute(
+                        text("SELECT pg_sleep(:hold)"), {"hold": args.hold}
+                    )
+                    queries.append(time.perf_counter() - acquired)
+            except PoolTimeoutError:
+                timeouts += 1
+            except Exception:
+                errors += 1
+
+    peaks = {"checked_out": 0, "overflow": 0}
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_pool(engine.pool, peaks, stop))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await sampler
+    await engine.dispose()
+
+    return {
+        "multiplier": multiplier,
+        "workers": workers,
+        "elapsed_s": elapsed,
+        "throughput_qps": len(queries) / elapsed if elapsed else 0.0,
+        "timeouts": timeouts,
+        "errors": errors,
+        "peak_checked_out": peaks["checked_out"],
+        "peak_overflow": max(0, peaks["overflow"]),
+        "checkout_wait": summarize(waits),
+        "query_time": summarize(queries),
+    }
+
+
+def print_scenario(result: Dict[str, Any]):
+    wait = result["checkout_wait"]
+    print(
+        f"{result['multiplier']:>3}x  workers={result['workers']:<5} "
+        f"qps={result['throughput_qps']:8.1f}  "
+        f"wait p50={wait.get('p50_ms', 0):8.1f}ms p95={wait.get('p95_ms', 0):8.1f}ms "
+        f"max={wait.get('max_ms', 0):8.1f}ms  "
+        f"in_use<={result['peak_checked_out']:<4} overflow<={result['peak_overflow']:<4} "
+        f"timeouts={result['timeouts']} errors={result['errors']}"
+    )
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    results = []
+    for multiplier in args.multipliers:
+        result = await run_scenario(args, multiplier)
+        print_scenario(result)
+        results.append(result)
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    from src.database.config import get_pool_settings
+
+    settings = get_pool_settings()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pool-size", type=int, default=settings["pool_size"])
+    parser.add_argument("--max-overflow", type=int, default=settings["max_overflow"])
+    parser.add_argument("--pool-timeout", type=float, default=settings["pool_timeout"])
+    parser.add_argument(
+        "--multipliers",
+        type=lambda value: [int(item) for item in value.split(",")],
+        default=[2, 10],
+        help="worker counts as multiples of the pool size, e.g. 2,10",
+    )
+    parser.add_argument(
+        "--hold", type=float, default=0.05, help="seconds each query holds a connection"
+    )
+    parser.add_argument("--queries", type=int, default=20, help="queries per worker")
+    parser.add_argument("--json-out", help="write the results to a JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    os.environ.setdefault("LOGFIRE_CONSOLE", "false")
+    print(
+        f"pool_size={args.pool_size} max_overflow={args.max_overflow} "
+        f"pool_timeout={args.pool_timeout}s hold={args.hold}s"
+    )
+
+    results = asyncio.run(run(args))
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Google Sheets export: blocking append_row per profile vs the batching queue.
+
+Uses an in-memory worksheet with simulated API latency and 429 quota errors,
+so no Google credentials are needed. For both modes the report shows how long
+the agent tool call takes, the event-loop lag while N sessions save profiles
+concurrently, the number of API calls and the time until every row is written.
+
+Usage:
+    uv run python -m benchmarks.sheets_export --profiles 100 --latency 0.3
+    uv run python -m benchmarks.sheets_export --quota-errors 3 --json-out sheets.json
+    uv run python -m benchmarks.sheets_export --shard-by rows --shard-rows 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+os.environ.setdefault("LOGFIRE_IGNORE_NO_CONFIG", "1")
+
+from benchmarks.load_test import summarize  # noqa: E402
+
+
+async def measure_lag(lags: List[float], stop: asyncio.Event, interval: float = 0.01):
+    """Event-loop lag: how late a periodic wake-up fires"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - started - interval))
+
+
+async def run_mode(args: argparse.Namespace, mode: str) -> Dict[str, Any]:
+    from benchmarks.fixtures import FakeSpreadsheet, make_profile_context
+    from src.shared.google_sheets import GoogleSheetsManager
+    from src.shared.sheets_queue import SheetsExportQueue
+
+    manager = GoogleSheetsManager(
+        "benchmark", shard_by=args.shard_by, shard_rows=args.shard_rows
+    )
+    spreadsheet = FakeSpreadsheet(
+        (manager.worksheet,), latency=args.latency, quota_errors=args.quota_errors
+    )
+    manager._spreadsheet = spreadsheet  # type: ignore[assignment]
+    queue = SheetsExportQueue(
+        lambda: manager, interval=args.interval, backoff_base=args.backoff_base
+    )
+    profile = make_profile_context().profile
+    call_latency: List[float] = []
+    lags: List[float] = []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(measure_lag(lags, stop))
+
+    async def save(index: int):
+        started = time.perf_counter()
+        if mode == "blocking":
+            # Как раньше: синхронный append_row прямо в async-инструменте
+            manager.save_profile(profile, f"bench-{index}")
+        else:
+            queue.submit(profile, f"bench-{index}")
+        call_latency.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(save(index) for index in range(args.profiles)))
+    await queue.close()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler
+
+    return {
+        "mode": mode,
+        "profiles": args.profiles,
+        "rows_written": spreadsheet.rows_written,
+        "worksheets": len(spreadsheet.sheets),
+        "api_calls": spreadsheet.calls,
+        "all_written_s": elapsed,
+        "tool_call": summarize(call_latency),
+        "loop_lag": summarize(lags),
+    }
+
+
+def print_result(result: Dict[str, Any]):
+    call = result["tool_call"]
+    lag = result["loop_lag"]
+    print(
+        f"{result['mode']:<9} rows={result['rows_written']:<5} "
+        f"sheets={result['worksheets']:<3} "
+        f"api_calls={result['api_calls']:<5} all_written={result['all_written_s']:7.2f}s  "
+        f"tool_call p95={call.get('p95_ms', 0):8.1f}ms  "
+        f"loop_lag max={lag.get('max_ms', 0):8.1f}ms"
+    )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--profiles", type=int, default=50)
+    parser.add_argument(
+        "--latency", type=float, default=0.2, help="simulated seconds per API call"
+    )
+    parser.add_argument(
+        "--quota-errors", type=int, default=0, help="first N appends return 429"
+    )
+    parser.add_argument(
+        "--interval", type=float, default=0.2, help="queue batching window, seconds"
+    )
+    parser.add_argument(
+        "--backoff-base", type=float, default=0.1, help="first retry delay, seconds"
+    )
+    parser.add_argument("--shard-by", choices=["none", "month", "rows"], default="none")
+    parser.add_argument(
+        "--shard-rows", type=int, default=50000, help="rows per worksheet shard"
+    )
+    parser.add_argument("--json-out", help="write the results to a JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    os.environ.setdefault("LOGFIRE_CONSOLE", "false")
+    results = []
+    for mode in ("blocking", "queue"):
+        result = asyncio.run(run_mode(args, mode))
+        print_result(result)
+        results.append(result)
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
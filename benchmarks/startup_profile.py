@@ -0,0 +1,154 @@
+"""
+Cold-start profile: where the time of ``import app`` goes.
+
+Imports the app ``--runs`` times in fresh interpreters with
+``python -X importtime`` and reports the median total import time, the
+import time per top-level package (self time summed over its modules) and
+the slowest project modules (cumulative, including what they pull in).
+With ``--prewarm`` it also times the background prewarm steps
+(src/shared/startup.py) that run after the server starts listening.
+
+Usage:
+    uv run python -m benchmarks.startup_profile
+    uv run python -m benchmarks.startup_profile --runs 5 --top 15 --prewarm
+    uv run python -m benchmarks.startup_profile --json-out startup.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+os.environ.setdefault("LOGFIRE_IGNORE_NO_CONFIG", "1")
+
+# Modules of the repository, reported one by one instead of as a package
+PROJECT_PACKAGES = ("app", "src")
+
+
+def parse_importtime(output: str) -> List[Tuple[str, int, float, float]]:
+    """(module, depth, self s, cumulative s) for every line of -X importtime"""
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules.append(
+            (name.strip(), depth, int(self_us) / 1e6, int(cumulative_us) / 1e6)
+        )
+    return modules
+
+
+def import_app(module: str) -> List[Tuple[str, int, float, float]]:
+    """Import ``module`` in a fresh interpreter and return its import profile"""
+    env = {**os.environ, "LOGFIRE_CONSOLE": os.getenv("LOGFIRE_CONSOLE", "false")}
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [os.getcwd(), env.get("PYTHONPATH")])
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def summarize_run(modules: List[Tuple[str, int, float, float]]) -> Dict[str, Any]:
+    packages: Dict[str, float] = defaultdict(float)
+    project: Dict[str, float] = {}
+    for name, _, self_s, cumulative_s in modules:
+        top = name.split(".")[0]
+        packages[top] += self_s
+        if top in PROJECT_PACKAGES:
+            project[name] = cumulative_s
+    return {
+        "total_s": sum(cum for _, depth, _, cum in modules if depth == 0),
+        "modules": len(modules),
+        "packages": dict(packages),
+        "project": project,
+    }
+
+
+def median_of(runs: List[Dict[str, float]]) -> Dict[str, float]:
+    """Median per key; a key missing from a run counts as 0"""
+    keys = set().union(*runs)
+    return {key: statistics.median(run.get(key, 0.0) for run in runs) for key in keys}
+
+
+async def time_prewarm() -> Dict[str, float]:
+    """Seconds per prewarm step, run in this process after importing the app"""
+    import app  # noqa: F401
+    from src.shared.startup import PREWARM_STEPS
+
+    timings = {}
+    for name, step in PREWARM_STEPS.items():
+        started = time.perf_counter()
+        try:
+            await step()
+        except Exception as e:
+            print(f"prewarm {name} failed: {e}")
+        timings[name] = time.perf_counter() - started
+
+    from src.database.config import dispose_engine
+
+    await dispose_engine()
+    return timings
+
+
+def print_table(title: str, values: Dict[str, float], top: int):
+    print(f"\n{title}")
+    for name, seconds in sorted(values.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {name:<45} {seconds * 1000:9.1f}ms")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--module", default="app", help="module to import")
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters")
+    parser.add_argument("--top", type=int, default=10, help="rows per table")
+    parser.add_argument(
+        "--prewarm", action="store_true", help="also time the prewarm steps"
+    )
+    parser.add_argument("--json-out", help="write the report to a JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    runs = [summarize_run(import_app(args.module)) for _ in range(args.runs)]
+    report: Dict[str, Any] = {
+        "module": args.module,
+        "runs": args.runs,
+        "total_s": statistics.median(run["total_s"] for run in runs),
+        "modules": runs[0]["modules"],
+        "packages": median_of([run["packages"] for run in runs]),
+        "project": median_of([run["project"] for run in runs]),
+    }
+    print(
+        f"import {args.module}: {report['total_s']:.2f}s "
+        f"(median of {args.runs}, {report['modules']} modules)"
+    )
+    print_table("By package (self time)", report["packages"], args.top)
+    print_table("Project modules (cumulative)", report["project"], args.top)
+
+    if args.prewarm:
+        os.environ.setdefault("LOGFIRE_CONSOLE", "false")
+        report["prewarm"] = asyncio.run(time_prewarm())
+        print_table("Prewarm steps", report["prewarm"], args.top)
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Thread/step listing query plans on a seeded database.
+
+Seeds users, threads and (by default) one million steps with
+``generate_series`` directly in PostgreSQL, then runs EXPLAIN ANALYZE for the
+listing queries twice: with the indexes from migration 0001 and with them
+dropped inside a rolled-back transaction. Seeded rows are tagged/named
+``benchmark`` and removed with ``--cleanup``.
+
+Usage:
+    uv run python -m benchmarks.steps_index --steps 1000000 --threads 20000
+    uv run python -m benchmarks.steps_index --skip-seed      # reuse seeded data
+    uv run python -m benchmarks.steps_index --cleanup
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+os.environ.setdefault("LOGFIRE_IGNORE_NO_CONFIG", "1")
+
+BENCH_TAG = "benchmark"
+
+INDEXES = [
+    "ix_steps_thread_created",
+    "ix_threads_user_identifier_created",
+    "ix_threads_user_id_created",
+]
+
+SEED_SQL = [
+    """
+    INSERT INTO users (id, identifier, metadata, "createdAt")
+    SELECT md5('bench-user-' || u)::uuid, 'bench-user-' || u, '{}'::jsonb, now()
+    FROM generate_series(0, :users - 1) AS u
+    ON CONFLICT (identifier) DO NOTHING
+    """,
+    """
+    INSERT INTO threads (id, "createdAt", name, "userId", "userIdentifier", tags, metadata)
+    SELECT md5('bench-thread-' || t)::uuid,
+           now() - (t || ' minutes')::interval,
+           'Benchmark thread ' || t,
+           md5('bench-user-' || (t % :users))::uuid,
+           'bench-user-' || (t % :users),
+           ARRAY[:tag],
+           '{}'::jsonb
+    FROM generate_series(0, :threads - 1) AS t
+    ON CONFLICT (id) DO NOTHING
+    """,
+    """
+    INSERT INTO steps (id, name, type, "threadId", streaming, metadata, input, output, "createdAt")
+    SELECT gen_random_uuid(),
+           :tag,
+           CASE WHEN s % 2 = 0 THEN 'user_message' ELSE 'assistant_message' END,
+           md5('bench-thread-' || (s % :threads))::uuid,
+           false,
+           '{}'::jsonb,
+           'Сообщение ' || s,
+           'Ответ ' || s,
+           now() - ((s / :threads) || ' seconds')::interval
+    FROM generate_series(0, :steps - 1) AS s
+    """,
+]
+
+CLEANUP_SQL = [
+    "DELETE FROM steps WHERE name = :tag",
+    "DELETE FROM threads WHERE :tag = ANY(tags)",
+    "DELETE FROM users WHERE identifier LIKE 'bench-user-%'",
+]
+
+
+def listing_queries() -> List[Tuple[str, str]]:
+    """(name, SQL) of the queries the data layer issues for listing"""
+    return [
+        (
+            "steps_of_thread",
+            "SELECT * FROM steps WHERE \"threadId\" = md5('bench-thread-42')::uuid "
+            'ORDER BY "createdAt"',
+        ),
+        (
+            "threads_of_user_identifier",
+            'SELECT id, name, "createdAt" FROM threads '
+            "WHERE \"userIdentifier\" = 'bench-user-7' "
+            'ORDER BY "createdAt" DESC LIMIT 20',
+        ),
+        (
+            "threads_of_user_id",
+            'SELECT id, name, "createdAt" FROM threads '
+            "WHERE \"userId\" = md5('bench-user-7')::uuid "
+            'ORDER BY "createdAt" DESC LIMIT 20',
+        ),
+    ]
+
+
+def summarize_plan(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """Execution time and the scan nodes used"""
+    scans = []
+
+    def walk(node: Dict[str, Any]):
+        if "Scan" in node["Node Type"]:
+            scans.append(
+                f"{node['Node Type']}"
+                + (f" ({node['Index Name']})" if node.get("Index Name") else "")
+            )
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan["Plan"])
+    return {
+        "execution_ms": plan["Execution Time"],
+        "scans": scans,
+        "shared_buffers": plan["Plan"].get("Shared Hit Blocks", 0)
+        + plan["Plan"].get("Shared Read Blocks", 0),
+    }
+
+
+async def explain_all(conn) -> Dict[str, Dict[str, Any]]:
+    from sqlalchemy import text
+
+    results = {}
+    for name, query in listing_queries():
+        # Прогрев кэша, чтобы сравнивать планы, а не чтение с диска
+        await conn.execute(text(query))
+        raw = await conn.scalar(
+            text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}")
+        )
+        plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]
+        results[name] = summarize_plan(plan)
+    return results
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from sqlalchemy import text
+
+    from src.database.config import engine, init_schema
+
+    await init_schema()
+    params = {
+        "users": args.users,
+        "threads": args.threads,
+        "steps": args.steps,
+        "tag": BENCH_TAG,
+    }
+
+    if args.cleanup:
+        async with engine.begin() as conn:
+            for statement in CLEANUP_SQL:
+                await conn.execute(text(statement), params)
+        print("Benchmark data removed")
+        return {}
+
+    if not args.skip_seed:
+        started = time.perf_counter()
+        async with engine.begin() as conn:
+            for statement in SEED_SQL:
+                await conn.execute(text(statement), params)
+        async with engine.connect() as conn:
+            await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text("ANALYZE users, threads, steps"))
+        print(
+            f"Seeded {args.steps:,} steps in {args.threads:,} threads "
+            f"of {args.users:,} users in {time.perf_counter() - started:.1f}s"
+        )
+
+    report: Dict[str, Any] = {}
+    async with engine.connect() as conn:
+        report["with_indexes"] = await explain_all(conn)
+
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        for index in INDEXES:
+            await conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+        report["without_indexes"] = await explain_all(conn)
+        # Индексы возвращаются откатом транзакции
+        await transaction.rollback()
+
+    await engine.dispose()
+    return report
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"\n{'query':<28} {'indexes':>10} {'no indexes':>12}  plan with indexes")
+    for name, with_indexes in report["with_indexes"].items():
+        without = report["without_indexes"][name]
+        print(
+            f"{name:<28} {with_indexes['execution_ms']:8.2f}ms "
+            f"{without['execution_ms']:10.2f}ms  {', '.join(with_indexes['scans'])}"
+        )
+        print(f"{'':<28} {'':>10} {'':>12}  without: {', '.join(without['scans'])}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--steps", type=int, default=1_000_000)
+    parser.add_argument("--threads", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument(
+        "--skip-seed", action="store_true", help="reuse previously seeded data"
+    )
+    parser.add_argument(
+        "--cleanup", action="store_true", help="delete seeded benchmark data"
+    )
+    parser.add_argument("--json-out", help="write the report to a JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    os.environ.setdefault("LOGFIRE_CONSOLE", "false")
+
+    report = asyncio.run(run(args))
+    if not report:
+        return
+    print_report(report)
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
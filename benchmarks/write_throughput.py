@@ -0,0 +1,179 @@
+"""
+Data layer write throughput: PostgreSQL vs embedded SQLite.
+
+Every backend runs in its own subprocess (the engine is created from
+DATABASE_URL at import time). Concurrent sessions write steps and profile
+context through the data layer exactly like a chat turn does; the report shows
+writes per second and per-write latency percentiles for each backend. The
+write-behind buffer is off unless ``--write-behind`` is given, so every write
+is a committed transaction. Threads are named ``benchmark`` and deleted
+afterwards.
+
+Usage:
+    uv run python -m benchmarks.write_throughput
+    uv run python -m benchmarks.write_throughput --sessions 20 --turns 20 \\
+        --backend sqlite+aiosqlite:////tmp/ai_hr_bench.db --json-out writes.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+
+os.environ.setdefault("LOGFIRE_IGNORE_NO_CONFIG", "1")
+
+from benchmarks.load_test import summarize  # noqa: E402
+
+DEFAULT_SQLITE_URL = "sqlite+aiosqlite:///benchmark_writes.db"
+
+
+async def measure(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run the write workload against DATABASE_URL of this process"""
+    from benchmarks.fixtures import make_profile_context
+    from src.database.config import dispose_engine
+    from src.database.data_layer import get_data_layer
+
+    data_layer = await get_data_layer()
+    profile_context = make_profile_context().model_dump()
+    step_latency: List[float] = []
+    profile_latency: List[float] = []
+    errors = 0
+    thread_ids = [str(uuid4()) for _ in range(args.sessions)]
+
+    async def session(thread_id: str):
+        nonlocal errors
+        await data_layer.update_thread(thread_id, name="benchmark")
+        for turn in range(args.turns):
+            for step_type in ("user_message", "assistant_message"):
+                started = time.perf_counter()
+                try:
+                    await data_layer.create_step(
+                        {
+                            "id": str(uuid4()),
+                            "threadId": thread_id,
+                            "name": "benchmark",
+                            "type": step_type,
+                            "output": f"Сообщение {turn}",
+                            "createdAt": datetime.now(timezone.utc).isoformat(),
+                        }
+                    )
+                    step_latency.append(time.perf_counter() - started)
+                except Exception:
+                    errors += 1
+            started = time.perf_counter()
+            try:
+                await data_layer.update_thread_profile_context(
+                    thread_id, {**profile_context, "turn": turn}
+                )
+                profile_latency.append(time.perf_counter() - started)
+            except Exception:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session(thread_id) for thread_id in thread_ids))
+    await data_layer.close()
+    elapsed = time.perf_counter() - started
+
+    for thread_id in thread_ids:
+        await data_layer.delete_thread(thread_id)
+    backend = data_layer.engine.dialect.name
+    await dispose_engine()
+
+    writes = len(step_latency) + len(profile_latency)
+    return {
+        "backend": backend,
+        "sessions": args.sessions,
+        "turns": args.turns,
+        "elapsed_s": elapsed,
+        "writes_per_s": writes / elapsed if elapsed else 0.0,
+        "errors": errors,
+        "create_step": summarize(step_latency),
+        "profile_context": summarize(profile_latency),
+    }
+
+
+def run_backend(args: argparse.Namespace, url: str) -> Dict[str, Any]:
+    """Run ``measure`` in a subprocess with DATABASE_URL=url"""
+    env = {
+        **os.environ,
+        "DATABASE_URL": url,
+        "DB_WRITE_BEHIND": str(args.write_behind).lower(),
+        "LOGFIRE_CONSOLE": "false",
+    }
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.write_throughput",
+        "--worker",
+        "--sessions",
+        str(args.sessions),
+        "--turns",
+        str(args.turns),
+    ]
+    output = subprocess.run(
+        command, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    # The result is the last line; logging may print before it
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def print_result(result: Dict[str, Any]):
+    step = result["create_step"]
+    profile = result["profile_context"]
+    print(
+        f"{result['backend']:<11} writes/s={result['writes_per_s']:8.1f}  "
+        f"create_step p50={step.get('p50_ms', 0):7.1f}ms "
+        f"p95={step.get('p95_ms', 0):7.1f}ms  "
+        f"profile_context p50={profile.get('p50_ms', 0):7.1f}ms "
+        f"p95={profile.get('p95_ms', 0):7.1f}ms  errors={result['errors']}"
+    )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--backend",
+        action="append",
+        dest="backends",
+        help="database URL to measure, repeatable "
+        f"(default: DATABASE_URL and {DEFAULT_SQLITE_URL})",
+    )
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument(
+        "--write-behind", action="store_true", help="buffer writes (DB_WRITE_BEHIND)"
+    )
+    parser.add_argument("--json-out", help="write the results to a JSON file")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    if args.worker:
+        print(json.dumps(asyncio.run(measure(args))))
+        return
+
+    from src.database.config import get_database_url
+
+    backends = args.backends or [get_database_url(), DEFAULT_SQLITE_URL]
+    print(f"{args.sessions} sessions x {args.turns} turns (2 steps + profile each)")
+    results = []
+    for url in backends:
+        result = run_backend(args, url)
+        print_result(result)
+        results.append(result)
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
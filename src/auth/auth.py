@@ -2,11 +2,24 @@
 Модуль авторизации для AI HR Assistant
 """
 
+import asyncio
+import hashlib
+import hmac
 import os
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import bcrypt
 import chainlit as cl
-from typing import Optional, Dict, Any
-from dataclasses import dataclass
+from typing import Deque, Optional, Dict, Any, Tuple
+from dataclasses import dataclass, field
+
+from ..shared.metrics import observe_phase, registry
+from .store import DatabaseCredentialStore
+
+AUTH_ATTEMPTS = "ai_hr_auth_attempts_total"
 
 
 @dataclass
@@ -14,62 +27,338 @@ class User:
     """Класс пользователя"""
 
     username: str
-    hashed_password: str
+    hashed_password: Optional[bytes]
     role: str
     metadata: Optional[Dict[str, Any]] = None
+    # Пароль из окружения до первого входа: хешируется лениво
+    password: Optional[str] = field(default=None, repr=False)
+
+
+class VerifiedCredentialCache:
+    """
+    Кэш недавно проверенных паролей: username -> HMAC(username, пароль).
+
+    Ключ HMAC случайный и живет только в памяти процесса, поэтому из кэша
+    нельзя восстановить или перебрать пароль быстрее, чем через bcrypt.
+    Записи живут ttl секунд; смена пароля сбрасывает запись пользователя.
+    """
+
+    def __init__(self, ttl: float = 300, max_size: int = 1000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._key = secrets.token_bytes(32)
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def digest(self, username: str, password: str) -> bytes:
+        message = f"{username}\0{password}".encode("utf-8")
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+
+    def is_verified(self, username: str, password: str) -> bool:
+        if self.ttl <= 0:
+            return False
+        digest = self.digest(username, password)
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[1] < time.monotonic():
+                return False
+            return hmac.compare_digest(entry[0], digest)
+
+    def remember(self, username: str, password: str):
+        if self.ttl <= 0:
+            return
+        digest = self.digest(username, password)
+        with self._lock:
+            self._entries[username] = (digest, time.monotonic() + self.ttl)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def forget(self, username: str):
+        with self._lock:
+            self._entries.pop(username, None)
+
+
+class LoginRateLimiter:
+    """
+    Ограничение неудачных входов: после max_failures ошибок за window секунд
+    вход под этим именем отклоняется без проверки bcrypt, пока старые ошибки
+    не выйдут из окна. Успешный вход сбрасывает счетчик.
+    """
+
+    def __init__(
+        self, max_failures: int = 5, window: float = 300, max_users: int = 10_000
+    ):
+        self.max_failures = max_failures
+        self.window = window
+        self.max_users = max_users
+        self._failures: "OrderedDict[str, Deque[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _recent(self, username: str, now: float) -> Optional[Deque[float]]:
+        failures = self._failures.get(username)
+        while failures and failures[0] <= now - self.window:
+            failures.popleft()
+        return failures
+
+    def is_limited(self, username: str, in_flight: int = 0) -> bool:
+        """Лимит исчерпан; in_flight - еще не завершенные проверки этого имени"""
+        if self.max_failures <= 0:
+            return False
+        with self._lock:
+            failures = self._recent(username, time.monotonic())
+            return len(failures or ()) + in_flight >= self.max_failures
+
+    def failure(self, username: str):
+        now = time.monotonic()
+        with self._lock:
+            failures = self._recent(username, now)
+            if failures is None:
+                failures = self._failures[username] = deque()
+            failures.append(now)
+            self._failures.move_to_end(username)
+            # Перебор имен не должен раздувать память
+            while len(self._failures) > self.max_users:
+                self._failures.popitem(last=False)
+
+    def success(self, username: str):
+        with self._lock:
+            self._failures.pop(username, None)
+
+
+class UserCache:
+    """
+    LRU-кэш найденных в хранилище пользователей на ttl секунд. Отсутствие
+    пользователя тоже кэшируется, чтобы перебор имен не ходил в базу.
+    """
+
+    def __init__(self, ttl: float = 60, max_size: int = 10_000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[Optional[User], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username: str) -> Tuple[bool, Optional[User]]:
+        """(есть ли запись, пользователь или None)"""
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[1] < time.monotonic():
+                return False, None
+            self._entries.move_to_end(username)
+            return True, entry[0]
+
+    def set(self, username: str, user: Optional[User]):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[username] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
 
 
 class AuthManager:
     """Менеджер авторизации"""
 
-    def __init__(self):
+    def __init__(self, store=None):
         self._users = {}
         self._load_users_from_env()
+        # Остальные пользователи - в хранилище (по умолчанию таблица users)
+        self.store = store if store is not None else DatabaseCredentialStore()
+        self._user_cache = UserCache(ttl=float(os.getenv("AUTH_USER_CACHE_TTL", "60")))
+        self._hash_lock = threading.Lock()
+        # bcrypt - в ограниченном пуле потоков, не в event loop
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("AUTH_WORKERS", "2")),
+            thread_name_prefix="auth",
+        )
+        # Сверх этого числа ожидающих проверок вход сразу отклоняется
+        self.max_pending = int(os.getenv("AUTH_MAX_PENDING", "32"))
+        self._pending = 0
+        self._user_pending: Dict[str, int] = {}
+        self._inflight: Dict[bytes, "asyncio.Future[bool]"] = {}
+        self.verified = VerifiedCredentialCache(
+            ttl=float(os.getenv("AUTH_CACHE_TTL", "300"))
+        )
+        self.limiter = LoginRateLimiter(
+            max_failures=int(os.getenv("AUTH_MAX_FAILURES", "5")),
+            window=float(os.getenv("AUTH_FAILURE_WINDOW", "300")),
+        )
 
     def _load_users_from_env(self):
         """Загружаем пользователей из переменных окружения"""
         username = os.getenv("CHAINLIT_USER_NAME", "admin")
-        password = os.getenv("CHAINLIT_USER_PASSWORD", "admin")
+        # Готовый bcrypt-хеш, иначе пароль хешируется при первом входе,
+        # а не при импорте
+        password_hash = os.getenv("CHAINLIT_USER_PASSWORD_HASH")
 
-        # Хешируем пароль
-        hashed_password = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
-
-        # Добавляем пользователя
         self._users[username] = User(
             username=username,
-            hashed_password=hashed_password,
+            hashed_password=password_hash.encode("utf-8") if password_hash else None,
             role="admin",
             metadata={"provider": "credentials"},
+            password=None
+            if password_hash
+            else os.getenv("CHAINLIT_USER_PASSWORD", "admin"),
         )
 
+    def _password_hash(self, user: User) -> bytes:
+        """bcrypt-хеш пользователя; пароль из окружения хешируется один раз"""
+        if user.hashed_password is None:
+            with self._hash_lock:
+                if user.hashed_password is None:
+                    if user.password is None:
+                        raise ValueError(f"User {user.username} has no password")
+                    user.hashed_password = bcrypt.hashpw(
+                        user.password.encode("utf-8"), bcrypt.gensalt()
+                    )
+                    user.password = None
+        return user.hashed_password
+
+    async def _lookup(self, username: str) -> Optional[User]:
+        """Пользователь из окружения, кэша или хранилища"""
+        user = self._users.get(username)
+        if user is not None:
+            return user
+        found, user = self._user_cache.get(username)
+        if found:
+            return user
+        credentials = await self.store.get(username)
+        if credentials is not None:
+            password_hash, metadata = credentials
+            user = User(
+                username=username,
+                hashed_password=password_hash,
+                role=metadata.get("role", "user"),
+                metadata=metadata,
+            )
+        self._user_cache.set(username, user)
+        return user
+
     def verify_password(self, plain_password: str, hashed_password: bytes) -> bool:
         """Проверяем пароль"""
         return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password)
 
-    def authenticate(self, username: str, password: str) -> Optional[cl.User]:
-        """Аутентификация пользователя"""
-        user = self._users.get(username)
-        if user and self.verify_password(password, user.hashed_password):
-            return cl.User(
-                identifier=user.username,
-                metadata={"role": user.role, "provider": "credentials"},
-            )
-        return None
+    def check_password(self, user: User, plain_password: str) -> bool:
+        """Синхронная проверка пароля пользователя (bcrypt в текущем потоке)"""
+        return self.verify_password(plain_password, self._password_hash(user))
+
+    def _count(self, result: str):
+        registry.counter(AUTH_ATTEMPTS, "Login attempts by result").inc(result=result)
+
+    def _cl_user(self, user: User) -> cl.User:
+        return cl.User(
+            identifier=user.username,
+            metadata={"role": user.role, "provider": "credentials"},
+        )
+
+    def _timed_verify(self, plain_password: str, user: User) -> bool:
+        started = time.perf_counter()
+        try:
+            return self.check_password(user, plain_password)
+        finally:
+            observe_phase("password_check", time.perf_counter() - started)
 
-    def add_user(self, username: str, password: str, role: str = "user") -> bool:
-        """Добавляем нового пользователя"""
+    async def authenticate_async(
+        self, username: str, password: str
+    ) -> Optional[cl.User]:
+        """
+        Аутентификация без блокировки event loop
+
+        Порядок: кэш проверенных паролей, лимит неудачных попыток, поиск
+        пользователя (окружение, кэш, хранилище), затем bcrypt в пуле
+        потоков (AUTH_WORKERS). Если в очереди пула больше AUTH_MAX_PENDING
+        проверок, вход отклоняется сразу.
+        """
+        # Недавно проверенный пароль проходит мимо лимита: перебор с чужого
+        # адреса не должен блокировать вход самому пользователю
+        cached = self.verified.is_verified(username, password)
+        if not cached and self.limiter.is_limited(username):
+            self._count("rate_limited")
+            return None
+
+        try:
+            user = await self._lookup(username)
+        except Exception:
+            self._count("error")
+            return None
+        if user is None:
+            self.limiter.failure(username)
+            self._count("failed")
+            return None
+
+        if cached:
+            self._count("cached")
+            return self._cl_user(user)
+
+        # Одинаковые попытки (повторный клик, несколько вкладок) ждут одну проверку
+        key = self.verified.digest(username, password)
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            valid = await asyncio.shield(inflight)
+            self._count("shared")
+            return self._cl_user(user) if valid else None
+
+        # Проверки в полете считаются как будущие ошибки: параллельный
+        # перебор упирается в тот же лимит, что и последовательный
+        user_pending = self._user_pending.get(username, 0)
+        if self.limiter.is_limited(username, user_pending):
+            self._count("rate_limited")
+            return None
+        if self._pending >= self.max_pending:
+            self._count("overloaded")
+            return None
+
+        future = asyncio.get_running_loop().run_in_executor(
+            self._executor, self._timed_verify, password, user
+        )
+        self._inflight[key] = future
+        self._pending += 1
+        self._user_pending[username] = user_pending + 1
+        try:
+            valid = await future
+        finally:
+            del self._inflight[key]
+            self._pending -= 1
+            if self._user_pending[username] <= 1:
+                del self._user_pending[username]
+            else:
+                self._user_pending[username] -= 1
+
+        if not valid:
+            self.limiter.failure(username)
+            self._count("failed")
+            return None
+        self.limiter.success(username)
+        self.verified.remember(username, password)
+        self._count("success")
+        return self._cl_user(user)
+
+    async def add_user(self, username: str, password: str, role: str = "user") -> bool:
+        """Добавляем нового пользователя в хранилище"""
         if username in self._users:
             return False
 
-        hashed_password = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
-        self._users[username] = User(
-            username=username, hashed_password=hashed_password, role=role
+        hashed_password = await asyncio.get_running_loop().run_in_executor(
+            self._executor, bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt()
+        )
+        if not await self.store.add(username, hashed_password, role):
+            return False
+        self._user_cache.set(
+            username,
+            User(
+                username=username,
+                hashed_password=hashed_password,
+                role=role,
+                metadata={"role": role, "provider": "credentials"},
+            ),
         )
+        self.verified.forget(username)
         return True
 
-    def get_user(self, username: str) -> Optional[User]:
-        """Получаем пользователя по имени"""
-        return self._users.get(username)
+    async def get_user(self, username: str) -> Optional[User]:
+        """Получаем пользователя по имени (окружение, кэш, хранилище)"""
+        return await self._lookup(username)
 
 
 # Создаем глобальный экземпляр менеджера авторизации
@@ -0,0 +1,61 @@
+"""
+Хранилища учетных записей для AuthManager
+"""
+
+from typing import Any, Dict, Optional, Tuple
+
+# (bcrypt-хеш, metadata пользователя)
+Credentials = Tuple[bytes, Dict[str, Any]]
+
+
+class MemoryCredentialStore:
+    """Учетные записи в памяти процесса (бенчмарки, запуск без базы)"""
+
+    def __init__(self):
+        self._users: Dict[str, Credentials] = {}
+
+    async def get(self, identifier: str) -> Optional[Credentials]:
+        return self._users.get(identifier)
+
+    async def add(
+        self, identifier: str, password_hash: bytes, role: str, overwrite: bool = False
+    ) -> bool:
+        if identifier in self._users and not overwrite:
+            return False
+        self._users[identifier] = (
+            password_hash,
+            {"role": role, "provider": "credentials"},
+        )
+        return True
+
+
+class DatabaseCredentialStore:
+    """
+    Учетные записи в таблице users (колонка passwordHash), поиск по
+    уникальному индексу identifier. Модули базы импортируются при первом
+    обращении, чтобы импорт авторизации не поднимал движок БД.
+    """
+
+    def __init__(self, session_factory=None):
+        self._session_factory = session_factory
+
+    def _sessions(self):
+        if self._session_factory is None:
+            from ..database.config import AsyncSessionLocal
+
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory
+
+    async def get(self, identifier: str) -> Optional[Credentials]:
+        from ..database.credentials import get_credentials
+
+        return await get_credentials(self._sessions(), identifier)
+
+    async def add(
+        self, identifier: str, password_hash: bytes, role: str, overwrite: bool = False
+    ) -> bool:
+        from ..database.credentials import set_credentials
+
+        return await set_credentials(
+            self._sessions(), identifier, password_hash, role, overwrite=overwrite
+        )
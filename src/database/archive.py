@@ -0,0 +1,349 @@
+"""
+Cold-storage archival of inactive threads.
+
+Threads without activity (no new steps) for N days are moved out of the hot
+tables in small batches: steps, elements and feedback are serialized into one
+compressed row of ``threads_archive`` per thread and deleted. The thread row
+itself stays in ``threads`` with its metadata (profile context included) and
+an ``archivedAt`` key, so the thread list, author checks and everything that
+reads ``threads.metadata`` keep working. The data layer rehydrates the child
+rows when a thread is opened.
+
+Each batch is one short transaction; candidate threads are locked with
+``FOR UPDATE SKIP LOCKED``, so several workers can archive at the same time
+and a thread being resumed is simply skipped.
+
+Usage:
+    uv run python -m src.database.archive --days 90
+    uv run python -m src.database.archive --days 90 --dry-run
+    uv run python -m src.database.archive --days 180 --batch-size 50 --vacuum
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+import logfire
+from sqlalchemy import delete, exists, func, select, text, update
+from sqlalchemy import inspect as sa_inspect
+
+from ..shared.metrics import registry
+from .dialect import insert, json_merge
+from .models import GUID, Element, Feedback, Step, Thread, ThreadArchive
+
+# Marker key in the metadata of an archived thread stub
+ARCHIVED_KEY = "archivedAt"
+
+THREAD_ARCHIVE_OPERATIONS = "ai_hr_db_thread_archive_total"
+
+# Child rows stored in the archive payload (payload key -> model)
+CHILD_MODELS: Dict[str, Any] = {
+    "steps": Step,
+    "elements": Element,
+    "feedbacks": Feedback,
+}
+
+# Rows per INSERT on rehydration (asyncpg allows 32767 bind parameters)
+RESTORE_CHUNK = 500
+
+
+def get_archive_settings() -> Dict[str, Any]:
+    """Archival settings from THREAD_ARCHIVE_* environment variables"""
+    return {
+        # 0 disables the background archiver
+        "days": int(os.getenv("THREAD_ARCHIVE_AFTER_DAYS", "0")),
+        "batch_size": int(os.getenv("THREAD_ARCHIVE_BATCH_SIZE", "100")),
+        "interval": float(os.getenv("THREAD_ARCHIVE_INTERVAL", "3600")),
+        "codec": os.getenv("THREAD_ARCHIVE_CODEC", "gzip"),
+    }
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    if codec == "zstd":
+        # Optional dependency: uv add zstandard
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    raise ValueError(f"Unknown archive codec: {codec}")
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "gzip":
+        return gzip.decompress(data)
+    if codec == "zstd":
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unknown archive codec: {codec}")
+
+
+def is_archived(metadata: Optional[Dict]) -> bool:
+    return bool(metadata) and ARCHIVED_KEY in metadata  # type: ignore[operator]
+
+
+def _row(obj) -> Dict[str, Any]:
+    """ORM object as {attribute: value}"""
+    return {
+        attr.key: getattr(obj, attr.key) for attr in sa_inspect(obj).mapper.column_attrs
+    }
+
+
+def _from_row(model, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Archived row back to insert values (UUID columns are stored as strings)"""
+    values = {}
+    for attr in sa_inspect(model).column_attrs:
+        if attr.key not in data:
+            continue
+        value = data[attr.key]
+        if value is not None and isinstance(attr.columns[0].type, GUID):
+            value = UUID(value)
+        values[attr.key] = value
+    return values
+
+
+def _count(operation: str, amount: int = 1):
+    registry.counter(THREAD_ARCHIVE_OPERATIONS, "Threads archived and rehydrated").inc(
+        amount, operation=operation
+    )
+
+
+def _inactive_threads(cutoff: str):
+    """Threads created before the cutoff, without newer steps, not archived yet"""
+    recent_step = exists().where(Step.threadId == Thread.id, Step.createdAt >= cutoff)
+    return select(Thread).where(
+        Thread.createdAt < cutoff,
+        ~recent_step,
+        Thread.metadata_[ARCHIVED_KEY].as_string().is_(None),
+    )
+
+
+def cutoff_for(days: float) -> str:
+    return (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+
+
+async def count_inactive_threads(session_factory, cutoff: str) -> int:
+    async with session_factory() as session:
+        return await session.scalar(
+            select(func.count()).select_from(_inactive_threads(cutoff).subquery())
+        )
+
+
+async def archive_batch(
+    session_factory, cutoff: str, batch_size: int = 100, codec: str = "gzip"
+) -> int:
+    """Archive up to ``batch_size`` inactive threads in one transaction"""
+    async with session_factory() as session:
+        try:
+            threads = (
+                (
+                    await session.execute(
+                        _inactive_threads(cutoff)
+                        .order_by(Thread.createdAt)
+                        .limit(batch_size)
+                        .with_for_update(of=Thread, skip_locked=True)
+                    )
+                )
+                .scalars()
+                .all()
+            )
+            if not threads:
+                await session.rollback()
+                return 0
+
+            ids = [thread.id for thread in threads]
+            children: Dict[UUID, Dict[str, List[Dict]]] = {
+                thread_id: {key: [] for key in CHILD_MODELS} for thread_id in ids
+            }
+            for key, model in CHILD_MODELS.items():
+                rows = await session.execute(
+                    select(model).where(model.threadId.in_(ids))
+                )
+                for row in rows.scalars():
+                    children[row.threadId][key].append(_row(row))
+
+            archived_at = datetime.now(timezone.utc).isoformat()
+            archive_rows = []
+            for thread in threads:
+                payload = {"thread": _row(thread), **children[thread.id]}
+                raw = json.dumps(payload, default=str, ensure_ascii=False).encode()
+                steps = children[thread.id]["steps"]
+                activity = [s["createdAt"] for s in steps if s["createdAt"]]
+                archive_rows.append(
+                    {
+                        "id": thread.id,
+                        "codec": codec,
+                        "payload": compress(raw, codec),
+                        "steps": len(steps),
+                        "rawSize": len(raw),
+                        "lastActivityAt": max(activity, default=thread.createdAt),
+                        "archivedAt": archived_at,
+                    }
+                )
+
+            await session.execute(insert(ThreadArchive).values(archive_rows))
+            for model in (Feedback, Element, Step):
+                await session.execute(delete(model).where(model.threadId.in_(ids)))
+            await session.execute(
+                update(Thread)
+                .where(Thread.id.in_(ids))
+                .values(
+                    metadata_=json_merge(Thread.metadata_, {ARCHIVED_KEY: archived_at})
+                )
+            )
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+
+    _count("archive", len(ids))
+    return len(ids)
+
+
+async def archive_inactive_threads(
+    session_factory,
+    days: float,
+    batch_size: int = 100,
+    codec: str = "gzip",
+    max_batches: Optional[int] = None,
+    pause: float = 0.1,
+) -> int:
+    """Archive threads inactive for ``days`` batch by batch; returns the count"""
+    cutoff = cutoff_for(days)
+    total = 0
+    batches = 0
+    with logfire.span("Archiving threads inactive for {days} days", days=days):
+        while max_batches is None or batches < max_batches:
+            archived = await archive_batch(session_factory, cutoff, batch_size, codec)
+            if not archived:
+                break
+            total += archived
+            batches += 1
+            # Let the chat traffic through between batches
+            await asyncio.sleep(pause)
+    if total:
+        logfire.info("Archived {count} threads", count=total)
+    return total
+
+
+async def rehydrate_thread(session_factory, thread_id: UUID) -> bool:
+    """Move an archived thread back into the hot tables; False if not archived"""
+    async with session_factory() as session:
+        try:
+            metadata = await session.scalar(
+                select(Thread.metadata_).where(Thread.id == thread_id).with_for_update()
+            )
+            if not is_archived(metadata):
+                # Rehydrated concurrently
+                await session.rollback()
+                return False
+
+            archived = (
+                await session.execute(
+                    delete(ThreadArchive)
+                    .where(ThreadArchive.id == thread_id)
+                    .returning(ThreadArchive.codec, ThreadArchive.payload)
+                )
+            ).one_or_none()
+            payload: Dict[str, Any] = (
+                json.loads(decompress(archived.payload, archived.codec))
+                if archived is not None
+                else {"thread": {}}
+            )
+
+            for key, model in CHILD_MODELS.items():
+                rows = [_from_row(model, row) for row in payload.get(key, [])]
+                for start in range(0, len(rows), RESTORE_CHUNK):
+                    await session.execute(
+                        insert(model)
+                        .values(rows[start : start + RESTORE_CHUNK])
+                        .on_conflict_do_nothing(index_elements=["id"])
+                    )
+
+            # The stub kept its metadata: only the marker goes
+            await session.execute(
+                update(Thread)
+                .where(Thread.id == thread_id)
+                .values(
+                    metadata_={k: v for k, v in metadata.items() if k != ARCHIVED_KEY}
+                )
+            )
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+
+    _count("rehydrate")
+    return True
+
+
+async def run_archiver(
+    session_factory,
+    days: float,
+    interval: float = 3600,
+    batch_size: int = 100,
+    codec: str = "gzip",
+):
+    """Background loop: archive inactive threads every ``interval`` seconds"""
+    while True:
+        try:
+            await archive_inactive_threads(session_factory, days, batch_size, codec)
+        except Exception as e:
+            logfire.error("Thread archival failed: {error}", error=str(e))
+        await asyncio.sleep(interval)
+
+
+async def vacuum(engine):
+    """Reclaim space of the hot tables after a large archival run"""
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM (ANALYZE) steps, feedbacks, elements, threads"))
+
+
+async def run(args: argparse.Namespace):
+    from .config import AsyncSessionLocal, engine, init_schema
+
+    await init_schema()
+    if args.dry_run:
+        count = await count_inactive_threads(AsyncSessionLocal, cutoff_for(args.days))
+        print(f"{count} threads inactive for {args.days} days")
+    else:
+        archived = await archive_inactive_threads(
+            AsyncSessionLocal,
+            args.days,
+            batch_size=args.batch_size,
+            codec=args.codec,
+            max_batches=args.max_batches,
+        )
+        print(f"Archived {archived} threads")
+        if args.vacuum:
+            await vacuum(engine)
+    await engine.dispose()
+
+
+def main(argv: Optional[List[str]] = None):
+    settings = get_archive_settings()
+    parser = argparse.ArgumentParser(description="Archive inactive threads")
+    parser.add_argument(
+        "--days", type=float, default=settings["days"] or 90, help="inactivity"
+    )
+    parser.add_argument("--batch-size", type=int, default=settings["batch_size"])
+    parser.add_argument("--max-batches", type=int)
+    parser.add_argument("--codec", choices=["gzip", "zstd"], default=settings["codec"])
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only count inactive threads"
+    )
+    parser.add_argument(
+        "--vacuum", action="store_true", help="VACUUM the hot tables afterwards"
+    )
+    asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
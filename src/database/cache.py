@@ -0,0 +1,290 @@
+import asyncio
+import copy
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import logfire
+
+from ..shared.metrics import registry
+
+CACHE_REQUESTS = "ai_hr_cache_requests_total"
+CACHE_SIZE = "ai_hr_cache_entries"
+
+INVALIDATION_CHANNEL = "ai_hr_cache_invalidation"
+
+# Notifications from this process are ignored by its own listener
+PROCESS_ID = uuid.uuid4().hex
+
+_MISSING = object()
+
+
+def is_cache_notify_enabled() -> bool:
+    return os.getenv("DB_CACHE_NOTIFY", "false").lower() == "true"
+
+
+def copy_thread(thread: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copy of a thread dict down to the levels callers change: the thread, its
+    metadata and the step and element lists and dicts are new objects, while
+    everything below (step metadata, feedback, the PDF text) is shared.
+    Chainlit only replaces thread keys and pops metadata keys, so this is
+    enough, and it costs a dict per step instead of a deep copy of the tree.
+    """
+    copied = dict(thread)
+    if isinstance(copied.get("metadata"), dict):
+        copied["metadata"] = dict(copied["metadata"])
+    for key in ("steps", "elements"):
+        if copied.get(key) is not None:
+            copied[key] = [dict(item) for item in copied[key]]
+    return copied
+
+
+class TTLCache:
+    """
+    LRU cache with per-entry TTL for data layer reads.
+
+    Values are copied with ``copier`` on the way in and out, so callers may
+    change what they get (deep copy by default; the thread cache uses
+    copy_thread). Every invalidation bumps a per-key version: a reader that
+    started before an invalidation does not store its (possibly stale) result.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int,
+        ttl: float,
+        copier: Callable[[Any], Any] = copy.deepcopy,
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.copier = copier
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._versions: Dict[Any, int] = {}
+        self._generation = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.maxsize > 0
+
+    def get(self, key: Any) -> Any:
+        """Cached value or _MISSING"""
+        if not self.enabled:
+            return _MISSING
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        self._count("hit" if entry is not None else "miss")
+        return self.copier(entry[1]) if entry is not None else _MISSING
+
+    def version(self, key: Any) -> Tuple[int, int]:
+        """Token to pass to set() for a read that starts now"""
+        with self._lock:
+            return self._generation, self._versions.get(key, 0)
+
+    def set(self, key: Any, value: Any, version: Optional[Tuple[int, int]] = None):
+        """Store a value unless the key was invalidated since ``version``"""
+        if not self.enabled:
+            return
+        value = self.copier(value)
+        with self._lock:
+            current = (self._generation, self._versions.get(key, 0))
+            if version is not None and version != current:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            size = len(self._entries)
+        registry.gauge(CACHE_SIZE, "Entries in data layer caches").set(
+            size, cache=self.name
+        )
+
+    def invalidate(self, key: Any):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._versions[key] = self._versions.get(key, 0) + 1
+            if len(self._versions) > self.maxsize * 10:
+                # Bound memory: a new generation also fences in-flight readers
+                self._versions.clear()
+                self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self._generation += 1
+
+    def _count(self, result: str):
+        registry.counter(
+            CACHE_REQUESTS, "Data layer cache lookups by result (hit/miss)"
+        ).inc(cache=self.name, result=result)
+
+
+def invalidation_payloads(kind: str, keys: Iterable[str], chunk: int = 100):
+    """NOTIFY payloads (< 8000 bytes each); no keys means clear the whole cache"""
+    keys = list(keys)
+    if not keys:
+        yield json.dumps({"origin": PROCESS_ID, "kind": kind, "keys": []})
+    for start in range(0, len(keys), chunk):
+        yield json.dumps(
+            {"origin": PROCESS_ID, "kind": kind, "keys": keys[start : start + chunk]}
+        )
+
+
+class InvalidationListener:
+    """
+    LISTEN on the invalidation channel with a dedicated asyncpg connection.
+
+    A background task pings the connection every ``check_interval`` seconds
+    and reconnects with exponential backoff (up to ``backoff_max``) when it
+    is closed or stops answering. Notifications sent while it was down are
+    lost, so ``on_reconnect`` is called after every reconnect to drop what
+    may have gone stale.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        on_invalidate: Callable[[str, Optional[str]], None],
+        on_reconnect: Optional[Callable[[], None]] = None,
+        check_interval: float = 30,
+        backoff_max: float = 60,
+    ):
+        self.dsn = dsn
+        self.on_invalidate = on_invalidate
+        self.on_reconnect = on_reconnect
+        self.check_interval = check_interval
+        self.backoff_max = backoff_max
+        self._connection = None
+        self._lost = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def _connect(self):
+        import asyncpg
+
+        connection = await asyncpg.connect(self.dsn)
+        try:
+            await connection.add_listener(INVALIDATION_CHANNEL, self._handle)
+        except Exception:
+            await connection.close()
+            raise
+        connection.add_termination_listener(self._on_terminated)
+        self._connection = connection
+        self._lost.clear()
+
+    def _on_terminated(self, connection):
+        if connection is self._connection:
+            self._lost.set()
+
+    def _close(self):
+        connection, self._connection = self._connection, None
+        if connection is not None and not connection.is_closed():
+            connection.terminate()
+
+    async def start(self):
+        await self._connect()
+        self._task = asyncio.get_running_loop().create_task(
+            self._watch(), name="cache-invalidation-listener"
+        )
+        logfire.info("Cache invalidation listener started")
+
+    async def _alive(self) -> bool:
+        connection = self._connection
+        if connection is None or connection.is_closed():
+            return False
+        try:
+            await asyncio.wait_for(
+                connection.fetchval("SELECT 1"), timeout=self.check_interval
+            )
+            return True
+        except Exception:
+            return False
+
+    async def _watch(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._lost.wait(), self.check_interval)
+            except asyncio.TimeoutError:
+                pass
+            if not self._lost.is_set() and await self._alive():
+                continue
+            logfire.warn("Cache invalidation listener lost its connection")
+            self._close()
+            await self._reconnect()
+
+    async def _reconnect(self):
+        attempt = 0
+        while True:
+            try:
+                await self._connect()
+            except Exception as e:
+                delay = min(self.backoff_max, 2**attempt)
+                attempt += 1
+                logfire.warn(
+                    "Cache invalidation listener reconnect failed, "
+                    "retrying in {delay}s: {error}",
+                    delay=delay,
+                    error=str(e),
+                )
+                await asyncio.sleep(delay)
+                continue
+            logfire.info("Cache invalidation listener reconnected")
+            if self.on_reconnect is not None:
+                self.on_reconnect()
+            return
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            await connection.close()
+
+    def _handle(self, connection, pid, channel, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        if message.get("origin") == PROCESS_ID:
+            return
+        for key in message.get("keys") or [None]:
+            self.on_invalidate(message.get("kind"), key)
+
+
+async def run_with_cache(
+    cache: TTLCache, key: Any, load: Callable[[], Any], cache_none: bool = False
+) -> Any:
+    """Read-through: cached value or ``await load()``, stored for next time"""
+    cached = cache.get(key)
+    if cached is not _MISSING:
+        return cached
+    version = cache.version(key)
+    value = await load()
+    if value is not None or cache_none:
+        cache.set(key, value, version)
+    return value
+
+
+def make_cache(
+    name: str, default_size: int, copier: Callable[[Any], Any] = copy.deepcopy
+) -> TTLCache:
+    """Cache sized from DB_CACHE_MAX_<NAME>S, TTL from DB_CACHE_TTL (0 disables)"""
+    return TTLCache(
+        name,
+        maxsize=int(os.getenv(f"DB_CACHE_MAX_{name.upper()}S", str(default_size))),
+        ttl=float(os.getenv("DB_CACHE_TTL", "30")),
+        copier=copier,
+    )
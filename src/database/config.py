@@ -1,7 +1,16 @@
 import os
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, cast
 from dotenv import load_dotenv
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncConnection,
+    AsyncEngine,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.ext.declarative import declarative_base
 
 # Load environment variables
@@ -24,10 +33,115 @@ def get_database_url():
     return f"postgresql+asyncpg://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
 
 
+def get_replica_urls() -> List[str]:
+    """Read replica URLs (comma-separated DATABASE_REPLICA_URLS)"""
+    urls = os.getenv("DATABASE_REPLICA_URLS", "")
+    return [url.strip() for url in urls.split(",") if url.strip()]
+
+
+def get_pool_settings() -> Dict[str, Any]:
+    """Connection pool settings from environment variables"""
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        # Recycle connections before server/proxy idle timeouts close them
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+    }
+
+
+def _encode_timestamp(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _decode_timestamp(value: str) -> str:
+    """Postgres text output (session in UTC) -> ISO 8601 as Chainlit expects"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        # infinity / -infinity
+        return value
+    return (
+        parsed.astimezone(timezone.utc)
+        .isoformat(timespec="microseconds")
+        .replace("+00:00", "Z")
+    )
+
+
+def _register_timestamp_codecs(dbapi_connection, connection_record):
+    """
+    Exchange timestamptz values as ISO strings.
+
+    Chainlit passes and expects createdAt/start/end as strings (including in
+    the raw SQL of the stock data layer), while asyncpg would require
+    datetime objects for timestamptz parameters.
+    """
+    dbapi_connection.run_async(
+        lambda connection: connection.set_type_codec(
+            "timestamptz",
+            schema="pg_catalog",
+            encoder=_encode_timestamp,
+            decoder=_decode_timestamp,
+            format="text",
+        )
+    )
+
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    """WAL: readers do not block the writer; NORMAL sync is safe with WAL"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(
+        f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))}"
+    )
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def create_engine_from_settings(
+    url: str, pool_name: str = "primary", **overrides: Any
+) -> AsyncEngine:
+    """Create an async engine with an instrumented, configurable pool"""
+    from .pool import InstrumentedQueuePool
+
+    settings = {**get_pool_settings(), **overrides}
+    connect_args: Dict[str, Any] = {}
+    is_asyncpg = make_url(url).get_driver_name() == "asyncpg"
+    if is_asyncpg:
+        # 0 disables prepared statement caching (required behind pgbouncer)
+        connect_args["statement_cache_size"] = int(
+            os.getenv("DB_STATEMENT_CACHE_SIZE", "100")
+        )
+        # Timestamps without offset (datetime.utcnow().isoformat()) are UTC
+        connect_args["server_settings"] = {"timezone": "UTC"}
+
+    async_engine = create_async_engine(
+        url,
+        poolclass=InstrumentedQueuePool,
+        connect_args=connect_args,
+        **settings,
+    )
+    cast(InstrumentedQueuePool, async_engine.pool).pool_name = pool_name
+    if is_asyncpg:
+        event.listen(async_engine.sync_engine, "connect", _register_timestamp_codecs)
+    elif async_engine.dialect.name == "sqlite":
+        event.listen(async_engine.sync_engine, "connect", _configure_sqlite)
+    return async_engine
+
+
 DATABASE_URL = get_database_url()
 
-engine = create_async_engine(DATABASE_URL)
-AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+engine = create_engine_from_settings(DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+# Read replicas by pool name (replica-0, replica-1, ...); reads only, see replicas.py
+replica_engines: Dict[str, AsyncEngine] = {
+    f"replica-{i}": create_engine_from_settings(url, pool_name=f"replica-{i}")
+    for i, url in enumerate(get_replica_urls())
+}
 Base = declarative_base()
 
 
@@ -40,6 +154,97 @@ async def create_tables():
         await conn.run_sync(Base.metadata.create_all)
 
 
+def _add_missing_columns(sync_conn) -> List[str]:
+    """
+    Add model columns missing from existing SQLite tables (create_all only
+    creates missing tables). Returns the added columns as ``table.column``.
+    """
+    added = []
+    for table in Base.metadata.sorted_tables:
+        existing = {
+            row[1]
+            for row in sync_conn.exec_driver_sql(f'PRAGMA table_info("{table.name}")')
+        }
+        if not existing:
+            continue
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" '
+            ddl += column.type.compile(dialect=sync_conn.dialect)
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+            if not column.nullable and column.server_default is not None:
+                ddl += " NOT NULL"
+            sync_conn.exec_driver_sql(ddl)
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+
+_schema_lock = asyncio.Lock()
+_schema_initialized = False
+
+
+async def init_schema() -> bool:
+    """
+    Bootstrap the schema exactly once per process.
+
+    Returns True if this call created the schema, False if it was already done.
+    """
+    global _schema_initialized
+    if _schema_initialized:
+        return False
+
+    async with _schema_lock:
+        if _schema_initialized:
+            return False
+        await create_tables()
+        if engine.dialect.name == "postgresql":
+            from .migrations import run_migrations
+
+            await run_migrations(engine)
+        else:
+            # SQLite has no migrations: columns added to the models since the
+            # database was created are added in place
+            async with engine.begin() as conn:
+                await conn.run_sync(_add_missing_columns)
+        _schema_initialized = True
+        return True
+
+
+async def prewarm_pool(connections: Optional[int] = None) -> int:
+    """
+    Open ``connections`` (default DB_POOL_SIZE) pooled connections ahead of
+    the first requests. Returns the number opened; failures are not raised.
+    """
+    count = get_pool_settings()["pool_size"] if connections is None else connections
+
+    async def checkout() -> AsyncConnection:
+        connection = await engine.connect()
+        try:
+            await connection.exec_driver_sql("SELECT 1")
+        except Exception:
+            await connection.close()
+            raise
+        return connection
+
+    results = await asyncio.gather(
+        *(checkout() for _ in range(count)), return_exceptions=True
+    )
+    opened = [result for result in results if isinstance(result, AsyncConnection)]
+    # Closing returns the connections to the pool
+    for connection in opened:
+        await connection.close()
+    return len(opened)
+
+
+async def dispose_engine():
+    """Close all pooled connections (application shutdown)"""
+    await engine.dispose()
+    for replica_engine in replica_engines.values():
+        await replica_engine.dispose()
+
+
 async def get_async_db():
     """Get async database session"""
     async with AsyncSessionLocal() as session:
@@ -0,0 +1,133 @@
+"""
+Password credentials of Chainlit users.
+
+The bcrypt hash lives in ``users."passwordHash"`` next to the Chainlit user
+row and is looked up through the unique index on ``identifier``. The column
+is deferred, so the data layer's own user reads never load it.
+``AuthManager`` reads it through ``DatabaseCredentialStore`` (src/auth/store.py).
+
+Usage:
+    uv run python -m src.database.credentials --set-password alice --role user
+    uv run python -m src.database.credentials --list
+"""
+
+import argparse
+import asyncio
+import getpass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from sqlalchemy import select
+
+from .dialect import insert, json_merge
+from .models import User
+
+
+async def get_credentials(
+    session_factory, identifier: str
+) -> Optional[Tuple[bytes, Dict[str, Any]]]:
+    """(password hash, metadata) of a user, None if the user has no password"""
+    async with session_factory() as session:
+        row = (
+            await session.execute(
+                select(User.passwordHash, User.metadata_).where(
+                    User.identifier == identifier
+                )
+            )
+        ).first()
+    if row is None or not row.passwordHash:
+        return None
+    return row.passwordHash.encode("utf-8"), row.metadata_ or {}
+
+
+async def set_credentials(
+    session_factory,
+    identifier: str,
+    password_hash: bytes,
+    role: str = "user",
+    overwrite: bool = True,
+) -> bool:
+    """
+    Store the password hash and role of a user, creating the user row if
+    needed. With ``overwrite=False`` an existing password is kept and False
+    is returned.
+    """
+    metadata = {"role": role, "provider": "credentials"}
+    statement = (
+        insert(User)
+        .values(
+            id=uuid4(),
+            identifier=identifier,
+            metadata_=metadata,
+            createdAt=datetime.utcnow().isoformat(),
+            passwordHash=password_hash.decode("utf-8"),
+        )
+        .on_conflict_do_update(
+            index_elements=[User.identifier],
+            set_={
+                "passwordHash": password_hash.decode("utf-8"),
+                "metadata": json_merge(User.metadata_, metadata),
+            },
+            where=None if overwrite else User.passwordHash.is_(None),
+        )
+    )
+    async with session_factory() as session:
+        try:
+            result = await session.execute(statement)
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+    return result.rowcount > 0
+
+
+async def list_credentials(session_factory) -> List[Dict[str, Any]]:
+    """Users with a password: identifier and role"""
+    async with session_factory() as session:
+        rows = await session.execute(
+            select(User.identifier, User.metadata_)
+            .where(User.passwordHash.is_not(None))
+            .order_by(User.identifier)
+        )
+        return [
+            {"identifier": identifier, "role": (metadata or {}).get("role")}
+            for identifier, metadata in rows.all()
+        ]
+
+
+async def run(args: argparse.Namespace):
+    import bcrypt
+
+    from .config import AsyncSessionLocal, dispose_engine, init_schema
+
+    await init_schema()
+    if args.set_password:
+        password = getpass.getpass(f"Password for {args.set_password}: ")
+        password_hash = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+        await set_credentials(
+            AsyncSessionLocal, args.set_password, password_hash, args.role
+        )
+        print(f"Password set for {args.set_password} ({args.role})")
+    if args.list or not args.set_password:
+        for entry in await list_credentials(AsyncSessionLocal):
+            print(f"{entry['identifier']:<30} {entry['role']}")
+    await dispose_engine()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Password logins stored in the database"
+    )
+    parser.add_argument(
+        "--set-password", metavar="USER", help="create or update a login"
+    )
+    parser.add_argument(
+        "--role", default="user", help="role of the login (default: user)"
+    )
+    parser.add_argument("--list", action="store_true", help="list logins (default)")
+    asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,476 @@
+import asyncio
+import base64
+import json
 from datetime import datetime
-from typing import Optional, List, Dict
+from typing import Any, AsyncIterator, Optional, List, Dict, Tuple, cast
 from uuid import UUID, uuid4
 from dotenv import load_dotenv
 
 from chainlit.data.sql_alchemy import SQLAlchemyDataLayer
 from chainlit.data.base import ThreadDict
-from chainlit.user import UserDict
+from chainlit.element import ElementDict
+from chainlit.types import PageInfo, PaginatedResponse, Pagination, ThreadFilter
+from chainlit.user import PersistedUser
 from chainlit.step import StepDict
-from sqlalchemy import select
+from sqlalchemy import delete, exists, func, literal, select, text, tuple_, update
+from sqlalchemy.engine import make_url
 
-from .config import AsyncSessionLocal, create_tables, get_database_url
-from .models import User, Thread, Step
+from .archive import get_archive_settings, is_archived, rehydrate_thread, run_archiver
+from .cache import (
+    INVALIDATION_CHANNEL,
+    InvalidationListener,
+    copy_thread,
+    invalidation_payloads,
+    is_cache_notify_enabled,
+    make_cache,
+    run_with_cache,
+)
+from .config import (
+    AsyncSessionLocal,
+    engine,
+    init_schema,
+    get_database_url,
+    replica_engines,
+)
+from .models import (
+    User,
+    Thread,
+    Step,
+    Element,
+    Feedback,
+    TokenUsage,
+    ThreadArchive,
+    Timestamp,
+    GUID,
+)
+from .dialect import insert, is_postgres, json_merge, utc_now
+from .outbox import (
+    OUTBOX_TASK,
+    OutboxDispatcher,
+    export_status,
+    make_dispatcher,
+    outbox_insert,
+    outbox_supersede,
+)
+from .replicas import ReadRouter
+from .sheets_reconcile import RECONCILE_TASK, get_reconcile_interval, make_reconciler
+from .write_behind import WriteBehindBuffer, is_write_behind_enabled
 
 # Load environment variables
 load_dotenv()
 
+# StepDict keys stored in the steps table (key -> ORM attribute)
+STEP_COLUMNS = {
+    "name": "name",
+    "type": "type",
+    "streaming": "streaming",
+    "waitForAnswer": "waitForAnswer",
+    "isError": "isError",
+    "metadata": "metadata_",
+    "tags": "tags",
+    "input": "input",
+    "output": "output",
+    "createdAt": "createdAt",
+    "command": "command",
+    "start": "start",
+    "end": "end",
+    "generation": "generation",
+    "showInput": "showInput",
+    "language": "language",
+    "indent": "indent",
+    "defaultOpen": "defaultOpen",
+}
+
+
+def _step_values(step_dict: StepDict) -> Dict[str, Any]:
+    """Column values for a step row from a Chainlit StepDict"""
+    values: Dict[str, Any] = {
+        "id": UUID(step_dict["id"]) if step_dict.get("id") else uuid4(),
+        "threadId": UUID(step_dict["threadId"]),
+        "parentId": UUID(step_dict["parentId"]) if step_dict.get("parentId") else None,
+        "streaming": step_dict.get("streaming", False),
+        "metadata_": step_dict.get("metadata", {}),
+        "tags": step_dict.get("tags", []),
+        "createdAt": step_dict.get("createdAt") or datetime.utcnow().isoformat(),
+    }
+    for key, attribute in STEP_COLUMNS.items():
+        if attribute not in values:
+            values[attribute] = cast(Dict[str, Any], step_dict).get(key)
+    # Timestamp columns: Chainlit may send "" for a step that has not ended
+    values["start"] = values["start"] or None
+    values["end"] = values["end"] or None
+    return values
+
+
+def _saved_step(step_dict: StepDict, values: Dict[str, Any]) -> StepDict:
+    """StepDict as stored, without reading the row back"""
+    saved = dict(step_dict)
+    saved.update(
+        {
+            "id": str(values["id"]),
+            "createdAt": values["createdAt"],
+            "metadata": values["metadata_"] or {},
+            "tags": values["tags"] or [],
+        }
+    )
+    return cast(StepDict, saved)
+
+
+def _step_to_dict(step: Step, feedback: Optional[Feedback] = None) -> StepDict:
+    """Chainlit StepDict from a step row"""
+    step_dict = {
+        key: getattr(step, attribute) for key, attribute in STEP_COLUMNS.items()
+    }
+    step_dict.update(
+        {
+            "id": str(step.id),
+            "threadId": str(step.threadId),
+            "parentId": str(step.parentId) if step.parentId else None,
+            "metadata": step.metadata_ or {},
+            "tags": step.tags or [],
+        }
+    )
+    if feedback is not None:
+        step_dict["feedback"] = {
+            "id": str(feedback.id),
+            "forId": str(feedback.forId),
+            "value": feedback.value,
+            "comment": feedback.comment,
+        }
+    return cast(StepDict, step_dict)
+
+
+def _element_to_dict(element: Element) -> ElementDict:
+    """Chainlit ElementDict from an element row"""
+    element_dict: Dict[str, Any] = {
+        "id": str(element.id),
+        "threadId": str(element.threadId) if element.threadId else None,
+        "type": element.type,
+        "chainlitKey": element.chainlitKey,
+        "url": element.url,
+        "objectKey": element.objectKey,
+        "name": element.name,
+        "display": element.display,
+        "size": element.size,
+        "language": element.language,
+        "page": element.page,
+        "props": element.props or {},
+        "forId": str(element.forId) if element.forId else None,
+        "mime": element.mime,
+    }
+    return cast(ElementDict, element_dict)
+
+
+def _thread_to_dict(thread: Thread) -> ThreadDict:
+    """Chainlit ThreadDict (without steps and elements) from a thread row"""
+    return {
+        "id": str(thread.id),
+        "createdAt": thread.createdAt,
+        "name": thread.name,
+        "userId": str(thread.userId) if thread.userId else None,
+        "userIdentifier": thread.userIdentifier,
+        "tags": thread.tags or [],
+        "metadata": thread.metadata_ or {},
+        "steps": [],
+        "elements": [],
+    }
+
+
+def _missing_threads_insert(step_rows: List[Dict[str, Any]]):
+    """Insert empty thread rows for steps whose thread does not exist yet"""
+    threads: Dict[UUID, str] = {}
+    for row in step_rows:
+        threads.setdefault(row["threadId"], row["createdAt"])
+    return (
+        insert(Thread)
+        .values(
+            [
+                {"id": thread_id, "createdAt": created_at, "tags": [], "metadata_": {}}
+                for thread_id, created_at in threads.items()
+            ]
+        )
+        .on_conflict_do_nothing(index_elements=[Thread.id])
+    )
+
+
+def _steps_upsert(step_rows: List[Dict[str, Any]]):
+    """Multi-row INSERT ... ON CONFLICT DO UPDATE ... RETURNING id for steps"""
+    statement = insert(Step).values(step_rows)
+    return statement.on_conflict_do_update(
+        index_elements=[Step.id],
+        set_={
+            column.name: statement.excluded[column.name]
+            for attribute, column in Step.__mapper__.columns.items()
+            if attribute not in ("id", "createdAt")
+        },
+    ).returning(Step.id)
+
+
+def _thread_upsert(
+    thread_id: UUID,
+    name: Optional[str] = None,
+    user_id: Optional[str] = None,
+    metadata: Optional[Dict] = None,
+    tags: Optional[List[str]] = None,
+    profile_context: Optional[Dict] = None,
+):
+    """
+    Single INSERT ... ON CONFLICT DO UPDATE for a thread.
+
+    Only the given fields are written. Metadata keys and profile_context are
+    merged server-side (``metadata || :metadata``, like the stock data layer
+    merges it; ``json_set`` on SQLite), so the existing JSON document is never
+    read back into Python.
+    """
+    incoming = {k: v for k, v in (metadata or {}).items() if v is not None}
+    user_identifier = (
+        select(User.identifier).where(User.id == UUID(user_id)).scalar_subquery()
+        if user_id
+        else None
+    )
+
+    new_metadata = dict(incoming)
+    if profile_context is not None:
+        new_metadata["profile_context"] = profile_context
+    statement = insert(Thread).values(
+        id=thread_id,
+        createdAt=datetime.utcnow().isoformat(),
+        name=name if name is not None else incoming.get("name"),
+        userId=UUID(user_id) if user_id else None,
+        userIdentifier=user_identifier,
+        tags=tags if tags is not None else [],
+        metadata_=new_metadata,
+        updatedAt=utc_now(),
+    )
+
+    set_: Dict[Any, Any] = {}
+    if name is not None:
+        set_[Thread.name] = name
+    if user_id:
+        set_[Thread.userId] = UUID(user_id)
+        set_[Thread.userIdentifier] = user_identifier
+    if tags is not None:
+        set_[Thread.tags] = tags
+
+    if new_metadata:
+        set_[Thread.metadata_] = json_merge(Thread.metadata_, new_metadata)
+
+    if not set_:
+        return statement.on_conflict_do_nothing(index_elements=[Thread.id])
+    set_[Thread.updatedAt] = utc_now()
+    return statement.on_conflict_do_update(index_elements=[Thread.id], set_=set_)
+
+
+def encode_cursor(created_at: str, row_id: Any) -> str:
+    """Opaque keyset cursor for the (createdAt, id) of the last row of a page"""
+    raw = json.dumps([created_at, str(row_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, UUID]:
+    """(createdAt, id) from a cursor; raises ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return created_at, UUID(row_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def _keyset_after(created_at_column, id_column, cursor: str, descending: bool):
+    """WHERE (createdAt, id) > / < cursor for ascending / descending order"""
+    created_at, row_id = decode_cursor(cursor)
+    key = tuple_(created_at_column, id_column)
+    bound = tuple_(literal(created_at, Timestamp()), literal(row_id, GUID()))
+    return key < bound if descending else key > bound
+
+
+def _page(rows: List[Any], limit: int, to_dict) -> PaginatedResponse:
+    """PaginatedResponse from limit + 1 fetched rows"""
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    return PaginatedResponse(
+        data=[to_dict(row) for row in rows],
+        pageInfo=PageInfo(
+            hasNextPage=has_next,
+            startCursor=encode_cursor(rows[0].createdAt, rows[0].id) if rows else None,
+            endCursor=encode_cursor(rows[-1].createdAt, rows[-1].id) if rows else None,
+        ),
+    )
+
+
+def _user_to_persisted(user: User) -> PersistedUser:
+    return PersistedUser(
+        id=str(user.id),
+        identifier=user.identifier,
+        metadata=user.metadata_ or {},
+        createdAt=user.createdAt,
+    )
+
 
 class CustomSQLAlchemyDataLayer(SQLAlchemyDataLayer):
     """Custom Chainlit data layer with profile context integration"""
 
-    def __init__(self, conninfo: str):
-        super().__init__(conninfo=conninfo)
+    def __init__(self, conninfo: str, user_thread_limit: Optional[int] = 1000):
+        # SQLAlchemyDataLayer.__init__ is not called on purpose: it would create
+        # a second engine with its own pool. Both the inherited Chainlit queries
+        # and our ORM code use the process-wide engine from config.
+        self._conninfo = conninfo
+        self.user_thread_limit = user_thread_limit
+        self.show_logger = False
+        self.storage_provider = None
+        self.engine = engine
+        self.async_session = AsyncSessionLocal
         self.session_factory = AsyncSessionLocal
+        # Steps and profile context go through the write-behind buffer (DB_WRITE_BEHIND)
+        self.write_buffer = (
+            WriteBehindBuffer(AsyncSessionLocal, on_commit=self._invalidate_threads)
+            if is_write_behind_enabled()
+            else None
+        )
+        # Read-through caches for get_user (every login) and get_thread (resume)
+        self.user_cache = make_cache("user", 1000)
+        self.thread_cache = make_cache("thread", 200, copier=copy_thread)
+        # LISTEN/NOTIFY is PostgreSQL-only
+        self.notify_invalidations = is_cache_notify_enabled() and is_postgres()
+        self._invalidation_listener: Optional[InvalidationListener] = None
+        self._archiver: Optional[asyncio.Task] = None
+        self.outbox: Optional[OutboxDispatcher] = None
+        self._outbox_task: Optional[asyncio.Task] = None
+        self._reconciler: Optional[asyncio.Task] = None
+        # Read-only queries go to replicas when DATABASE_REPLICA_URLS is set
+        self.reads = ReadRouter(AsyncSessionLocal, replica_engines)
+
+    async def flush_writes(self, thread_id: Optional[str] = None):
+        """Wait for buffered writes (of a thread) so that reads see them"""
+        if self.write_buffer is not None and self.write_buffer.pending(thread_id):
+            await self.write_buffer.flush(thread_id)
+
+    async def close(self):
+        """
+        Flush buffered writes on application shutdown; raises WriteBehindError
+        if they could not be committed
+        """
+        try:
+            if self.write_buffer is not None:
+                await self.write_buffer.close()
+        finally:
+            if self._invalidation_listener is not None:
+                await self._invalidation_listener.stop()
+                self._invalidation_listener = None
+            if self._archiver is not None:
+                self._archiver.cancel()
+                self._archiver = None
+            if self._outbox_task is not None:
+                self._outbox_task.cancel()
+                self._outbox_task = None
+            if self._reconciler is not None:
+                self._reconciler.cancel()
+                self._reconciler = None
+
+    def start_archiver(self):
+        """Archive inactive threads in the background (THREAD_ARCHIVE_AFTER_DAYS)"""
+        settings = get_archive_settings()
+        if settings["days"] <= 0 or self._archiver is not None:
+            return
+        self._archiver = asyncio.get_running_loop().create_task(
+            run_archiver(
+                self.session_factory,
+                settings["days"],
+                interval=settings["interval"],
+                batch_size=settings["batch_size"],
+                codec=settings["codec"],
+            ),
+            name="db-thread-archiver",
+        )
+
+    def start_outbox_dispatcher(self):
+        """Deliver queued profile exports in the background (PROFILE_EXPORT_SINKS)"""
+        if self._outbox_task is not None:
+            return
+        self.outbox = make_dispatcher(self.session_factory)
+        if self.outbox is not None:
+            self._outbox_task = asyncio.get_running_loop().create_task(
+                self.outbox.run(), name=OUTBOX_TASK
+            )
 
-    async def create_user(self, user) -> Optional[UserDict]:
-        """Create a new user"""
+    def start_sheets_reconciler(self):
+        """Reconcile the profile sheet with the database (SHEETS_RECONCILE_INTERVAL)"""
+        if self._reconciler is not None:
+            return
+        reconciler = make_reconciler(self.session_factory, get_reconcile_interval())
+        if reconciler is not None:
+            self._reconciler = asyncio.get_running_loop().create_task(
+                reconciler, name=RECONCILE_TASK
+            )
+
+    async def _rehydrate(self, thread_id: UUID):
+        """Bring an archived thread back into the hot tables"""
+        if await rehydrate_thread(self.session_factory, thread_id):
+            await self._invalidate_threads([thread_id])
+        else:
+            # Rehydrated by someone else: replicas may not have it yet
+            self.reads.mark_written(thread_id)
+
+    async def start_invalidation_listener(self):
+        """LISTEN for cache invalidations from other workers (DB_CACHE_NOTIFY)"""
+        if not self.notify_invalidations or self._invalidation_listener is not None:
+            return
+        dsn = make_url(self._conninfo).set(drivername="postgresql")
+        self._invalidation_listener = InvalidationListener(
+            dsn.render_as_string(hide_password=False),
+            self._on_remote_invalidation,
+            on_reconnect=self._clear_caches,
+        )
+        await self._invalidation_listener.start()
+
+    def _clear_caches(self):
+        """Invalidations from other workers may have been missed: drop everything"""
+        self.user_cache.clear()
+        self.thread_cache.clear()
+
+    def _on_remote_invalidation(self, kind: str, key: Optional[str]):
+        cache = self.user_cache if kind == "user" else self.thread_cache
+        if key is None:
+            cache.clear()
+        else:
+            cache.invalidate(key)
+
+    def _mark_user_written(self, *keys: Optional[Any]):
+        """
+        Read the thread listings of a user from the primary for the
+        read-your-writes window; listings are routed by user id or identifier
+        """
+        for key in keys:
+            if key:
+                self.reads.mark_written(key)
+
+    async def _invalidate_threads(self, thread_ids, notify: bool = True):
+        """
+        Drop cached threads here and, with DB_CACHE_NOTIFY, in other workers.
+        An empty ``thread_ids`` clears the whole thread cache.
+        """
+        keys = [str(thread_id) for thread_id in thread_ids]
+        for key in keys:
+            self.thread_cache.invalidate(key)
+            self.reads.mark_written(key)
+        if not keys:
+            self.thread_cache.clear()
+        if notify:
+            await self._notify_invalidation("thread", keys)
+
+    async def _notify_invalidation(self, kind: str, keys: List[str]):
+        if not self.notify_invalidations:
+            return
+        async with self.engine.begin() as conn:
+            for payload in invalidation_payloads(kind, keys):
+                await conn.execute(
+                    text("SELECT pg_notify(:channel, :payload)"),
+                    {"channel": INVALIDATION_CHANNEL, "payload": payload},
+                )
+
+    async def create_user(self, user) -> Optional[PersistedUser]:
+        """Create a user or update metadata of an existing one"""
         async with self.session_factory() as session:
             try:
                 # Handle both dict and User object
@@ -41,45 +487,52 @@ class CustomSQLAlchemyDataLayer(SQLAlchemyDataLayer):
                     metadata = user.get("metadata", {})
                     created_at = user.get("createdAt")
 
-                db_user = User(
-                    id=UUID(user_id) if user_id else uuid4(),
-                    identifier=identifier,
-                    metadata_=metadata,
-                    createdAt=created_at or datetime.utcnow().isoformat(),
+                # Chainlit calls create_user on every login: upsert by identifier
+                statement = (
+                    insert(User)
+                    .values(
+                        id=UUID(user_id) if user_id else uuid4(),
+                        identifier=identifier,
+                        metadata_=metadata or {},
+                        createdAt=created_at or datetime.utcnow().isoformat(),
+                    )
+                    .on_conflict_do_update(
+                        index_elements=[User.identifier],
+                        set_={"metadata": metadata or {}},
+                    )
+                    .returning(User)
                 )
-                session.add(db_user)
+                db_user = (await session.execute(statement)).scalar_one()
                 await session.commit()
-                await session.refresh(db_user)
 
-                return {
-                    "id": str(db_user.id),
-                    "identifier": db_user.identifier,
-                    "metadata": db_user.metadata_,
-                    "createdAt": db_user.createdAt,
-                }
+                persisted = _user_to_persisted(db_user)
+                self.reads.mark_written(identifier)
+                self.user_cache.invalidate(identifier)
+                self.user_cache.set(identifier, persisted)
+                await self._notify_invalidation("user", [identifier])
+                return persisted
             except Exception:
                 await session.rollback()
                 raise
 
-    async def get_user(self, identifier: str) -> Optional[UserDict]:
-        """Get user by identifier"""
-        async with self.session_factory() as session:
-            try:
-                result = await session.execute(
-                    select(User).filter(User.identifier == identifier)
-                )
-                user = result.scalar_one_or_none()
-
-                if user:
-                    return {
-                        "id": str(user.id),
-                        "identifier": user.identifier,
-                        "metadata": user.metadata_,
-                        "createdAt": user.createdAt,
-                    }
-                return None
-            except Exception:
-                return None
+    async def get_user(self, identifier: str) -> Optional[PersistedUser]:
+        """Get user by identifier (cached)"""
+        return await run_with_cache(
+            self.user_cache, identifier, lambda: self._load_user(identifier)
+        )
+
+    async def _load_user(self, identifier: str) -> Optional[PersistedUser]:
+        async def read(session) -> Optional[PersistedUser]:
+            result = await session.execute(
+                select(User).filter(User.identifier == identifier)
+            )
+            user = result.scalar_one_or_none()
+            return _user_to_persisted(user) if user else None
+
+        try:
+            return await self.reads.run(identifier, read)
+        except Exception:
+            return None
 
     async def create_thread(
         self, thread: ThreadDict, profile_context: Optional[Dict] = None
@@ -100,47 +553,84 @@ class CustomSQLAlchemyDataLayer(SQLAlchemyDataLayer):
                     userIdentifier=thread.get("userIdentifier"),
                     tags=thread.get("tags", []),
                     metadata_=metadata,
+                    updatedAt=utc_now(),
                 )
                 session.add(db_thread)
                 await session.commit()
-                await session.refresh(db_thread)
-
-                return {
-                    "id": str(db_thread.id),
-                    "createdAt": db_thread.createdAt,
-                    "name": db_thread.name,
-                    "userId": str(db_thread.userId) if db_thread.userId else None,
-                    "userIdentifier": db_thread.userIdentifier,
-                    "tags": db_thread.tags or [],
-                    "metadata": db_thread.metadata_ or {},
-                }
+
+                await self._invalidate_threads([db_thread.id])
+                self._mark_user_written(db_thread.userId, db_thread.userIdentifier)
+                return _thread_to_dict(db_thread)
             except Exception:
                 await session.rollback()
                 raise
 
     async def get_thread(self, thread_id: str) -> Optional[ThreadDict]:
-        """Get thread by ID"""
-        async with self.session_factory() as session:
-            try:
-                result = await session.execute(
-                    select(Thread).filter(Thread.id == UUID(thread_id))
-                )
-                thread = result.scalar_one_or_none()
-
-                if thread:
-                    return {
-                        "id": str(thread.id),
-                        "createdAt": thread.createdAt,
-                        "name": thread.name,
-                        "userId": str(thread.userId) if thread.userId else None,
-                        "userIdentifier": thread.userIdentifier,
-                        "tags": thread.tags or [],
-                        "metadata": thread.metadata_ or {},
-                    }
-                return None
-            except Exception:
+        """Get thread by ID with its steps (and their feedback) and elements (cached)"""
+        return await run_with_cache(
+            self.thread_cache, thread_id, lambda: self._load_thread(thread_id)
+        )
+
+    async def _load_thread(self, thread_id: str) -> Optional[ThreadDict]:
+        await self.flush_writes(thread_id)
+
+        async def read(session) -> Optional[ThreadDict]:
+            result = await session.execute(
+                select(Thread).filter(Thread.id == UUID(thread_id))
+            )
+            thread = result.scalar_one_or_none()
+            if not thread:
                 return None
 
+            thread_dict = _thread_to_dict(thread)
+            steps = await session.execute(
+                select(Step, Feedback)
+                .outerjoin(Feedback, Feedback.forId == Step.id)
+                .filter(Step.threadId == thread.id)
+                .order_by(Step.createdAt)
+            )
+            thread_dict["steps"] = [
+                _step_to_dict(step, feedback) for step, feedback in steps.all()
+            ]
+            elements = await session.execute(
+                select(Element).filter(Element.threadId == thread.id)
+            )
+            thread_dict["elements"] = [
+                _element_to_dict(element) for element in elements.scalars().all()
+            ]
+            return thread_dict
+
+        try:
+            thread_dict = await self.reads.run(thread_id, read)
+            if thread_dict is not None and is_archived(thread_dict["metadata"]):
+                # Rehydrate, then read the restored thread (from the primary)
+                await self._rehydrate(UUID(thread_id))
+                thread_dict = await self.reads.run(thread_id, read)
+            return thread_dict
+        except Exception:
+            return None
+
+    async def get_thread_metadata(self, thread_id: str) -> Optional[Dict]:
+        """Get only the metadata of a thread (no steps, no elements)"""
+        await self.flush_writes(thread_id)
+
+        async def read(session) -> Optional[Dict]:
+            row = (
+                await session.execute(
+                    select(Thread.metadata_).filter(Thread.id == UUID(thread_id))
+                )
+            ).one_or_none()
+            return (row[0] or {}) if row else None
+
+        try:
+            metadata = await self.reads.run(thread_id, read)
+            if is_archived(metadata):
+                await self._rehydrate(UUID(thread_id))
+                metadata = await self.reads.run(thread_id, read)
+            return metadata
+        except Exception:
+            return None
+
     async def update_thread(
         self,
         thread_id: str,
@@ -150,99 +640,177 @@ class CustomSQLAlchemyDataLayer(SQLAlchemyDataLayer):
         tags: Optional[List[str]] = None,
         profile_context: Optional[Dict] = None,
     ):
-        """Update thread with optional profile context"""
+        """Update thread with optional profile context, creating it if missing"""
+        # Chainlit creates threads through update_thread: one upsert, no prior read
+        statement = _thread_upsert(
+            UUID(thread_id),
+            name=name,
+            user_id=user_id,
+            metadata=metadata,
+            tags=tags,
+            profile_context=profile_context,
+        )
+        if user_id:
+            statement = statement.returning(Thread.userIdentifier)
+        result = await self._execute_write(statement)
+        await self._invalidate_threads([thread_id])
+        if user_id:
+            self._mark_user_written(user_id, result.scalar_one_or_none())
+
+    async def update_thread_name(self, thread_id: str, name: str) -> bool:
+        """Rename a thread; returns False if the thread does not exist"""
+        result = await self._execute_write(
+            update(Thread)
+            .where(Thread.id == UUID(thread_id))
+            .values(name=name, updatedAt=utc_now())
+        )
+        await self._invalidate_threads([thread_id])
+        return result.rowcount > 0
+
+    async def update_thread_tags(self, thread_id: str, tags: List[str]) -> bool:
+        """Replace thread tags; returns False if the thread does not exist"""
+        result = await self._execute_write(
+            update(Thread)
+            .where(Thread.id == UUID(thread_id))
+            .values(tags=tags, updatedAt=utc_now())
+        )
+        await self._invalidate_threads([thread_id])
+        return result.rowcount > 0
+
+    async def update_thread_profile_context(
+        self, thread_id: str, profile_context: Dict
+    ):
+        """Set metadata.profile_context in place, creating the thread if missing"""
+        if self.write_buffer is not None:
+            # Local drop now; the buffer invalidates again (and notifies) on commit
+            await self._invalidate_threads([thread_id], notify=False)
+            await self.write_buffer.put_profile_context(thread_id, profile_context)
+            return
+        await self._execute_write(
+            _thread_upsert(UUID(thread_id), profile_context=profile_context)
+        )
+        await self._invalidate_threads([thread_id])
+
+    async def save_profile_export(
+        self,
+        thread_id: str,
+        profile_context: Dict,
+        idempotency_key: str,
+        payload: Dict[str, Any],
+    ) -> bool:
+        """
+        Save the profile context and queue its export to every sink in one
+        transaction (see outbox.py). Returns True if the export was queued
+        (or queued again), False if the same export is still pending.
+        """
+        outbox = self.outbox
+        if outbox is None:
+            raise RuntimeError("Profile export dispatcher is not running")
+        # Older buffered profile context must not overwrite this one later
+        await self.flush_writes(thread_id)
         async with self.session_factory() as session:
             try:
+                await session.execute(
+                    _thread_upsert(UUID(thread_id), profile_context=profile_context)
+                )
+                await session.execute(
+                    outbox_supersede(UUID(thread_id), idempotency_key)
+                )
                 result = await session.execute(
-                    select(Thread).filter(Thread.id == UUID(thread_id))
+                    outbox_insert(
+                        UUID(thread_id), idempotency_key, payload, list(outbox.sinks)
+                    )
                 )
-                thread = result.scalar_one_or_none()
-
-                if thread:
-                    if name is not None:
-                        thread.name = name
-                    if user_id is not None:
-                        thread.userId = UUID(user_id)
-                    if metadata is not None:
-                        thread.metadata_ = metadata
-                    if tags is not None:
-                        thread.tags = tags
-
-                    # Update profile context in metadata
-                    if profile_context is not None:
-                        current_metadata = thread.metadata_ or {}
-                        current_metadata["profile_context"] = profile_context
-                        thread.metadata_ = current_metadata
-
-                    await session.commit()
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+        await self._invalidate_threads([thread_id])
+        outbox.wake()
+        return result.rowcount > 0
+
+    async def get_profile_export_status(
+        self, thread_id: str, idempotency_key: str
+    ) -> Optional[str]:
+        """
+        "delivered" or "pending" if this export is the thread's latest queued
+        one, None otherwise (read from the primary, shared by all workers)
+        """
+        return await export_status(
+            self.session_factory, UUID(thread_id), idempotency_key
+        )
+
+    async def _execute_write(self, statement):
+        """Execute a single write statement in its own transaction"""
+        async with self.session_factory() as session:
+            try:
+                result = await session.execute(statement)
+                await session.commit()
+                return result
             except Exception:
                 await session.rollback()
                 raise
 
     async def create_step(self, step_dict: StepDict) -> StepDict:
-        """Create a new step (message)"""
+        """Create a step (message) or update it if it already exists"""
+        values = _step_values(step_dict)
+        if self.write_buffer is not None:
+            await self._invalidate_threads([values["threadId"]], notify=False)
+            await self.write_buffer.put_step(values)
+            return _saved_step(step_dict, values)
+
         async with self.session_factory() as session:
             try:
-                db_step = Step(
-                    id=UUID(step_dict["id"]) if step_dict.get("id") else uuid4(),
-                    name=step_dict["name"],
-                    type=step_dict["type"],
-                    threadId=UUID(step_dict["threadId"]),
-                    parentId=UUID(step_dict["parentId"])
-                    if step_dict.get("parentId")
-                    else None,
-                    streaming=step_dict.get("streaming", False),
-                    waitForAnswer=step_dict.get("waitForAnswer"),
-                    isError=step_dict.get("isError"),
-                    metadata_=step_dict.get("metadata", {}),
-                    tags=step_dict.get("tags", []),
-                    input=step_dict.get("input"),
-                    output=step_dict.get("output"),
-                    createdAt=step_dict.get("createdAt")
-                    or datetime.utcnow().isoformat(),
-                    start=step_dict.get("start"),
-                    end=step_dict.get("end"),
-                    generation=step_dict.get("generation"),
-                    showInput=step_dict.get("showInput"),
-                    language=step_dict.get("language"),
-                    indent=step_dict.get("indent"),
-                    defaultOpen=step_dict.get("defaultOpen"),
-                )
-                session.add(db_step)
+                # Like the stock create_step: make sure the thread row exists
+                await session.execute(_missing_threads_insert([values]))
+                # Chainlit's update_step calls create_step: upsert in one statement
+                await session.execute(_steps_upsert([values]))
                 await session.commit()
-                await session.refresh(db_step)
-
-                return {
-                    "id": str(db_step.id),
-                    "name": db_step.name,
-                    "type": db_step.type,
-                    "threadId": str(db_step.threadId),
-                    "parentId": str(db_step.parentId) if db_step.parentId else None,
-                    "streaming": db_step.streaming,
-                    "waitForAnswer": db_step.waitForAnswer,
-                    "isError": db_step.isError,
-                    "metadata": db_step.metadata_ or {},
-                    "tags": db_step.tags or [],
-                    "input": db_step.input,
-                    "output": db_step.output,
-                    "createdAt": db_step.createdAt,
-                    "start": db_step.start,
-                    "end": db_step.end,
-                    "generation": db_step.generation,
-                    "showInput": db_step.showInput,
-                    "language": db_step.language,
-                    "indent": db_step.indent,
-                    "defaultOpen": db_step.defaultOpen,
-                }
+
+                await self._invalidate_threads([values["threadId"]])
+                return _saved_step(step_dict, values)
             except Exception:
                 await session.rollback()
                 raise
 
+    # Stock Chainlit writes below change what get_thread returns: keep the cache in step
+
+    async def delete_thread(self, thread_id: str):
+        await self.flush_writes(thread_id)
+        await super().delete_thread(thread_id)
+        await self._execute_write(
+            delete(ThreadArchive).where(ThreadArchive.id == UUID(thread_id))
+        )
+        await self._invalidate_threads([thread_id])
+
+    async def delete_step(self, step_id: str):
+        await super().delete_step(step_id)
+        await self._invalidate_threads([])
+
+    async def upsert_feedback(self, feedback) -> str:
+        feedback_id = await super().upsert_feedback(feedback)
+        thread_id = getattr(feedback, "threadId", None)
+        await self._invalidate_threads([thread_id] if thread_id else [])
+        return feedback_id
+
+    async def delete_feedback(self, feedback_id: str) -> bool:
+        deleted = await super().delete_feedback(feedback_id)
+        await self._invalidate_threads([])
+        return deleted
+
+    async def create_element(self, element):
+        await super().create_element(element)
+        await self._invalidate_threads([element.thread_id] if element.thread_id else [])
+
+    async def delete_element(self, element_id: str, thread_id: Optional[str] = None):
+        await super().delete_element(element_id, thread_id)
+        await self._invalidate_threads([thread_id] if thread_id else [])
+
     async def get_profile_context_from_thread(self, thread_id: str) -> Optional[Dict]:
         """Get profile context from thread metadata"""
-        thread = await self.get_thread(thread_id)
-        if thread and thread.get("metadata", {}).get("profile_context"):
-            return thread["metadata"]["profile_context"]
+        metadata = await self.get_thread_metadata(thread_id)
+        if metadata and metadata.get("profile_context"):
+            return metadata["profile_context"]
         return None
 
     async def save_step_with_profile_context(
@@ -254,62 +822,225 @@ class CustomSQLAlchemyDataLayer(SQLAlchemyDataLayer):
 
         # Update thread with profile context if provided
         if profile_context:
-            await self.update_thread(
-                thread_id=step_dict["threadId"], profile_context=profile_context
+            await self.update_thread_profile_context(
+                step_dict["threadId"], profile_context
             )
 
         return saved_step
 
+    async def list_user_threads_page(
+        self,
+        user_identifier: Optional[str] = None,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        user_id: Optional[str] = None,
+        search: Optional[str] = None,
+        feedback: Optional[int] = None,
+    ) -> PaginatedResponse:
+        """Threads of a user, newest first, keyset-paginated by (createdAt, id)"""
+        query = select(Thread)
+        if user_identifier is not None:
+            query = query.filter(Thread.userIdentifier == user_identifier)
+        if user_id is not None:
+            query = query.filter(Thread.userId == UUID(user_id))
+        if search:
+            query = query.filter(Thread.name.ilike(f"%{search}%"))
+        if feedback is not None:
+            query = query.filter(
+                exists().where(
+                    Feedback.threadId == Thread.id, Feedback.value == feedback
+                )
+            )
+        if cursor:
+            query = query.filter(
+                _keyset_after(Thread.createdAt, Thread.id, cursor, descending=True)
+            )
+        query = query.order_by(Thread.createdAt.desc(), Thread.id.desc()).limit(
+            limit + 1
+        )
+
+        async def read(session) -> PaginatedResponse:
+            result = await session.execute(query)
+            return _page(list(result.scalars().all()), limit, _thread_to_dict)
+
+        return await self.reads.run(user_identifier or user_id, read)
+
+    async def list_threads(
+        self, pagination: Pagination, filters: ThreadFilter
+    ) -> PaginatedResponse[ThreadDict]:
+        """Chainlit thread list (sidebar) without loading all threads of the user"""
+        return await self.list_user_threads_page(
+            user_id=filters.userId,
+            limit=pagination.first,
+            cursor=pagination.cursor,
+            search=filters.search,
+            feedback=filters.feedback,
+        )
+
+    async def get_thread_steps_page(
+        self, thread_id: str, limit: int = 100, cursor: Optional[str] = None
+    ) -> PaginatedResponse:
+        """Steps of a thread, oldest first, keyset-paginated by (createdAt, id)"""
+        await self.flush_writes(thread_id)
+        query = select(Step).filter(Step.threadId == UUID(thread_id))
+        if cursor:
+            query = query.filter(
+                _keyset_after(Step.createdAt, Step.id, cursor, descending=False)
+            )
+        query = query.order_by(Step.createdAt, Step.id).limit(limit + 1)
+
+        async def read(session) -> PaginatedResponse:
+            result = await session.execute(query)
+            return _page(list(result.scalars().all()), limit, _step_to_dict)
+
+        return await self.reads.run(thread_id, read)
+
+    async def iter_thread_steps(
+        self, thread_id: str, batch_size: int = 500
+    ) -> AsyncIterator[StepDict]:
+        """Stream all steps of a thread page by page with constant memory"""
+        cursor = None
+        while True:
+            page = await self.get_thread_steps_page(
+                thread_id, limit=batch_size, cursor=cursor
+            )
+            for step in page.data:
+                yield step
+            if not page.pageInfo.hasNextPage:
+                return
+            cursor = page.pageInfo.endCursor
+
     async def get_thread_steps(self, thread_id: str) -> List[Dict]:
         """Get all steps (messages) for a thread ordered by creation time"""
+        await self.flush_writes(thread_id)
+
+        async def read(session) -> List[Dict]:
+            result = await session.execute(
+                select(Step)
+                .filter(Step.threadId == UUID(thread_id))
+                .order_by(Step.createdAt)
+            )
+            return [
+                {
+                    "id": str(step.id),
+                    "name": step.name,
+                    "type": step.type,
+                    "input": step.input,
+                    "output": step.output,
+                    "createdAt": step.createdAt,
+                    "metadata": step.metadata_ or {},
+                }
+                for step in result.scalars().all()
+            ]
+
+        try:
+            return await self.reads.run(thread_id, read)
+        except Exception:
+            return []
+
+    async def record_token_usage(
+        self,
+        thread_id: str,
+        usage: Dict[str, int],
+        user_identifier: Optional[str] = None,
+        model: Optional[str] = None,
+    ):
+        """Persist token usage of one chat turn"""
         async with self.session_factory() as session:
             try:
-                result = await session.execute(
-                    select(Step)
-                    .filter(Step.threadId == UUID(thread_id))
-                    .order_by(Step.createdAt)
+                session.add(
+                    TokenUsage(
+                        threadId=UUID(thread_id),
+                        userIdentifier=user_identifier,
+                        model=model,
+                        requests=usage.get("requests", 0),
+                        inputTokens=usage.get("input_tokens", 0),
+                        cachedInputTokens=usage.get("cached_input_tokens", 0),
+                        outputTokens=usage.get("output_tokens", 0),
+                        createdAt=datetime.utcnow().isoformat(),
+                    )
                 )
-                steps = result.scalars().all()
-
-                return [
-                    {
-                        "id": str(step.id),
-                        "name": step.name,
-                        "type": step.type,
-                        "input": step.input,
-                        "output": step.output,
-                        "createdAt": step.createdAt,
-                        "metadata": step.metadata_ or {},
-                    }
-                    for step in steps
-                ]
+                await session.commit()
             except Exception:
-                return []
+                await session.rollback()
+                raise
 
+    async def get_usage_summary(
+        self,
+        group_by: str = "user",
+        since: Optional[str] = None,
+        min_total_tokens: Optional[int] = None,
+        limit: int = 20,
+    ) -> List[Dict]:
+        """Aggregate token usage per user or per thread, most expensive first"""
+        group_column = (
+            TokenUsage.userIdentifier if group_by == "user" else TokenUsage.threadId
+        )
+        total_tokens = func.sum(TokenUsage.inputTokens + TokenUsage.outputTokens)
 
-def get_data_layer_sync():
-    """Get the custom data layer instance synchronously"""
-    import asyncio
+        query = select(
+            group_column.label("key"),
+            func.count().label("turns"),
+            func.sum(TokenUsage.requests).label("requests"),
+            func.sum(TokenUsage.inputTokens).label("input_tokens"),
+            func.sum(TokenUsage.cachedInputTokens).label("cached_input_tokens"),
+            func.sum(TokenUsage.outputTokens).label("output_tokens"),
+            total_tokens.label("total_tokens"),
+            func.max(TokenUsage.createdAt).label("last_turn_at"),
+        ).group_by(group_column)
+        if since:
+            query = query.filter(TokenUsage.createdAt >= since)
+        if min_total_tokens is not None:
+            query = query.having(total_tokens >= min_total_tokens)
+        query = query.order_by(total_tokens.desc()).limit(limit)
 
-    # Create tables synchronously if needed
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        loop.run_until_complete(create_tables())
-    finally:
-        loop.close()
+        async with self.session_factory() as session:
+            result = await session.execute(query)
+            return [
+                {**row._asdict(), "key": str(row.key) if row.key else None}
+                for row in result
+            ]
+
+    async def get_thread_usage(self, thread_id: str) -> List[Dict]:
+        """Per-turn token usage of a thread in chronological order"""
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(TokenUsage)
+                .filter(TokenUsage.threadId == UUID(thread_id))
+                .order_by(TokenUsage.createdAt)
+            )
+            return [
+                {
+                    "createdAt": usage.createdAt,
+                    "model": usage.model,
+                    "requests": usage.requests,
+                    "input_tokens": usage.inputTokens,
+                    "cached_input_tokens": usage.cachedInputTokens,
+                    "output_tokens": usage.outputTokens,
+                }
+                for usage in result.scalars().all()
+            ]
 
-    # Use the same database URL function as config
-    conninfo = get_database_url()
 
-    return CustomSQLAlchemyDataLayer(conninfo=conninfo)
+_data_layer: Optional[CustomSQLAlchemyDataLayer] = None
 
 
-async def get_data_layer():
-    """Get the custom data layer instance"""
-    await create_tables()
+def get_shared_data_layer() -> CustomSQLAlchemyDataLayer:
+    """Process-wide data layer instance shared by Chainlit and our code"""
+    global _data_layer
 
-    # Use the same database URL function as config
-    conninfo = get_database_url()
+    if _data_layer is None:
+        _data_layer = CustomSQLAlchemyDataLayer(conninfo=get_database_url())
+    return _data_layer
 
-    return CustomSQLAlchemyDataLayer(conninfo=conninfo)
+
+def get_data_layer_sync():
+    """Get the custom data layer instance synchronously"""
+    # The schema is bootstrapped at application startup (see init_schema)
+    return get_shared_data_layer()
+
+
+async def get_data_layer():
+    """Get the custom data layer instance, bootstrapping the schema once"""
+    await init_schema()
+    return get_shared_data_layer()
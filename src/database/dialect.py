@@ -0,0 +1,55 @@
+"""
+Backend-specific SQL used by the data layer: PostgreSQL or SQLite.
+
+The backend is the dialect of the process-wide engine (DATABASE_URL).
+"""
+
+import json
+from typing import Any, Dict, List
+
+from sqlalchemy import JSON, func, literal
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql.expression import ColumnElement
+
+
+def backend() -> str:
+    from .config import engine
+
+    return engine.dialect.name
+
+
+def is_postgres() -> bool:
+    return backend() == "postgresql"
+
+
+def insert(table):
+    """INSERT with on_conflict_do_update/do_nothing for the current backend"""
+    return postgresql.insert(table) if is_postgres() else sqlite.insert(table)
+
+
+def utc_now():
+    """Current time as a value of a Timestamp column"""
+    if is_postgres():
+        return func.now()
+    # Same text form as models.Timestamp stores: 2025-01-01T10:00:00.000000Z
+    return func.strftime("%Y-%m-%dT%H:%M:%f000Z", "now")
+
+
+def json_merge(column, updates: Dict[str, Any]):
+    """
+    ``column`` (a JSON object, NULL treated as {}) with the top-level keys of
+    ``updates`` replaced, computed by the database without reading the document:
+    ``||`` on PostgreSQL, ``json_set`` on SQLite.
+    """
+    if is_postgres():
+        merged = func.coalesce(column, literal({}, JSONB))
+        return merged.op("||")(literal(updates, JSONB)) if updates else merged
+
+    arguments: List[ColumnElement] = []
+    for key, value in updates.items():
+        arguments.append(literal("$." + json.dumps(key)))
+        # json() marks the text as JSON so json_set stores an object, not a string
+        arguments.append(func.json(literal(json.dumps(value))))
+    merged = func.coalesce(column, literal("{}"))
+    return func.json_set(merged, *arguments, type_=JSON) if arguments else merged
@@ -0,0 +1,409 @@
+"""
+Streaming export of completed candidate profiles and their conversations.
+
+Threads whose ``metadata.profile_context`` holds a complete profile (the rules
+of ``CandidateProfile.is_*_complete``, evaluated in SQL) are read through a
+server-side cursor and written row by row, so memory use does not depend on
+the number of threads. Parquet output needs ``pyarrow`` and is written in row
+groups. With ``--steps`` the messages of the exported threads go to a second
+file next to the output (``profiles.steps.csv`` for ``profiles.csv``).
+Archived threads (archive.py) keep their profile in ``threads`` and are
+exported like any other; their messages are read from ``threads_archive``.
+
+Incremental runs: ``--watermark`` keeps the (updatedAt, id) of the last
+exported thread in a JSON file, and the next run exports only threads changed
+after it. Threads changed in the last ``--lag`` seconds are left for the next
+run, so transactions that are still committing are not skipped.
+
+Usage:
+    uv run python -m src.database.export --format jsonl --output profiles.jsonl
+    uv run python -m src.database.export --format csv --output profiles.csv --steps
+    uv run python -m src.database.export --format parquet --output profiles.parquet \\
+        --watermark exports/profiles.watermark.json
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import typing
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Protocol, Tuple, Type
+
+import logfire
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from ..shared.schemas import CandidateProfile
+from .archive import decompress
+
+FORMATS = ("csv", "jsonl", "parquet")
+
+# Rows fetched per round trip from the server-side cursor
+FETCH_SIZE = 1000
+PARQUET_ROW_GROUP = 10_000
+
+PROFILE = "(t.metadata #> '{profile_context,profile}')"
+
+THREAD_FIELDS = [
+    "thread_id",
+    "user_identifier",
+    "thread_name",
+    "created_at",
+    "updated_at",
+]
+STEP_FIELDS = ["thread_id", "step_id", "type", "name", "input", "output", "created_at"]
+
+
+def profile_fields() -> List[Tuple[str, str, Any]]:
+    """(section, field, annotation) of every CandidateProfile field"""
+    fields = []
+    for section, section_info in CandidateProfile.model_fields.items():
+        model = section_info.annotation
+        assert model is not None
+        for field, info in model.model_fields.items():
+            fields.append((section, field, info.annotation))
+    return fields
+
+
+def _is_set(section: str, field: str) -> str:
+    return f"coalesce({PROFILE} #>> '{{{section},{field}}}', '') <> ''"
+
+
+def _is_number(section: str, field: str) -> str:
+    return f"jsonb_typeof({PROFILE} #> '{{{section},{field}}}') = 'number'"
+
+
+def _any_list(section: str, fields: List[str]) -> str:
+    checks = [
+        f"coalesce(jsonb_array_length(CASE WHEN jsonb_typeof({PROFILE} #> "
+        f"'{{{section},{field}}}') = 'array' THEN {PROFILE} #> '{{{section},{field}}}' "
+        "END), 0) > 0"
+        for field in fields
+    ]
+    return "(" + " OR ".join(checks) + ")"
+
+
+# Same rules as CandidateProfile.is_*_complete
+COMPLETE_PROFILE = " AND ".join(
+    [
+        _is_set("position", "title"),
+        _is_number("position", "experience_years"),
+        _is_set("position", "company_field"),
+        _any_list("hard_skills", ["programming_languages", "frameworks", "tools"]),
+        _any_list(
+            "soft_skills", ["personal_qualities", "communication_skills", "team_skills"]
+        ),
+        _is_set("work_conditions", "work_format"),
+        _is_set("work_conditions", "salary_expectations"),
+    ]
+)
+
+
+def _window(watermark: Optional[Dict[str, str]]) -> str:
+    """WHERE clause: complete profiles changed after the watermark, before :until"""
+    conditions = ['t."updatedAt" < :until', COMPLETE_PROFILE]
+    if watermark:
+        conditions.append('(t."updatedAt", t.id) > (:since, :since_id)')
+    return " AND ".join(conditions)
+
+
+def profiles_query(watermark: Optional[Dict[str, str]]) -> str:
+    return (
+        't.id, t."userIdentifier", t.name, t."createdAt", t."updatedAt", '
+        "t.metadata -> 'profile_context' -> 'profile' AS profile "
+        f"FROM threads t WHERE {_window(watermark)} "
+        'ORDER BY t."updatedAt", t.id'
+    )
+
+
+def steps_query(watermark: Optional[Dict[str, str]]) -> str:
+    return (
+        's."threadId", s.id, s.type, s.name, s.input, s.output, s."createdAt" '
+        'FROM threads t JOIN steps s ON s."threadId" = t.id '
+        f"WHERE {_window(watermark)} "
+        'ORDER BY t."updatedAt", t.id, s."createdAt"'
+    )
+
+
+def archived_steps_query(watermark: Optional[Dict[str, str]]) -> str:
+    return (
+        "a.codec, a.payload "
+        "FROM threads t JOIN threads_archive a ON a.id = t.id "
+        f"WHERE {_window(watermark)} "
+        'ORDER BY t."updatedAt", t.id'
+    )
+
+
+def profile_record(row, nested: bool) -> Dict[str, Any]:
+    record: Dict[str, Any] = dict(
+        zip(THREAD_FIELDS, [str(row[0]), row[1], row[2], row[3], row[4]])
+    )
+    profile = row[5] or {}
+    if nested:
+        record["profile"] = profile
+        return record
+    for section, field, _ in profile_fields():
+        record[field] = (profile.get(section) or {}).get(field)
+    return record
+
+
+def step_record(row) -> Dict[str, Any]:
+    return dict(zip(STEP_FIELDS, [str(row[0]), str(row[1]), *row[2:]]))
+
+
+def archived_step_records(codec: str, payload: bytes) -> List[Dict[str, Any]]:
+    """Step records of an archived thread, in message order"""
+    steps = json.loads(decompress(payload, codec)).get("steps", [])
+    steps.sort(key=lambda step: step.get("createdAt") or "")
+    return [
+        step_record(
+            (
+                step["threadId"],
+                step["id"],
+                step.get("type"),
+                step.get("name"),
+                step.get("input"),
+                step.get("output"),
+                step.get("createdAt"),
+            )
+        )
+        for step in steps
+    ]
+
+
+class ExportWriter(Protocol):
+    """Common interface of the *ExportWriter classes"""
+
+    nested: bool
+
+    def __init__(self, path: Path, fields: List[str]): ...
+
+    def write(self, record: Dict[str, Any]): ...
+
+    def close(self): ...
+
+
+class CsvExportWriter:
+    """CSV with one column per profile field; lists are joined with '; '"""
+
+    nested = False
+
+    def __init__(self, path: Path, fields: List[str]):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=fields)
+        self._writer.writeheader()
+
+    def write(self, record: Dict[str, Any]):
+        self._writer.writerow(
+            {
+                key: "; ".join(map(str, value)) if isinstance(value, list) else value
+                for key, value in record.items()
+            }
+        )
+
+    def close(self):
+        self._file.close()
+
+
+class JsonlExportWriter:
+    """One JSON object per line; the profile is kept as a nested object"""
+
+    nested = True
+
+    def __init__(self, path: Path, fields: List[str]):
+        self._file = open(path, "w", encoding="utf-8")
+
+    def write(self, record: Dict[str, Any]):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetExportWriter:
+    """Parquet written in row groups of PARQUET_ROW_GROUP rows (needs pyarrow)"""
+
+    nested = False
+
+    def __init__(self, path: Path, fields: List[str]):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Parquet export needs pyarrow: uv add pyarrow") from e
+
+        self._pa = pa
+        self._schema = pa.schema([(name, _arrow_type(pa, name)) for name in fields])
+        self._writer = pq.ParquetWriter(str(path), self._schema)
+        self._rows: List[Dict[str, Any]] = []
+
+    def write(self, record: Dict[str, Any]):
+        self._rows.append(record)
+        if len(self._rows) >= PARQUET_ROW_GROUP:
+            self._flush()
+
+    def _flush(self):
+        if self._rows:
+            table = self._pa.Table.from_pylist(self._rows, schema=self._schema)
+            self._writer.write_table(table)
+            self._rows = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+def _arrow_type(pa, name: str):
+    annotations = {field: annotation for _, field, annotation in profile_fields()}
+    if name not in annotations:
+        return pa.string()
+    args = typing.get_args(annotations[name]) or (annotations[name],)
+    if any(typing.get_origin(arg) is list for arg in args):
+        return pa.list_(pa.string())
+    if bool in args:
+        return pa.bool_()
+    if int in args:
+        return pa.int64()
+    return pa.string()
+
+
+WRITERS: Dict[str, Type[ExportWriter]] = {
+    "csv": CsvExportWriter,
+    "jsonl": JsonlExportWriter,
+    "parquet": ParquetExportWriter,
+}
+
+
+def steps_path(output: Path) -> Path:
+    return output.with_name(f"{output.stem}.steps{output.suffix}")
+
+
+def read_watermark(path: Optional[Path]) -> Optional[Dict[str, str]]:
+    if path is None or not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def write_watermark(path: Path, watermark: Dict[str, Any]):
+    """Replace the watermark file atomically"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp = path.with_name(path.name + ".tmp")
+    temp.write_text(json.dumps(watermark, indent=2), encoding="utf-8")
+    os.replace(temp, path)
+
+
+async def _stream(conn, query: str, params: Dict[str, Any]):
+    result = await conn.stream(
+        text(f"SELECT {query}").execution_options(yield_per=FETCH_SIZE), params
+    )
+    async for row in result:
+        yield row
+
+
+async def export_profiles(
+    engine: AsyncEngine,
+    output: Path,
+    export_format: str = "jsonl",
+    with_steps: bool = False,
+    watermark_path: Optional[Path] = None,
+    lag: float = 60,
+) -> Dict[str, Any]:
+    """Stream complete profiles (and steps) to ``output``; returns a summary"""
+    writer_class = WRITERS[export_format]
+    watermark = read_watermark(watermark_path)
+    profile_columns = THREAD_FIELDS + (
+        ["profile"]
+        if writer_class.nested
+        else [field for _, field, _ in profile_fields()]
+    )
+    summary: Dict[str, Any] = {"profiles": 0, "steps": 0, "watermark": watermark}
+    last: Optional[Tuple[str, str]] = None
+
+    async with engine.connect() as conn:
+        # Profiles and steps from the same snapshot
+        await conn.execution_options(isolation_level="REPEATABLE READ")
+        async with conn.begin():
+            until = await conn.scalar(
+                text("SELECT now() - make_interval(secs => :lag)"), {"lag": lag}
+            )
+            params: Dict[str, Any] = {"until": until}
+            if watermark:
+                params.update(since=watermark["updatedAt"], since_id=watermark["id"])
+
+            with logfire.span("Exporting profiles to {output}", output=str(output)):
+                writer = writer_class(output, profile_columns)
+                try:
+                    async for row in _stream(conn, profiles_query(watermark), params):
+                        writer.write(profile_record(row, writer_class.nested))
+                        summary["profiles"] += 1
+                        last = (row[4], str(row[0]))
+                finally:
+                    writer.close()
+
+                if with_steps:
+                    writer = writer_class(steps_path(output), STEP_FIELDS)
+                    try:
+                        async for row in _stream(conn, steps_query(watermark), params):
+                            writer.write(step_record(row))
+                            summary["steps"] += 1
+                        # Messages of archived threads, after the hot ones
+                        async for codec, payload in _stream(
+                            conn, archived_steps_query(watermark), params
+                        ):
+                            for record in archived_step_records(codec, payload):
+                                writer.write(record)
+                                summary["steps"] += 1
+                    finally:
+                        writer.close()
+
+    if last is not None:
+        summary["watermark"] = {"updatedAt": last[0], "id": last[1]}
+        if watermark_path is not None:
+            write_watermark(watermark_path, summary["watermark"])
+    logfire.info(
+        "Exported {profiles} profiles and {steps} steps",
+        profiles=summary["profiles"],
+        steps=summary["steps"],
+    )
+    return summary
+
+
+async def run(args: argparse.Namespace):
+    from .config import engine, init_schema
+
+    await init_schema()
+    summary = await export_profiles(
+        engine,
+        Path(args.output),
+        export_format=args.format,
+        with_steps=args.steps,
+        watermark_path=Path(args.watermark) if args.watermark else None,
+        lag=args.lag,
+    )
+    await engine.dispose()
+    print(
+        f"Exported {summary['profiles']} profiles and {summary['steps']} steps, "
+        f"watermark: {summary['watermark']}"
+    )
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Export completed profiles")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--format", choices=FORMATS, default="jsonl")
+    parser.add_argument(
+        "--steps", action="store_true", help="also export the conversations"
+    )
+    parser.add_argument(
+        "--watermark", help="JSON file with the position of the last export"
+    )
+    parser.add_argument(
+        "--lag", type=float, default=60, help="skip threads changed in the last N s"
+    )
+    asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
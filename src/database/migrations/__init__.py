@@ -0,0 +1,77 @@
+"""
+Schema migrations.
+
+``create_tables()`` creates missing tables from the models; changes to tables
+that already exist go into numbered modules ``mNNNN_<name>.py`` in this
+package. Each module defines ``async def upgrade(conn)`` taking an
+``AsyncConnection`` and must be idempotent, because on a fresh database the
+tables are already created in their final shape. Applied versions are
+recorded in the ``schema_migrations`` table.
+"""
+
+import importlib
+import pkgutil
+import re
+from typing import List, Tuple
+
+import logfire
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+MIGRATION_MODULE = re.compile(r"^m(\d{4})_(\w+)$")
+
+# Arbitrary key for pg_advisory_xact_lock: one migrator at a time across processes
+MIGRATION_LOCK_ID = 7_305_121
+
+
+def discover_migrations() -> List[Tuple[int, str]]:
+    """(version, module name) of all migration modules, in order"""
+    migrations = []
+    for module in pkgutil.iter_modules(__path__):
+        match = MIGRATION_MODULE.match(module.name)
+        if match:
+            migrations.append((int(match.group(1)), module.name))
+    return sorted(migrations)
+
+
+async def run_migrations(engine: AsyncEngine) -> List[int]:
+    """Apply pending migrations; returns the versions applied by this call"""
+    applied_now = []
+    async with engine.begin() as conn:
+        await conn.execute(
+            text(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    "appliedAt" TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+                """
+            )
+        )
+
+    for version, name in discover_migrations():
+        async with engine.begin() as conn:
+            await conn.execute(
+                text("SELECT pg_advisory_xact_lock(:lock_id)"),
+                {"lock_id": MIGRATION_LOCK_ID},
+            )
+            already_applied = await conn.scalar(
+                text("SELECT 1 FROM schema_migrations WHERE version = :version"),
+                {"version": version},
+            )
+            if already_applied:
+                continue
+
+            module = importlib.import_module(f"{__name__}.{name}")
+            with logfire.span("Applying migration {name}", name=name):
+                await module.upgrade(conn)
+            await conn.execute(
+                text(
+                    "INSERT INTO schema_migrations (version, name) "
+                    "VALUES (:version, :name)"
+                ),
+                {"version": version, "name": name},
+            )
+            applied_now.append(version)
+    return applied_now
@@ -0,0 +1,51 @@
+"""Text timestamps -> timestamptz, indexes for thread and step listing.
+
+Converting a column rewrites its table under an ACCESS EXCLUSIVE lock, so on a
+large existing database run it in a maintenance window.
+"""
+
+from sqlalchemy import text
+
+TIMESTAMP_COLUMNS = {
+    "users": ["createdAt"],
+    "threads": ["createdAt"],
+    "steps": ["createdAt", "start", "end"],
+    "token_usage": ["createdAt"],
+}
+
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS ix_steps_thread_created ON steps ("threadId", "createdAt")',
+    "CREATE INDEX IF NOT EXISTS ix_threads_user_identifier_created "
+    'ON threads ("userIdentifier", "createdAt" DESC)',
+    "CREATE INDEX IF NOT EXISTS ix_threads_user_id_created "
+    'ON threads ("userId", "createdAt" DESC)',
+    'CREATE INDEX IF NOT EXISTS ix_feedbacks_for_id ON feedbacks ("forId")',
+    'CREATE INDEX IF NOT EXISTS ix_elements_thread ON elements ("threadId")',
+]
+
+
+async def upgrade(conn):
+    # Values without an offset (datetime.utcnow().isoformat()) are UTC
+    await conn.execute(text("SET LOCAL timezone = 'UTC'"))
+
+    for table, columns in TIMESTAMP_COLUMNS.items():
+        for column in columns:
+            data_type = await conn.scalar(
+                text(
+                    "SELECT data_type FROM information_schema.columns "
+                    "WHERE table_schema = current_schema() "
+                    "AND table_name = :table AND column_name = :column"
+                ),
+                {"table": table, "column": column},
+            )
+            if data_type != "text":
+                continue
+            await conn.execute(
+                text(
+                    f'ALTER TABLE {table} ALTER COLUMN "{column}" TYPE TIMESTAMPTZ '
+                    f"USING NULLIF(\"{column}\", '')::timestamptz"
+                )
+            )
+
+    for statement in INDEXES:
+        await conn.execute(text(statement))
@@ -0,0 +1,18 @@
+"""threads.updatedAt for incremental exports (src/database/export.py)."""
+
+from sqlalchemy import text
+
+
+async def upgrade(conn):
+    await conn.execute(
+        text('ALTER TABLE threads ADD COLUMN IF NOT EXISTS "updatedAt" TIMESTAMPTZ')
+    )
+    await conn.execute(
+        text('UPDATE threads SET "updatedAt" = "createdAt" WHERE "updatedAt" IS NULL')
+    )
+    await conn.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_threads_updated_at "
+            'ON threads ("updatedAt", id)'
+        )
+    )
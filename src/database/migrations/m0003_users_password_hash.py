@@ -0,0 +1,9 @@
+"""users.passwordHash for the database-backed credential store (src/database/credentials.py)."""
+
+from sqlalchemy import text
+
+
+async def upgrade(conn):
+    await conn.execute(
+        text('ALTER TABLE users ADD COLUMN IF NOT EXISTS "passwordHash" TEXT')
+    )
@@ -1,10 +1,91 @@
-from typing import TYPE_CHECKING
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any
 
-from sqlalchemy import Column, Integer, Text, Boolean, ForeignKey, ARRAY
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, Text, Boolean, ForeignKey, ARRAY, Index
+from sqlalchemy import CHAR, JSON, LargeBinary
+from sqlalchemy import TIMESTAMP, text
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 import uuid
 
+# Column types are portable: native types on PostgreSQL, JSON/text on SQLite
+
+# JSONB on PostgreSQL, JSON (text) elsewhere
+JSONType = JSON().with_variant(JSONB(), "postgresql")
+# text[] on PostgreSQL, JSON list elsewhere
+TextArray = JSON().with_variant(ARRAY(Text), "postgresql")
+
+
+def _utc_iso(value: Any) -> str:
+    """ISO 8601 in UTC with microseconds and Z; naive values are UTC"""
+    parsed = value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return (
+        parsed.astimezone(timezone.utc)
+        .isoformat(timespec="microseconds")
+        .replace("+00:00", "Z")
+    )
+
+
+class Timestamp(TypeDecorator):
+    """
+    Timestamps exchanged as ISO 8601 strings.
+
+    timestamptz on PostgreSQL (codec registered in config.py); elsewhere text
+    normalized to UTC ISO 8601, so strings compare in time order.
+    """
+
+    impl = TIMESTAMP(timezone=True)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(TIMESTAMP(timezone=True))
+        return dialect.type_descriptor(Text())
+
+    def process_bind_param(self, value, dialect):
+        if value is None or value == "" or dialect.name == "postgresql":
+            return value
+        return _utc_iso(value)
+
+    def process_result_value(self, value, dialect):
+        if not value or dialect.name == "postgresql":
+            return value
+        return _utc_iso(value)
+
+    def coerce_compared_value(self, op, value):
+        # Compare with ISO strings as timestamps, not as VARCHAR
+        return self
+
+
+class GUID(TypeDecorator):
+    """uuid on PostgreSQL, canonical 36-character text elsewhere"""
+
+    impl = CHAR(36)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(UUID(as_uuid=True))
+        return dialect.type_descriptor(CHAR(36))
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name == "postgresql":
+            return value
+        # Chainlit's raw SQL passes ids as strings
+        return str(value if isinstance(value, uuid.UUID) else uuid.UUID(str(value)))
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+        return uuid.UUID(value)
+
+    def coerce_compared_value(self, op, value):
+        return self
+
+
 if TYPE_CHECKING:
     from sqlalchemy.ext.declarative import DeclarativeMeta
 
@@ -18,10 +99,13 @@ class User(Base):
 
     __tablename__ = "users"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     identifier = Column(Text, nullable=False, unique=True)
-    metadata_ = Column("metadata", JSONB, nullable=False, default={})
-    createdAt = Column(Text)
+    metadata_ = Column("metadata", JSONType, nullable=False, default={})
+    createdAt = Column(Timestamp())
+    # bcrypt hash for password login (src/database/credentials.py); not loaded
+    # with the user row unless asked for
+    passwordHash = deferred(Column(Text))
 
     # Relationships
     threads = relationship(
@@ -33,14 +117,25 @@ class Thread(Base):
     """Chainlit threads table (chat sessions)"""
 
     __tablename__ = "threads"
+    __table_args__ = (
+        Index(
+            "ix_threads_user_identifier_created",
+            "userIdentifier",
+            text('"createdAt" DESC'),
+        ),
+        Index("ix_threads_user_id_created", "userId", text('"createdAt" DESC')),
+        Index("ix_threads_updated_at", "updatedAt", "id"),
+    )
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    createdAt = Column(Text)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    createdAt = Column(Timestamp())
     name = Column(Text)
-    userId = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
+    userId = Column(GUID(), ForeignKey("users.id"), nullable=True)
     userIdentifier = Column(Text)
-    tags = Column(ARRAY(Text))
-    metadata_ = Column("metadata", JSONB, default={})
+    tags = Column(TextArray)
+    metadata_ = Column("metadata", JSONType, default={})
+    # Last name/tags/metadata change, the watermark of incremental exports
+    updatedAt = Column(Timestamp())
 
     # Relationships
     user = relationship("User", back_populates="threads")
@@ -57,24 +152,25 @@ class Step(Base):
     """Chainlit steps table (messages)"""
 
     __tablename__ = "steps"
+    __table_args__ = (Index("ix_steps_thread_created", "threadId", "createdAt"),)
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     name = Column(Text, nullable=False)
     type = Column(Text, nullable=False)
-    threadId = Column(UUID(as_uuid=True), ForeignKey("threads.id"), nullable=False)
-    parentId = Column(UUID(as_uuid=True))
+    threadId = Column(GUID(), ForeignKey("threads.id"), nullable=False)
+    parentId = Column(GUID())
     streaming = Column(Boolean, nullable=False, default=False)
     waitForAnswer = Column(Boolean)
     isError = Column(Boolean)
-    metadata_ = Column("metadata", JSONB, default={})
-    tags = Column(ARRAY(Text))
+    metadata_ = Column("metadata", JSONType, default={})
+    tags = Column(TextArray)
     input = Column(Text)
     output = Column(Text)
-    createdAt = Column(Text)
+    createdAt = Column(Timestamp())
     command = Column(Text)
-    start = Column(Text)
-    end = Column(Text)
-    generation = Column(JSONB)
+    start = Column(Timestamp())
+    end = Column(Timestamp())
+    generation = Column(JSONType)
     showInput = Column(Text)
     language = Column(Text)
     indent = Column(Integer)
@@ -88,9 +184,10 @@ class Element(Base):
     """Chainlit elements table"""
 
     __tablename__ = "elements"
+    __table_args__ = (Index("ix_elements_thread", "threadId"),)
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    threadId = Column(UUID(as_uuid=True), ForeignKey("threads.id"))
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    threadId = Column(GUID(), ForeignKey("threads.id"))
     type = Column(Text)
     url = Column(Text)
     chainlitKey = Column(Text)
@@ -100,9 +197,9 @@ class Element(Base):
     size = Column(Text)
     page = Column(Integer)
     language = Column(Text)
-    forId = Column(UUID(as_uuid=True))
+    forId = Column(GUID())
     mime = Column(Text)
-    props = Column(JSONB)
+    props = Column(JSONType)
 
     # Relationships
     thread = relationship("Thread", back_populates="elements")
@@ -112,12 +209,78 @@ class Feedback(Base):
     """Chainlit feedbacks table"""
 
     __tablename__ = "feedbacks"
+    __table_args__ = (Index("ix_feedbacks_for_id", "forId"),)
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    forId = Column(UUID(as_uuid=True), nullable=False)
-    threadId = Column(UUID(as_uuid=True), ForeignKey("threads.id"), nullable=False)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    forId = Column(GUID(), nullable=False)
+    threadId = Column(GUID(), ForeignKey("threads.id"), nullable=False)
     value = Column(Integer, nullable=False)
     comment = Column(Text)
 
     # Relationships
     thread = relationship("Thread", back_populates="feedbacks")
+
+
+class TokenUsage(Base):
+    """LLM token usage per chat turn"""
+
+    __tablename__ = "token_usage"
+    __table_args__ = (
+        Index("ix_token_usage_thread", "threadId"),
+        Index("ix_token_usage_user_created", "userIdentifier", "createdAt"),
+    )
+
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    threadId = Column(GUID(), nullable=False)
+    userIdentifier = Column(Text)
+    model = Column(Text)
+    requests = Column(Integer, nullable=False, default=0)
+    inputTokens = Column(Integer, nullable=False, default=0)
+    cachedInputTokens = Column(Integer, nullable=False, default=0)
+    outputTokens = Column(Integer, nullable=False, default=0)
+    createdAt = Column(Timestamp())
+
+
+class ThreadArchive(Base):
+    """Compressed steps, elements and feedback of inactive threads (see archive.py)"""
+
+    __tablename__ = "threads_archive"
+
+    id = Column(GUID(), primary_key=True)
+    codec = Column(Text, nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+    steps = Column(Integer, nullable=False, default=0)
+    rawSize = Column(Integer, nullable=False, default=0)
+    lastActivityAt = Column(Timestamp())
+    archivedAt = Column(Timestamp())
+
+
+class ProfileOutbox(Base):
+    """Profile exports waiting for delivery, one row per sink (see outbox.py)"""
+
+    __tablename__ = "profile_outbox"
+    __table_args__ = (
+        Index("ux_profile_outbox_key_sink", "idempotencyKey", "sink", unique=True),
+        # Only undelivered rows are scanned by the dispatcher
+        Index(
+            "ix_profile_outbox_pending",
+            "sink",
+            "nextAttemptAt",
+            postgresql_where=text('"dispatchedAt" IS NULL'),
+            sqlite_where=text('"dispatchedAt" IS NULL'),
+        ),
+    )
+
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    # No foreign key: an export outlives the deletion of its thread
+    threadId = Column(GUID())
+    sink = Column(Text, nullable=False)
+    idempotencyKey = Column(Text, nullable=False)
+    # Times the key was queued again after delivery; part of the sinks' key
+    generation = Column(Integer, nullable=False, default=0, server_default="0")
+    payload = Column(JSONType, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    lastError = Column(Text)
+    createdAt = Column(Timestamp())
+    nextAttemptAt = Column(Timestamp())
+    dispatchedAt = Column(Timestamp())
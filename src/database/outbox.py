@@ -0,0 +1,472 @@
+"""
+Transactional outbox for profile exports.
+
+Saving a profile writes the thread's profile context and one
+``profile_outbox`` row per export sink in the same transaction, so an export
+is never lost once the chat has confirmed it. ``OutboxDispatcher`` drains the
+table in the background: it leases a batch of due rows per sink (``FOR
+UPDATE SKIP LOCKED``, so several workers can dispatch at the same time),
+delivers it outside the transaction and marks the rows dispatched. A failed
+batch is retried with exponential backoff; after
+``PROFILE_OUTBOX_MAX_ATTEMPTS`` attempts the rows stay in the table as failed
+until they are requeued. Every record carries an idempotency key, so a
+redelivered batch can be recognised by the sink. Saving a changed profile
+closes the undelivered exports of its previous versions; saving a version
+that was exported before queues it again under a new ``generation``, which
+is appended to the key sent to the sinks (``key#2``) so they do not drop it
+as a duplicate. Delivered rows older than ``PROFILE_OUTBOX_RETENTION_DAYS``
+are pruned, except the latest row of each thread and sink (the version the
+Sheets reconciler and re-save detection compare with).
+
+Usage:
+    uv run python -m src.database.outbox --status
+    uv run python -m src.database.outbox --requeue-failed
+    uv run python -m src.database.outbox --drain
+    uv run python -m src.database.outbox --prune
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from uuid import UUID, uuid4
+
+import logfire
+from sqlalchemy import delete, exists, func, select, update
+from sqlalchemy.orm import aliased
+
+from ..shared.export_sinks import IDEMPOTENCY_KEY, get_export_sinks, retry_after
+from ..shared.metrics import registry
+from .dialect import insert
+from .models import ProfileOutbox
+
+OUTBOX_TASK = "profile-outbox-dispatcher"
+
+OUTBOX_DELIVERIES = "ai_hr_profile_outbox_total"
+OUTBOX_PENDING = "ai_hr_profile_outbox_pending"
+
+# Seconds between two retention passes of a dispatcher
+PRUNE_INTERVAL = 3600
+
+
+def get_outbox_settings() -> Dict[str, Any]:
+    """Dispatcher settings from PROFILE_OUTBOX_* environment variables"""
+    return {
+        "batch_size": int(os.getenv("PROFILE_OUTBOX_BATCH_SIZE", "50")),
+        "interval": float(os.getenv("PROFILE_OUTBOX_INTERVAL", "5")),
+        "max_attempts": int(os.getenv("PROFILE_OUTBOX_MAX_ATTEMPTS", "10")),
+        "backoff_base": float(os.getenv("PROFILE_OUTBOX_BACKOFF_BASE", "2")),
+        "backoff_max": float(os.getenv("PROFILE_OUTBOX_BACKOFF_MAX", "600")),
+        # A leased batch not finished within this time is picked up again
+        "lease": float(os.getenv("PROFILE_OUTBOX_LEASE", "120")),
+        # Delivered rows are kept this many days; 0 keeps them forever
+        "retention_days": float(os.getenv("PROFILE_OUTBOX_RETENTION_DAYS", "30")),
+    }
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def delivery_key(idempotency_key: str, generation: int) -> str:
+    """Key of a record sent to the sinks: the row's key plus its generation"""
+    return f"{idempotency_key}#{generation}" if generation else idempotency_key
+
+
+def outbox_supersede(thread_id: UUID, idempotency_key: str):
+    """
+    UPDATE closing undelivered exports of an older version of the thread's
+    profile: only the latest version is delivered, and an old one retried
+    later cannot overwrite it
+    """
+    return (
+        update(ProfileOutbox)
+        .where(
+            ProfileOutbox.threadId == thread_id,
+            ProfileOutbox.dispatchedAt.is_(None),
+            ProfileOutbox.idempotencyKey != idempotency_key,
+        )
+        .values(dispatchedAt=_now(), lastError="superseded")
+    )
+
+
+def outbox_insert(
+    thread_id: Optional[UUID],
+    idempotency_key: str,
+    payload: Dict[str, Any],
+    sinks: List[str],
+):
+    """
+    INSERT of one outbox row per sink. A key that is still pending is
+    skipped; a key that was delivered or superseded before (the profile went
+    A -> B -> A) is queued again as the newest version.
+    """
+    now = _now()
+    statement = insert(ProfileOutbox).values(
+        [
+            {
+                "id": uuid4(),
+                "threadId": thread_id,
+                "sink": sink,
+                "idempotencyKey": idempotency_key,
+                "generation": 0,
+                "payload": payload,
+                "attempts": 0,
+                "createdAt": now,
+                "nextAttemptAt": now,
+            }
+            for sink in sinks
+        ]
+    )
+    return statement.on_conflict_do_update(
+        index_elements=["idempotencyKey", "sink"],
+        set_={
+            "payload": statement.excluded.payload,
+            "generation": ProfileOutbox.generation + 1,
+            "attempts": 0,
+            "createdAt": statement.excluded.createdAt,
+            "nextAttemptAt": statement.excluded.nextAttemptAt,
+            "dispatchedAt": None,
+            "lastError": None,
+        },
+        where=ProfileOutbox.dispatchedAt.is_not(None),
+    )
+
+
+async def export_status(
+    session_factory, thread_id: UUID, idempotency_key: str
+) -> Optional[str]:
+    """
+    State of an export that is the thread's latest queued version:
+    "delivered" (every sink has it), "pending", or None if the key was never
+    queued or a newer version replaced it
+    """
+    latest = (
+        select(func.max(ProfileOutbox.createdAt))
+        .where(ProfileOutbox.threadId == thread_id)
+        .scalar_subquery()
+    )
+    async with session_factory() as session:
+        rows = (
+            await session.execute(
+                select(ProfileOutbox.dispatchedAt, ProfileOutbox.lastError).where(
+                    ProfileOutbox.threadId == thread_id,
+                    ProfileOutbox.idempotencyKey == idempotency_key,
+                    ProfileOutbox.createdAt == latest,
+                )
+            )
+        ).all()
+    if not rows or any(row.lastError == "superseded" for row in rows):
+        return None
+    if all(row.dispatchedAt is not None for row in rows):
+        return "delivered"
+    return "pending"
+
+
+async def prune_dispatched(session_factory, retention_days: float) -> int:
+    """
+    Delete rows delivered (or superseded) more than ``retention_days`` ago.
+    The latest row of a thread and sink is kept; rows without a thread are
+    deleted by age alone. Returns the number of rows deleted.
+    """
+    newer = aliased(ProfileOutbox)
+    cutoff = _now() - timedelta(days=retention_days)
+    async with session_factory() as session:
+        try:
+            result = await session.execute(
+                delete(ProfileOutbox).where(
+                    ProfileOutbox.dispatchedAt.is_not(None),
+                    ProfileOutbox.dispatchedAt < cutoff,
+                    ProfileOutbox.threadId.is_(None)
+                    | exists().where(
+                        newer.threadId == ProfileOutbox.threadId,
+                        newer.sink == ProfileOutbox.sink,
+                        newer.createdAt > ProfileOutbox.createdAt,
+                    ),
+                )
+            )
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+    return result.rowcount
+
+
+class OutboxDispatcher:
+    """Background delivery of profile_outbox rows to the configured sinks"""
+
+    def __init__(
+        self,
+        session_factory,
+        sinks: Dict[str, Any],
+        batch_size: int = 50,
+        interval: float = 5,
+        max_attempts: int = 10,
+        backoff_base: float = 2,
+        backoff_max: float = 600,
+        lease: float = 120,
+        retention_days: float = 30,
+    ):
+        self.session_factory = session_factory
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease = lease
+        self.retention_days = retention_days
+        self._next_prune = 0.0
+        self._wake = asyncio.Event()
+
+    def wake(self):
+        """Dispatch now instead of at the next interval (a row was just queued)"""
+        self._wake.set()
+
+    async def _lease(self, sink: str) -> List[Any]:
+        """Claim up to batch_size due rows of a sink until the lease expires"""
+        now = _now()
+        due = (
+            select(ProfileOutbox.id)
+            .where(
+                ProfileOutbox.sink == sink,
+                ProfileOutbox.dispatchedAt.is_(None),
+                ProfileOutbox.attempts < self.max_attempts,
+                ProfileOutbox.nextAttemptAt <= now,
+            )
+            .order_by(ProfileOutbox.createdAt)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        async with self.session_factory() as session:
+            try:
+                rows = (
+                    await session.execute(
+                        update(ProfileOutbox)
+                        .where(ProfileOutbox.id.in_(due.scalar_subquery()))
+                        .values(
+                            attempts=ProfileOutbox.attempts + 1,
+                            nextAttemptAt=now + timedelta(seconds=self.lease),
+                        )
+                        .returning(
+                            ProfileOutbox.id,
+                            ProfileOutbox.idempotencyKey,
+                            ProfileOutbox.generation,
+                            ProfileOutbox.payload,
+                            ProfileOutbox.attempts,
+                        )
+                    )
+                ).all()
+                await session.commit()
+                return list(rows)
+            except Exception:
+                await session.rollback()
+                raise
+
+    async def _finish(self, ids: List[UUID], values: Dict[str, Any]):
+        async with self.session_factory() as session:
+            try:
+                await session.execute(
+                    update(ProfileOutbox)
+                    .where(ProfileOutbox.id.in_(ids))
+                    .values(**values)
+                )
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+
+    def _count(self, sink: str, status: str, amount: int):
+        registry.counter(
+            OUTBOX_DELIVERIES, "Profile outbox deliveries by sink and status"
+        ).inc(amount, sink=sink, status=status)
+
+    async def dispatch_sink(self, sink_name: str) -> int:
+        """Deliver one batch of a sink; returns the number of rows delivered"""
+        rows = await self._lease(sink_name)
+        if not rows:
+            return 0
+        ids = [row.id for row in rows]
+        records = [
+            {
+                IDEMPOTENCY_KEY: delivery_key(row.idempotencyKey, row.generation),
+                **row.payload,
+            }
+            for row in rows
+        ]
+        try:
+            await self.sinks[sink_name].deliver(records)
+        except Exception as e:
+            attempts = max(row.attempts for row in rows)
+            delay = retry_after(e) or min(
+                self.backoff_max,
+                self.backoff_base * (2 ** (attempts - 1) + random.uniform(0, 1)),
+            )
+            await self._finish(
+                ids,
+                {
+                    "lastError": str(e)[:1000],
+                    "nextAttemptAt": _now() + timedelta(seconds=delay),
+                },
+            )
+            failed = attempts >= self.max_attempts
+            log = logfire.error if failed else logfire.warn
+            log(
+                "Profile export to {sink} failed (attempt {attempts}): {error}",
+                sink=sink_name,
+                attempts=attempts,
+                error=str(e),
+                keys=[row.idempotencyKey for row in rows],
+            )
+            self._count(sink_name, "failed" if failed else "retry", len(rows))
+            return 0
+
+        await self._finish(ids, {"dispatchedAt": _now(), "lastError": None})
+        self._count(sink_name, "delivered", len(rows))
+        logfire.info(
+            "Exported {count} profiles to {sink}", count=len(rows), sink=sink_name
+        )
+        return len(rows)
+
+    async def dispatch_once(self) -> int:
+        """One batch per sink; returns the number of rows delivered"""
+        delivered = 0
+        for sink_name in self.sinks:
+            delivered += await self.dispatch_sink(sink_name)
+        return delivered
+
+    async def update_pending_gauge(self):
+        async with self.session_factory() as session:
+            rows = await session.execute(
+                select(ProfileOutbox.sink, func.count())
+                .where(ProfileOutbox.dispatchedAt.is_(None))
+                .group_by(ProfileOutbox.sink)
+            )
+            pending = dict(rows.all())
+        gauge = registry.gauge(OUTBOX_PENDING, "Undelivered profile exports")
+        for sink_name in self.sinks:
+            gauge.set(pending.get(sink_name, 0), sink=sink_name)
+
+    async def prune(self):
+        """Retention pass, at most once per PRUNE_INTERVAL"""
+        if self.retention_days <= 0 or time.monotonic() < self._next_prune:
+            return
+        self._next_prune = time.monotonic() + PRUNE_INTERVAL
+        pruned = await prune_dispatched(self.session_factory, self.retention_days)
+        if pruned:
+            logfire.info("Pruned {count} delivered profile exports", count=pruned)
+
+    async def run(self):
+        """Drain the outbox, then wait for a wake-up or the next interval"""
+        while True:
+            try:
+                # A full batch means there may be more
+                while await self.dispatch_once() >= self.batch_size:
+                    pass
+                await self.update_pending_gauge()
+                await self.prune()
+            except Exception as e:
+                logfire.error("Profile outbox dispatch failed: {error}", error=str(e))
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+
+def make_dispatcher(session_factory) -> Optional[OutboxDispatcher]:
+    """Dispatcher for PROFILE_EXPORT_SINKS, None if no sink is configured"""
+    sinks = get_export_sinks()
+    if not sinks:
+        return None
+    return OutboxDispatcher(session_factory, sinks, **get_outbox_settings())
+
+
+async def outbox_status(session_factory, max_attempts: int) -> List[Dict[str, Any]]:
+    """Row counts per sink: pending, failed (out of attempts) and dispatched"""
+    async with session_factory() as session:
+        groups = (
+            ProfileOutbox.sink,
+            ProfileOutbox.dispatchedAt.is_not(None),
+            ProfileOutbox.attempts >= max_attempts,
+        )
+        rows = await session.execute(select(*groups, func.count()).group_by(*groups))
+        summary: Dict[str, Dict[str, Any]] = {}
+        for sink, dispatched, exhausted, count in rows.all():
+            entry = summary.setdefault(
+                sink, {"sink": sink, "pending": 0, "failed": 0, "dispatched": 0}
+            )
+            if dispatched:
+                entry["dispatched"] += count
+            elif exhausted:
+                entry["failed"] += count
+            else:
+                entry["pending"] += count
+    return list(summary.values())
+
+
+async def requeue_failed(session_factory, max_attempts: int) -> int:
+    """Give rows that ran out of attempts a fresh set of attempts"""
+    async with session_factory() as session:
+        result = await session.execute(
+            update(ProfileOutbox)
+            .where(
+                ProfileOutbox.dispatchedAt.is_(None),
+                ProfileOutbox.attempts >= max_attempts,
+            )
+            .values(attempts=0, nextAttemptAt=_now())
+        )
+        await session.commit()
+        return result.rowcount
+
+
+async def run(args: argparse.Namespace):
+    from .config import AsyncSessionLocal, dispose_engine, init_schema
+
+    await init_schema()
+    settings = get_outbox_settings()
+    if args.requeue_failed:
+        count = await requeue_failed(AsyncSessionLocal, settings["max_attempts"])
+        print(f"Requeued {count} failed exports")
+    if args.drain:
+        dispatcher = make_dispatcher(AsyncSessionLocal)
+        delivered = 0
+        while dispatcher is not None:
+            batch = await dispatcher.dispatch_once()
+            if not batch:
+                break
+            delivered += batch
+        print(f"Delivered {delivered} exports")
+    if args.prune:
+        count = await prune_dispatched(AsyncSessionLocal, settings["retention_days"])
+        print(f"Pruned {count} delivered exports")
+    for entry in await outbox_status(AsyncSessionLocal, settings["max_attempts"]):
+        print(
+            f"{entry['sink']:<10} pending={entry['pending']:<6} "
+            f"failed={entry['failed']:<6} dispatched={entry['dispatched']}"
+        )
+    await dispose_engine()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Profile export outbox")
+    parser.add_argument(
+        "--status", action="store_true", help="print counts per sink (default)"
+    )
+    parser.add_argument(
+        "--requeue-failed", action="store_true", help="retry rows out of attempts"
+    )
+    parser.add_argument(
+        "--drain", action="store_true", help="deliver everything that is due now"
+    )
+    parser.add_argument(
+        "--prune", action="store_true", help="delete delivered rows past retention"
+    )
+    asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from ..shared.metrics import registry
+
+POOL_CHECKOUT_SECONDS = "ai_hr_db_pool_checkout_seconds"
+POOL_CHECKED_OUT = "ai_hr_db_pool_checked_out"
+POOL_OVERFLOW = "ai_hr_db_pool_overflow"
+POOL_SIZE = "ai_hr_db_pool_size"
+POOL_TIMEOUTS = "ai_hr_db_pool_timeouts_total"
+
+CHECKOUT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that reports checkout wait and saturation as metrics"""
+
+    # Label to tell engines apart (primary, replicas)
+    pool_name = "primary"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            registry.counter(
+                POOL_TIMEOUTS, "Connection pool checkouts that timed out"
+            ).inc(pool=self.pool_name)
+            raise
+        finally:
+            registry.histogram(
+                POOL_CHECKOUT_SECONDS,
+                "Time spent waiting for a pooled DB connection in seconds",
+                CHECKOUT_BUCKETS,
+            ).observe(time.perf_counter() - started, pool=self.pool_name)
+        self._report_usage()
+        return connection
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self._report_usage()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.pool_name = self.pool_name
+        return pool
+
+    def _report_usage(self):
+        registry.gauge(POOL_CHECKED_OUT, "DB connections currently in use").set(
+            self.checkedout(), pool=self.pool_name
+        )
+        registry.gauge(
+            POOL_OVERFLOW, "DB connections open above the configured pool size"
+        ).set(max(0, self.overflow()), pool=self.pool_name)
+        registry.gauge(POOL_SIZE, "Configured DB connection pool size").set(
+            self.size(), pool=self.pool_name
+        )
@@ -0,0 +1,159 @@
+import asyncio
+import itertools
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import logfire
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from ..shared.metrics import registry
+
+READS_TOTAL = "ai_hr_db_reads_total"
+REPLICA_LAG_SECONDS = "ai_hr_db_replica_lag_seconds"
+
+# 0 while the replica has replayed everything it received, even if the primary is idle
+LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery()
+        OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+T = TypeVar("T")
+
+
+class Replica:
+    """A read replica with its own pool, health and last measured lag"""
+
+    def __init__(self, name: str, engine: AsyncEngine):
+        self.name = name
+        self.engine = engine
+        self.session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        self.lag = 0.0
+        self.lag_checked_at = float("-inf")
+        self.unhealthy_until = 0.0
+
+
+class ReadRouter:
+    """
+    Routes read-only queries to replicas (DATABASE_REPLICA_URLS).
+
+    A key (thread id, user id or identifier) written through the data layer is read
+    from the primary for ``DB_READ_YOUR_WRITES_WINDOW`` seconds, so a session
+    always sees its own writes. Replicas lagging more than
+    ``DB_REPLICA_MAX_LAG`` seconds or failing a query are skipped (a failed
+    replica for ``DB_REPLICA_RETRY_AFTER`` seconds) and the read falls back
+    to the primary.
+    """
+
+    def __init__(
+        self, primary_session_factory, replica_engines: Dict[str, AsyncEngine]
+    ):
+        self.primary_session_factory = primary_session_factory
+        self.replicas = [
+            Replica(name, engine) for name, engine in replica_engines.items()
+        ]
+        self._next = itertools.cycle(self.replicas) if self.replicas else None
+        self.max_lag = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))
+        self.lag_check_interval = float(os.getenv("DB_REPLICA_LAG_CHECK_INTERVAL", "2"))
+        self.retry_after = float(os.getenv("DB_REPLICA_RETRY_AFTER", "30"))
+        # A write becomes visible on a replica within max_lag + one lag check
+        self.read_your_writes_window = float(
+            os.getenv(
+                "DB_READ_YOUR_WRITES_WINDOW",
+                str(self.max_lag + self.lag_check_interval),
+            )
+        )
+        self._written: Dict[str, float] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def mark_written(self, key: Any):
+        """Read ``key`` from the primary for the read-your-writes window"""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        self._written[str(key)] = now + self.read_your_writes_window
+        if len(self._written) > 10_000:
+            self._written = {k: t for k, t in self._written.items() if t > now}
+
+    def _recently_written(self, key: Any) -> bool:
+        until = self._written.get(str(key))
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            self._written.pop(str(key), None)
+            return False
+        return True
+
+    async def _pick(self) -> Optional[Replica]:
+        """Next healthy replica within the lag limit, round robin"""
+        for _ in range(len(self.replicas)):
+            replica = next(self._next)  # type: ignore[arg-type]
+            now = time.monotonic()
+            if replica.unhealthy_until > now:
+                continue
+            if now - replica.lag_checked_at > self.lag_check_interval:
+                # Concurrent readers keep using the previous value meanwhile
+                replica.lag_checked_at = now
+                try:
+                    await self._check_lag(replica)
+                except Exception as e:
+                    self._mark_failed(replica, e)
+                    continue
+            if replica.lag <= self.max_lag:
+                return replica
+        return None
+
+    async def _check_lag(self, replica: Replica):
+        async with replica.engine.connect() as conn:
+            replica.lag = float(await conn.scalar(text(LAG_QUERY)) or 0)
+        registry.gauge(
+            REPLICA_LAG_SECONDS, "Replication lag of read replicas in seconds"
+        ).set(replica.lag, pool=replica.name)
+
+    def _mark_failed(self, replica: Replica, error: Exception):
+        replica.unhealthy_until = time.monotonic() + self.retry_after
+        logfire.warn(
+            "Read replica {replica} failed, using the primary: {error}",
+            replica=replica.name,
+            error=str(error),
+        )
+
+    def _count(self, pool: str, reason: str):
+        registry.counter(READS_TOTAL, "Data layer reads by pool and reason").inc(
+            pool=pool, reason=reason
+        )
+
+    async def run(self, key: Any, read: Callable[[AsyncSession], Awaitable[T]]) -> T:
+        """Run ``read(session)`` on a replica if possible, else on the primary"""
+        if not self.enabled:
+            async with self.primary_session_factory() as session:
+                return await read(session)
+
+        if self._recently_written(key):
+            reason = "read_your_writes"
+        else:
+            replica = await self._pick()
+            if replica is None:
+                reason = "no_replica"
+            else:
+                try:
+                    async with replica.session_factory() as session:
+                        result = await read(session)
+                    self._count(replica.name, "replica")
+                    return result
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self._mark_failed(replica, e)
+                    reason = "fallback"
+
+        self._count("primary", reason)
+        async with self.primary_session_factory() as session:
+            return await read(session)
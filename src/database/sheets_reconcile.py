@@ -0,0 +1,147 @@
+"""
+Periodic reconciliation of the Google Sheets profile sheet with the database.
+
+The export path only writes what it is given, so a row edited or deleted by
+hand, or a write lost halfway, stays wrong in the sheet. The reconciler reads
+the sheet once, compares it with the latest profile version delivered to the
+``sheets`` sink (from ``profile_outbox``) and pushes only the cells that
+differ; profiles missing from the sheet are appended. Profiles with an export
+still in flight are left to the outbox dispatcher, and sheet rows the
+database knows nothing about are never touched.
+
+Usage:
+    uv run python -m src.database.sheets_reconcile
+    uv run python -m src.database.sheets_reconcile --dry-run
+"""
+
+import argparse
+import asyncio
+import os
+from typing import Dict, List, Optional
+
+import logfire
+from sqlalchemy import func, or_, select
+
+from ..shared.export_sinks import export_sink_names, profile_row
+from ..shared.google_sheets import get_sheets_manager
+from ..shared.metrics import registry
+from .models import ProfileOutbox
+
+RECONCILE_TASK = "sheets-reconciler"
+
+SHEETS_RECONCILED = "ai_hr_sheets_reconciled_total"
+
+
+def get_reconcile_interval() -> float:
+    """Seconds between passes (SHEETS_RECONCILE_INTERVAL); 0 disables the task"""
+    return float(os.getenv("SHEETS_RECONCILE_INTERVAL", "3600"))
+
+
+async def expected_rows(session_factory) -> Dict[str, List[str]]:
+    """
+    Latest delivered sheet row per profile ID.
+
+    Only the newest sheets row of each profile is read (one profile per
+    thread; rows without a thread are profiles of their own). A profile whose
+    latest export is not delivered yet is skipped: the dispatcher may be
+    writing it right now.
+    """
+    ranked = (
+        select(
+            ProfileOutbox.payload,
+            ProfileOutbox.dispatchedAt,
+            func.row_number()
+            .over(
+                partition_by=func.coalesce(ProfileOutbox.threadId, ProfileOutbox.id),
+                order_by=ProfileOutbox.createdAt.desc(),
+            )
+            .label("rank"),
+        )
+        .where(
+            ProfileOutbox.sink == "sheets",
+            # Superseded versions are closed with lastError="superseded"
+            or_(
+                ProfileOutbox.dispatchedAt.is_(None), ProfileOutbox.lastError.is_(None)
+            ),
+        )
+        .subquery()
+    )
+    query = select(ranked.c.payload).where(
+        ranked.c.rank == 1, ranked.c.dispatchedAt.is_not(None)
+    )
+    async with session_factory() as session:
+        payloads = (await session.execute(query)).scalars().all()
+    return {payload["profile_id"]: profile_row(payload) for payload in payloads}
+
+
+async def reconcile_sheet(
+    session_factory, manager, dry_run: bool = False
+) -> Dict[str, int]:
+    """One reconciliation pass; returns checked/cells_updated/rows_appended"""
+    # The sheet is read before the database: anything delivered in between
+    # is newer in the sheet and appears in the database as well
+    values = await asyncio.to_thread(manager.read_rows)
+    expected = await expected_rows(session_factory)
+    stats = await asyncio.to_thread(manager.reconcile, values, expected, dry_run)
+    if not dry_run:
+        counter = registry.counter(
+            SHEETS_RECONCILED, "Google Sheets changes pushed by reconciliation"
+        )
+        counter.inc(stats["cells_updated"], kind="cells")
+        counter.inc(stats["rows_appended"], kind="rows")
+    if stats["cells_updated"] or stats["rows_appended"]:
+        logfire.info(
+            "Sheets reconciliation: {cells_updated} cells updated, "
+            "{rows_appended} rows appended",
+            **stats,
+            dry_run=dry_run,
+        )
+    return stats
+
+
+async def run_reconciler(session_factory, manager, interval: float = 3600):
+    """Background loop: reconcile the sheet every ``interval`` seconds"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await reconcile_sheet(session_factory, manager)
+        except Exception as e:
+            logfire.error("Sheets reconciliation failed: {error}", error=str(e))
+
+
+def make_reconciler(session_factory, interval: float):
+    """Reconciler coroutine, None if Sheets export is not configured"""
+    manager = get_sheets_manager()
+    if interval <= 0 or manager is None or "sheets" not in export_sink_names():
+        return None
+    return run_reconciler(session_factory, manager, interval)
+
+
+async def run(args: argparse.Namespace):
+    from .config import AsyncSessionLocal, dispose_engine, init_schema
+
+    manager = get_sheets_manager()
+    if manager is None:
+        raise SystemExit("GOOGLE_SPREADSHEET_ID is not set")
+    await init_schema()
+    stats = await reconcile_sheet(AsyncSessionLocal, manager, dry_run=args.dry_run)
+    update, append = (
+        ("Would update", "append") if args.dry_run else ("Updated", "appended")
+    )
+    print(
+        f"Checked {stats['checked']} profiles. {update} {stats['cells_updated']} "
+        f"cells, {append} {stats['rows_appended']} rows"
+    )
+    await dispose_engine()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Reconcile the profile sheet")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only count the differences"
+    )
+    asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Token usage report per user or per thread.
+
+Usage:
+    uv run python -m src.database.usage_report --by user --since 2025-01-01
+    uv run python -m src.database.usage_report --by thread --min-tokens 100000
+    uv run python -m src.database.usage_report --thread <thread_id>
+"""
+
+import argparse
+import asyncio
+from typing import List, Optional
+
+from .config import dispose_engine
+from .data_layer import get_data_layer
+
+
+def print_summary(rows: List[dict], group_by: str):
+    """Print aggregated usage as a table"""
+    header = f"{group_by:<38} {'turns':>7} {'requests':>9} {'input':>12} {'cached':>12} {'output':>10} {'total':>12}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{str(row['key']):<38} {row['turns']:>7} {row['requests']:>9} "
+            f"{row['input_tokens']:>12,} {row['cached_input_tokens']:>12,} "
+            f"{row['output_tokens']:>10,} {row['total_tokens']:>12,}"
+        )
+
+
+def print_thread(rows: List[dict]):
+    """Print per-turn usage of one thread"""
+    for row in rows:
+        print(
+            f"{row['createdAt']}  {row['model'] or '-':<20} "
+            f"req={row['requests']:<3} in={row['input_tokens']:<8} "
+            f"cached={row['cached_input_tokens']:<8} out={row['output_tokens']}"
+        )
+
+
+async def run(args: argparse.Namespace):
+    data_layer = await get_data_layer()
+
+    if args.thread:
+        print_thread(await data_layer.get_thread_usage(args.thread))
+    else:
+        rows = await data_layer.get_usage_summary(
+            group_by=args.by,
+            since=args.since,
+            min_total_tokens=args.min_tokens,
+            limit=args.limit,
+        )
+        print_summary(rows, args.by)
+    await dispose_engine()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Token usage report")
+    parser.add_argument("--by", choices=["user", "thread"], default="user")
+    parser.add_argument("--since", help="ISO date, e.g. 2025-01-01")
+    parser.add_argument(
+        "--min-tokens", type=int, help="only groups above this total (budget check)"
+    )
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--thread", help="per-turn usage of a single thread")
+    asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+from uuid import UUID
+
+import logfire
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from ..shared.metrics import observe_phase, registry
+
+WRITE_BEHIND_QUEUE_DEPTH = "ai_hr_db_write_behind_queue_depth"
+WRITE_BEHIND_BATCH_SIZE = "ai_hr_db_write_behind_batch_size"
+WRITE_BEHIND_DEAD_LETTERS = "ai_hr_db_write_behind_dead_letters_total"
+
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+WRITE_BEHIND_TASK = "db-write-behind"
+
+# Item kinds in the queue
+STEP = "step"
+PROFILE_CONTEXT = "profile_context"
+
+# SQLSTATE classes a retry can get past: connection exception, transaction
+# rollback (serialization failure, deadlock), insufficient resources,
+# operator intervention (admin shutdown, cancel) and system errors
+TRANSIENT_SQLSTATE_CLASSES = ("08", "40", "53", "57", "58")
+
+# Dead-lettered writes kept in memory for inspection
+DEAD_LETTERS_KEPT = 100
+
+
+def _thread_of(item: Tuple[str, Any]) -> UUID:
+    kind, payload = item
+    return payload["threadId"] if kind == STEP else payload[0]
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    True for errors of the database or the connection, which the same write
+    can get past on retry; False for errors of the data (constraint
+    violations, invalid or oversized values), which fail every time.
+    """
+    if isinstance(error, DBAPIError):
+        if error.connection_invalidated:
+            return True
+        sqlstate = getattr(error.orig, "sqlstate", None)
+        if sqlstate:
+            return str(sqlstate)[:2] in TRANSIENT_SQLSTATE_CLASSES
+        # SQLite: "database is locked", disk I/O errors
+        return isinstance(error, (OperationalError, InterfaceError))
+    return isinstance(error, (OSError, asyncio.TimeoutError, PoolTimeoutError))
+
+
+def is_write_behind_enabled() -> bool:
+    return os.getenv("DB_WRITE_BEHIND", "true").lower() == "true"
+
+
+class WriteBehindError(RuntimeError):
+    """Buffered writes could not be committed (flush/close timed out on errors)"""
+
+
+class WriteBehindBuffer:
+    """
+    Async write-behind buffer for steps and profile-context updates.
+
+    Writers enqueue and return immediately; a background task drains the
+    queue and writes each batch in one transaction (group commit):
+    a multi-row step upsert with RETURNING and one JSON-merge upsert per thread
+    with the latest profile context. The queue is bounded, so writers wait
+    when the database falls behind instead of growing memory.
+
+    A batch failing on a transient error (connection lost, database down or
+    locked, deadlock) is retried with exponential backoff (capped at
+    ``backoff_max`` seconds) until it commits, while the full queue holds
+    writers back. Any other error comes from the data, so retrying cannot
+    help: the batch is split in halves down to single writes, everything
+    else commits, and a write that still fails is dead-lettered (logged,
+    counted, kept in ``dead_letters`` and reported in ``last_error``).
+
+    ``flush()`` waits until everything enqueued so far is committed or
+    dead-lettered; if that takes longer than ``flush_timeout`` while batches
+    are failing, it raises ``WriteBehindError`` (the writes stay queued).
+    ``close()`` is called on application shutdown and raises the same error
+    if writes could not be committed.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        max_size: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        interval: Optional[float] = None,
+        backoff_max: Optional[float] = None,
+        flush_timeout: Optional[float] = None,
+        on_commit: Optional[Callable[[Set[UUID]], Awaitable[None]]] = None,
+    ):
+        self.session_factory = session_factory
+        # Called with the thread ids of every committed batch
+        self.on_commit = on_commit
+        self.max_size = max_size or int(
+            os.getenv("DB_WRITE_BEHIND_QUEUE_SIZE", "10000")
+        )
+        self.batch_size = batch_size or int(
+            os.getenv("DB_WRITE_BEHIND_BATCH_SIZE", "200")
+        )
+        self.interval = (
+            interval
+            if interval is not None
+            else float(os.getenv("DB_WRITE_BEHIND_INTERVAL", "0.05"))
+        )
+        self.backoff_max = (
+            backoff_max
+            if backoff_max is not None
+            else float(os.getenv("DB_WRITE_BEHIND_BACKOFF_MAX", "30"))
+        )
+        self.flush_timeout = (
+            flush_timeout
+            if flush_timeout is not None
+            else float(os.getenv("DB_WRITE_BEHIND_FLUSH_TIMEOUT", "30"))
+        )
+        # Error of the last failed attempt, None once a batch commits again
+        self.last_error: Optional[str] = None
+        # Writes that failed on their own with a non-transient error: (item, error)
+        self.dead_letters: Deque[Tuple[Tuple[str, Any], str]] = deque(
+            maxlen=DEAD_LETTERS_KEPT
+        )
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Enqueued but not yet committed (queued + in the batch being written)
+        self._pending: Dict[UUID, int] = {}
+        self._drained: Dict[UUID, asyncio.Event] = {}
+
+    def _ensure_started(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue(maxsize=self.max_size)
+            self._worker = loop.create_task(
+                self._run(self._queue), name=WRITE_BEHIND_TASK
+            )
+            self._loop = loop
+            self._pending = {}
+            self._drained = {}
+        return self._queue  # type: ignore[return-value]
+
+    async def put_step(self, values: Dict[str, Any]):
+        """Enqueue a step row (output of _step_values)"""
+        await self._put((STEP, values))
+
+    async def put_profile_context(self, thread_id: str, profile_context: Dict):
+        """Enqueue a profile context update; only the latest per thread is written"""
+        await self._put((PROFILE_CONTEXT, (UUID(thread_id), profile_context)))
+
+    async def _put(self, item: Tuple[str, Any]):
+        queue = self._ensure_started()
+        # Counted only once queued: a put cancelled while the queue is full
+        # (client disconnect) must not leave a write that flush() waits for.
+        # The worker cannot take the item before this task resumes.
+        await queue.put(item)
+        thread_id = _thread_of(item)
+        self._pending[thread_id] = self._pending.get(thread_id, 0) + 1
+        registry.gauge(
+            WRITE_BEHIND_QUEUE_DEPTH, "Writes waiting in the write-behind buffer"
+        ).set(queue.qsize())
+
+    def pending(self, thread_id: Optional[str] = None) -> int:
+        """Writes not yet committed, overall or for one thread"""
+        if thread_id is None:
+            return sum(self._pending.values())
+        return self._pending.get(UUID(thread_id), 0)
+
+    async def flush(self, thread_id: Optional[str] = None):
+        """Wait until everything enqueued so far (for a thread) has been written"""
+        if self._queue is None or self._loop is not asyncio.get_running_loop():
+            return
+        done: "asyncio.Future[Any]"
+        if thread_id is None:
+            done = asyncio.ensure_future(self._queue.join())
+        elif self.pending(thread_id):
+            event = self._drained.setdefault(UUID(thread_id), asyncio.Event())
+            done = asyncio.ensure_future(event.wait())
+        else:
+            return
+        try:
+            while True:
+                # A slow but healthy database is waited for; a failing one is reported
+                finished, _ = await asyncio.wait({done}, timeout=self.flush_timeout)
+                if finished:
+                    return
+                if self.last_error is not None:
+                    raise WriteBehindError(
+                        f"{self.pending(thread_id)} buffered writes not committed: "
+                        f"{self.last_error}"
+                    )
+        finally:
+            done.cancel()
+
+    async def close(self):
+        """Flush pending writes and stop the background task"""
+        try:
+            await self.flush()
+        finally:
+            lost = self.pending()
+            if self._worker is not None:
+                self._worker.cancel()
+                try:
+                    await self._worker
+                except asyncio.CancelledError:
+                    pass
+            if lost:
+                logfire.error(
+                    "Write-behind stopped with {count} writes not committed",
+                    count=lost,
+                )
+            self._reset()
+
+    def _reset(self):
+        self._worker = None
+        self._queue = None
+        self._loop = None
+        self._pending = {}
+        self._drained = {}
+
+    async def _run(self, queue: asyncio.Queue):
+        while True:
+            batch = [await queue.get()]
+            # Group commit window: collect what arrives shortly after the first write
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+                for item in batch:
+                    thread_id = _thread_of(item)
+                    self._pending[thread_id] -= 1
+                    if not self._pending[thread_id]:
+                        del self._pending[thread_id]
+                        if thread_id in self._drained:
+                            self._drained.pop(thread_id).set()
+                registry.gauge(
+                    WRITE_BEHIND_QUEUE_DEPTH,
+                    "Writes waiting in the write-behind buffer",
+                ).set(queue.qsize())
+
+    async def _write_batch(self, batch: List[Tuple[str, Any]]):
+        dead_letters = await self._write_with_retries(batch)
+        if dead_letters:
+            # Reported after the rest of the batch committed (which clears it)
+            self.last_error = (
+                f"{len(dead_letters)} writes dead-lettered: {dead_letters[-1]}"
+            )
+
+    async def _write_with_retries(self, batch: List[Tuple[str, Any]]) -> List[str]:
+        """
+        Commit ``batch``, retrying transient errors; on other errors write
+        the halves separately. Returns the errors of dead-lettered writes.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                started = time.perf_counter()
+                await self._write(batch)
+            except Exception as e:
+                self.last_error = str(e)
+                if not is_transient_error(e):
+                    if len(batch) == 1:
+                        self._dead_letter(batch[0], e)
+                        return [str(e)]
+                    middle = len(batch) // 2
+                    return await self._write_with_retries(
+                        batch[:middle]
+                    ) + await self._write_with_retries(batch[middle:])
+                log = logfire.error if attempt % 10 == 0 else logfire.warn
+                log(
+                    "Write-behind batch failed (attempt {attempts}), retrying: {error}",
+                    attempts=attempt,
+                    error=str(e),
+                    batch_size=len(batch),
+                )
+                await asyncio.sleep(min(self.backoff_max, 0.1 * 2**attempt))
+            else:
+                self.last_error = None
+                observe_phase(
+                    "db_write",
+                    time.perf_counter() - started,
+                    operation="write_behind_flush",
+                )
+                registry.histogram(
+                    WRITE_BEHIND_BATCH_SIZE,
+                    "Writes per write-behind flush",
+                    BATCH_SIZE_BUCKETS,
+                    unit="1",
+                ).observe(len(batch))
+                return []
+
+    def _dead_letter(self, item: Tuple[str, Any], error: Exception):
+        kind, payload = item
+        self.dead_letters.append((item, str(error)))
+        registry.counter(
+            WRITE_BEHIND_DEAD_LETTERS,
+            "Buffered writes dropped after failing with a non-transient error",
+        ).inc(kind=kind)
+        logfire.error(
+            "Write-behind dropped a {kind} write that cannot be committed: {error}",
+            kind=kind,
+            error=str(error),
+            thread_id=str(_thread_of(item)),
+            step_id=str(payload["id"]) if kind == STEP else None,
+        )
+
+    async def _write(self, batch: List[Tuple[str, Any]]):
+        from .data_layer import _missing_threads_insert, _steps_upsert, _thread_upsert
+
+        # Coalesce: create_step + update_step of one step, repeated profile saves
+        steps: Dict[UUID, Dict[str, Any]] = {}
+        profile_contexts: Dict[UUID, Dict] = {}
+        for kind, payload in batch:
+            if kind == STEP:
+                steps[payload["id"]] = payload
+            else:
+                thread_id, profile_context = payload
+                profile_contexts[thread_id] = profile_context
+
+        async with self.session_factory() as session:
+            try:
+                if steps:
+                    rows = list(steps.values())
+                    await session.execute(_missing_threads_insert(rows))
+                    result = await session.execute(_steps_upsert(rows))
+                    written = len(result.all())
+                    if written != len(rows):
+                        logfire.warn(
+                            "Write-behind wrote {written} of {expected} steps",
+                            written=written,
+                            expected=len(rows),
+                        )
+                for thread_id, profile_context in profile_contexts.items():
+                    await session.execute(
+                        _thread_upsert(thread_id, profile_context=profile_context)
+                    )
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+
+        if self.on_commit is not None:
+            try:
+                await self.on_commit({_thread_of(item) for item in batch})
+            except Exception as e:
+                # Committed already: never retry the batch because of the hook
+                logfire.warn(
+                    "Write-behind on_commit hook failed: {error}", error=str(e)
+                )
@@ -1,4 +1,5 @@
 from pydantic_ai import Agent
+from pydantic_ai.models import infer_model
 from dotenv import load_dotenv
 
 from ..shared.schemas import ProfileContext
@@ -14,13 +15,15 @@ from .tools import (
 
 load_dotenv()
 
-# Create the HR agent
+# Create the HR agent; the OpenAI provider (~0.8s to import) is built on the
+# first run or by prewarm_model(), not at import
 agent = Agent(
     "openai:gpt-4o-mini",
     system_prompt=SYSTEM_PROMPT,
     deps_type=ProfileContext,
     instrument=True,
     retries=5,
+    defer_model_check=True,
 )
 
 # Register tools
@@ -30,3 +33,9 @@ agent.tool(update_soft_skills)
 agent.tool(update_work_conditions)
 agent.tool(get_profile_status)
 agent.tool(save_profile_to_sheets)
+
+
+def prewarm_model():
+    """Build the agent's model ahead of the first message"""
+    if isinstance(agent.model, str):
+        agent.model = infer_model(agent.model)
@@ -5,7 +5,11 @@ import os
 
 from ..shared.schemas import ProfileContext
 from ..shared.logger_config import log_profile_update
+from ..shared.export_sinks import export_sink_names
 from ..shared.google_sheets import get_sheets_manager
+from ..shared.profile_ids import content_hash, exported_profiles, profile_id_for
+from ..shared.profile_saver import ProfileContextSaver, current_thread_id
+from ..shared.sheets_queue import get_sheets_queue
 
 
 async def update_position_info(
@@ -141,27 +145,56 @@ async def save_profile_to_sheets(ctx: RunContext[ProfileContext]) -> str:
 
     try:
         sheets_manager = get_sheets_manager()
-        if not sheets_manager:
+        if not sheets_manager and "sheets" in export_sink_names():
             return "Ошибка: Google Sheets не настроен. Проверьте переменные окружения GOOGLE_SPREADSHEET_ID и Google Service Account credentials (GOOGLE_PROJECT_ID, GOOGLE_PRIVATE_KEY, и др.)."
 
-        # Генерируем уникальный ID профиля
-        profile_id = str(uuid.uuid4())[:8]
-
-        # Сохраняем профиль
-        success = sheets_manager.save_profile(ctx.deps.profile, profile_id)
-
-        if success:
+        # ID профиля стабилен в пределах диалога: повторное сохранение обновляет
+        # строку в таблице, а не добавляет новую
+        thread_id = current_thread_id()
+        profile_id = profile_id_for(thread_id) if thread_id else uuid.uuid4().hex[:12]
+        profile_hash = content_hash(ctx.deps.profile)
+
+        # Получаем ID таблицы из переменных окружения
+        spreadsheet_id = os.getenv("GOOGLE_SPREADSHEET_ID")
+        sheets_link = f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit?gid=0#gid=0"
+
+        saved = f"✅ Этот профиль уже сохранен, изменений нет. ID профиля: {profile_id}\n\n🔗 Ссылка на таблицу: {sheets_link}"
+        accepted = f"⏳ Профиль принят и будет сохранен в Google Таблицу в течение нескольких секунд. ID профиля: {profile_id}\n\n🔗 Ссылка на таблицу: {sheets_link}"
+
+        # Точный повтор (ретрай агента, повторное "да") определяется по строке
+        # outbox в БД, общей для всех воркеров
+        saver = ProfileContextSaver()
+        status = await saver.get_export_status(profile_id, profile_hash)
+        if status == "delivered":
+            return saved
+
+        if status is None:
+            # Профиль и задание на экспорт пишутся в БД одной транзакцией
+            # (outbox), доставка в таблицу и другие приемники идет в фоне
+            if await saver.save_profile_export(ctx.deps, profile_id, profile_hash):
+                status = "queued"
+            else:
+                # Тот же экспорт мог поставить параллельный вызов
+                status = await saver.get_export_status(profile_id, profile_hash)
+
+        if status is None and sheets_manager:
+            # Без БД - сразу в очередь Google Sheets (в памяти процесса)
+            if exported_profiles.is_exported(profile_id, profile_hash):
+                return saved
+            if get_sheets_queue().submit(ctx.deps.profile, profile_id):
+                exported_profiles.mark(profile_id, profile_hash)
+                status = "queued"
+
+        if status == "queued":
             log_profile_update(
-                "unknown", "saved", "google_sheets", {"profile_id": profile_id}
+                "unknown",
+                "pending",
+                "google_sheets",
+                {"profile_id": profile_id, "content_hash": profile_hash},
             )
-
-            # Получаем ID таблицы из переменных окружения
-            spreadsheet_id = os.getenv("GOOGLE_SPREADSHEET_ID")
-            sheets_link = f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit?gid=0#gid=0"
-
-            return f"✅ Профиль успешно сохранен в Google Таблицу! ID профиля: {profile_id}\n\n🔗 Ссылка на таблицу: {sheets_link}"
-        else:
-            return "❌ Ошибка при сохранении профиля в Google Таблицу. Проверьте логи для подробностей."
+        if status is not None:
+            return accepted
+        return "❌ Не удалось поставить профиль в очередь на сохранение. Попробуйте сохранить профиль чуть позже."
 
     except Exception as e:
         return f"❌ Ошибка при сохранении: {str(e)}"
@@ -2,6 +2,7 @@ from typing import List, Optional
 import chainlit as cl
 from .schemas import ProfileContext
 from .profile_saver import ProfileContextSaver
+from .metrics import timed
 
 
 class ChatHistoryManager:
@@ -33,23 +34,26 @@ class ChatHistoryManager:
         profile_context: Optional[ProfileContext] = None,
     ) -> str:
         """Format history for agent prompt, including PDF context if available"""
-        history = await self.get_chat_history(session_id)
+        with timed("history_formatting"):
+            history = await self.get_chat_history(session_id)
 
-        formatted_message = ""
+            formatted_message = ""
 
-        # Add company PDF context if available
-        if profile_context and profile_context.company_info_pdf:
-            formatted_message += f"<company_context>\n{profile_context.company_info_pdf}\n</company_context>\n\n"
+            # Add company PDF context if available
+            if profile_context and profile_context.company_info_pdf:
+                formatted_message += f"<company_context>\n{profile_context.company_info_pdf}\n</company_context>\n\n"
 
-        # Add chat history if exists
-        if history:
-            formatted_message += "<history_start>\n"
-            for msg in history:
-                role = "User" if msg["type"] == "user" else "Assistant"
-                formatted_message += f"{role}: {msg['content']}\n"
-            formatted_message += "<history_end>\n\n"
+            # Add chat history if exists
+            if history:
+                formatted_message += "<history_start>\n"
+                for msg in history:
+                    role = "User" if msg["type"] == "user" else "Assistant"
+                    formatted_message += f"{role}: {msg['content']}\n"
+                formatted_message += "<history_end>\n\n"
 
-        # Add current message
-        formatted_message += f"<current_message>\n{current_message}\n</current_message>"
+            # Add current message
+            formatted_message += (
+                f"<current_message>\n{current_message}\n</current_message>"
+            )
 
-        return formatted_message
+            return formatted_message
@@ -0,0 +1,172 @@
+import asyncio
+import csv
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .google_sheets import HEADERS, format_profile_row, get_sheets_manager
+from .schemas import CandidateProfile
+
+# Ключ идемпотентности передается в каждой записи, которую получает приемник
+IDEMPOTENCY_KEY = "idempotency_key"
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """HTTP-статус ошибки gspread (APIError) или httpx (HTTPStatusError)"""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(error, "code", None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Значение заголовка Retry-After в секундах, если сервер его прислал"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers["Retry-After"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def profile_row(record: Dict[str, Any]) -> List[str]:
+    """Строка таблицы (как в Google Sheets) для записи экспорта"""
+    created_at = record.get("created_at")
+    return format_profile_row(
+        CandidateProfile(**record["profile"]),
+        record["profile_id"],
+        datetime.fromisoformat(created_at) if created_at else None,
+    )
+
+
+class SheetsSink:
+    """
+    Google Sheets: строка профиля обновляется на месте по ID, новые
+    профили добавляются одним append_rows на пакет
+    """
+
+    name = "sheets"
+
+    async def deliver(self, records: List[Dict[str, Any]]):
+        manager = get_sheets_manager()
+        if manager is None:
+            raise RuntimeError("Google Sheets is not configured")
+        # gspread синхронный: HTTP-запрос в отдельном потоке
+        await asyncio.to_thread(
+            manager.upsert_rows, [profile_row(record) for record in records]
+        )
+
+
+class FileSink:
+    """
+    Локальный файл CSV или JSONL (по расширению), только дозапись.
+
+    Ключи уже записанных профилей читаются из файла при первой доставке,
+    поэтому повторная доставка не создает дубликатов. Измененный профиль
+    дописывается новой строкой с тем же profile_id: актуальна последняя.
+    """
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = Path(path)
+        self.is_csv = self.path.suffix == ".csv"
+        self._written: Optional[Set[str]] = None
+
+    def _read_keys(self) -> Set[str]:
+        if not self.path.exists():
+            return set()
+        with open(self.path, encoding="utf-8", newline="") as f:
+            if self.is_csv:
+                return {row[IDEMPOTENCY_KEY] for row in csv.DictReader(f)}
+            return {json.loads(line)[IDEMPOTENCY_KEY] for line in f if line.strip()}
+
+    def _append(self, records: List[Dict[str, Any]]):
+        if self._written is None:
+            self._written = self._read_keys()
+        new = [r for r in records if r[IDEMPOTENCY_KEY] not in self._written]
+        if not new:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        is_new_file = not self.path.exists()
+        with open(self.path, "a", encoding="utf-8", newline="") as f:
+            if self.is_csv:
+                writer = csv.writer(f)
+                if is_new_file:
+                    writer.writerow([IDEMPOTENCY_KEY, *HEADERS])
+                for record in new:
+                    writer.writerow([record[IDEMPOTENCY_KEY], *profile_row(record)])
+            else:
+                for record in new:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._written.update(r[IDEMPOTENCY_KEY] for r in new)
+
+    async def deliver(self, records: List[Dict[str, Any]]):
+        await asyncio.to_thread(self._append, records)
+
+
+class WebhookSink:
+    """
+    POST пакета ``{"profiles": [...]}`` на URL.
+
+    У каждой записи свой ``idempotency_key``; заголовок Idempotency-Key
+    одинаков для повторов одного и того же пакета.
+    """
+
+    def __init__(self, name: str, url: str, timeout: float = 10.0):
+        self.name = name
+        self.url = url
+        self.timeout = timeout
+
+    async def deliver(self, records: List[Dict[str, Any]]):
+        import httpx
+
+        keys = ",".join(sorted(record[IDEMPOTENCY_KEY] for record in records))
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            response = await client.post(
+                self.url,
+                json={"profiles": records},
+                headers={"Idempotency-Key": hashlib.sha256(keys.encode()).hexdigest()},
+            )
+            response.raise_for_status()
+
+
+def _sink_specs() -> List[Tuple[str, str, str]]:
+    """
+    (имя, тип, цель) из PROFILE_EXPORT_SINKS (через запятую):
+    ``sheets``, ``jsonl:<путь>``, ``csv:<путь>``, ``webhook:<url>``.
+    Имя приемника - запись целиком, поэтому два файла или два webhook'а
+    одного типа - разные приемники; повтор той же записи игнорируется.
+    """
+    specs = []
+    seen = set()
+    for spec in os.getenv("PROFILE_EXPORT_SINKS", "sheets").split(","):
+        name = spec.strip()
+        kind, _, target = name.partition(":")
+        if kind and name not in seen:
+            seen.add(name)
+            specs.append((name, kind, target))
+    return specs
+
+
+def export_sink_names() -> List[str]:
+    """Имена настроенных приемников экспорта"""
+    return [name for name, _, _ in _sink_specs()]
+
+
+def get_export_sinks() -> Dict[str, Any]:
+    """Приемники экспорта профилей по имени"""
+    sinks: Dict[str, Any] = {}
+    for name, kind, target in _sink_specs():
+        if kind == "sheets":
+            sinks[name] = SheetsSink()
+        elif kind in ("jsonl", "csv") and target:
+            sinks[name] = FileSink(name, target)
+        elif kind == "webhook" and target:
+            sinks[name] = WebhookSink(name, target)
+        else:
+            raise ValueError(f"Invalid PROFILE_EXPORT_SINKS entry: {name!r}")
+    return sinks
@@ -1,219 +1,644 @@
+import asyncio
 import os
-import json
-import tempfile
-import gspread
-from datetime import datetime
-from typing import Optional
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 import logfire
 
 from .schemas import CandidateProfile
+from .metrics import register_health_check, timed
+
+# gspread и google-auth (~0.25 с импорта) загружаются при первом обращении к API
+if TYPE_CHECKING:
+    import gspread
+
+
+# Заголовки листа профилей
+HEADERS = [
+    "ID профиля",
+    "Дата создания",
+    "Позиция",
+    "Hard skills",
+    "Soft skills",
+    "Условия работы",
+]
+
+SHEETS_WARMUP_TASK = "sheets-keep-warm"
+
+# Режимы шардирования листа профилей (SHEETS_SHARD_BY)
+SHARD_MODES = ("none", "month", "rows")
+
+# Следующий шард по числу строк создается, когда текущий заполнен на 90%
+SHARD_PRECREATE_FILL = 0.9
+
+
+def format_profile_row(
+    profile: CandidateProfile, profile_id: str, created_at: Optional[datetime] = None
+) -> List[str]:
+    """Строка таблицы для профиля (столбцы как в HEADERS)"""
+    # Форматирование данных
+    current_date = (created_at or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+
+    # Позиция
+    position_text = f"{profile.position.title or 'Не указано'} ({profile.position.experience_years or 0} лет опыта, {profile.position.company_field or 'Не указано'})"
+
+    # Hard skills
+    hard_skills_parts = []
+    if profile.hard_skills.programming_languages:
+        hard_skills_parts.append(
+            f"Языки: {', '.join(profile.hard_skills.programming_languages)}"
+        )
+    if profile.hard_skills.frameworks:
+        hard_skills_parts.append(
+            f"Фреймворки: {', '.join(profile.hard_skills.frameworks)}"
+        )
+    if profile.hard_skills.tools:
+        hard_skills_parts.append(f"Инструменты: {', '.join(profile.hard_skills.tools)}")
+    if profile.hard_skills.certifications:
+        hard_skills_parts.append(
+            f"Сертификации: {', '.join(profile.hard_skills.certifications)}"
+        )
+    hard_skills_text = (
+        "; ".join(hard_skills_parts) if hard_skills_parts else "Не указано"
+    )
+
+    # Soft skills
+    soft_skills_parts = []
+    if profile.soft_skills.personal_qualities:
+        soft_skills_parts.append(
+            f"Качества: {', '.join(profile.soft_skills.personal_qualities)}"
+        )
+    if profile.soft_skills.communication_skills:
+        soft_skills_parts.append(
+            f"Коммуникация: {', '.join(profile.soft_skills.communication_skills)}"
+        )
+    if profile.soft_skills.team_skills:
+        soft_skills_parts.append(
+            f"Команда: {', '.join(profile.soft_skills.team_skills)}"
+        )
+    if profile.soft_skills.leadership_skills:
+        soft_skills_parts.append(
+            f"Лидерство: {', '.join(profile.soft_skills.leadership_skills)}"
+        )
+    soft_skills_text = (
+        "; ".join(soft_skills_parts) if soft_skills_parts else "Не указано"
+    )
+
+    # Условия работы
+    work_conditions_parts = []
+    if profile.work_conditions.work_format:
+        work_conditions_parts.append(f"Формат: {profile.work_conditions.work_format}")
+    if profile.work_conditions.salary_expectations:
+        work_conditions_parts.append(
+            f"ЗП: {profile.work_conditions.salary_expectations}"
+        )
+    if profile.work_conditions.benefits:
+        work_conditions_parts.append(
+            f"Бенефиты: {', '.join(profile.work_conditions.benefits)}"
+        )
+    if profile.work_conditions.travel_readiness is not None:
+        travel_text = "Да" if profile.work_conditions.travel_readiness else "Нет"
+        work_conditions_parts.append(f"Командировки: {travel_text}")
+    work_conditions_text = (
+        "; ".join(work_conditions_parts) if work_conditions_parts else "Не указано"
+    )
+
+    return [
+        profile_id,
+        current_date,
+        position_text,
+        hard_skills_text,
+        soft_skills_text,
+        work_conditions_text,
+    ]
 
 
 class GoogleSheetsManager:
     """Менеджер для работы с Google Sheets"""
 
-    def __init__(self, spreadsheet_id: str):
+    def __init__(
+        self,
+        spreadsheet_id: str,
+        worksheet: Optional[str] = None,
+        shard_by: Optional[str] = None,
+        shard_rows: Optional[int] = None,
+    ):
         self.spreadsheet_id = spreadsheet_id
-        self._client: Optional[gspread.Client] = None
-        self._sheet: Optional[gspread.Worksheet] = None
+        self._client: Optional["gspread.Client"] = None
+        self._spreadsheet: Optional["gspread.Spreadsheet"] = None
+        # Базовое имя листа; шарды называются "<имя> 2025-07" или "<имя> (2)"
+        self.worksheet: str = worksheet or os.getenv("SHEETS_WORKSHEET") or "Лист1"
+        # none - один лист, month - лист на месяц, rows - новый лист каждые shard_rows строк
+        self.shard_by = shard_by or os.getenv("SHEETS_SHARD_BY", "none")
+        self.shard_rows = shard_rows or int(os.getenv("SHEETS_SHARD_ROWS", "50000"))
+        if self.shard_by not in SHARD_MODES:
+            raise ValueError(f"Invalid SHEETS_SHARD_BY: {self.shard_by!r}")
+        # Кэш хэндлов листов-шардов по имени
+        self._sheets: Dict[str, "gspread.Worksheet"] = {}
+        # Локальное зеркало столбцов ID: profile_id -> (шард, номер строки)
+        self._row_index: Optional[Dict[str, Tuple[str, int]]] = None
+        # Последняя занятая строка каждого шарда
+        self._shard_rows: Dict[str, int] = {}
+        # upsert из очереди и outbox идут в разных потоках
+        self._lock = threading.Lock()
+        # Credentials клиента и состояние прогрева (см. warm_up, health)
+        self._auth_lock = threading.Lock()
+        self._credentials: Optional[Any] = None
+        self._token_refreshed_at: Optional[float] = None
+        self._ready = False
+        self._last_error: Optional[str] = None
+        self.refresh_margin = float(os.getenv("SHEETS_TOKEN_REFRESH_MARGIN", "300"))
+
+    def _credentials_info(self) -> Optional[Dict[str, Any]]:
+        """Service account JSON из отдельных переменных окружения (None если их нет)"""
+        google_type = os.getenv("GOOGLE_TYPE", "service_account")
+        project_id = os.getenv("GOOGLE_PROJECT_ID")
+        private_key_id = os.getenv("GOOGLE_PRIVATE_KEY_ID")
+        private_key = os.getenv("GOOGLE_PRIVATE_KEY")
+        client_email = os.getenv("GOOGLE_CLIENT_EMAIL")
+        client_id = os.getenv("GOOGLE_CLIENT_ID")
+        auth_uri = os.getenv(
+            "GOOGLE_AUTH_URI", "https://accounts.google.com/o/oauth2/auth"
+        )
+        token_uri = os.getenv("GOOGLE_TOKEN_URI", "https://oauth2.googleapis.com/token")
+        auth_provider_x509_cert_url = os.getenv(
+            "GOOGLE_AUTH_PROVIDER_X509_CERT_URL",
+            "https://www.googleapis.com/oauth2/v1/certs",
+        )
+        client_x509_cert_url = os.getenv("GOOGLE_CLIENT_X509_CERT_URL")
+        universe_domain = os.getenv("GOOGLE_UNIVERSE_DOMAIN", "googleapis.com")
+
+        if not all([project_id, private_key_id, private_key, client_email, client_id]):
+            return None
+        return {
+            "type": google_type,
+            "project_id": project_id,
+            "private_key_id": private_key_id,
+            "private_key": private_key,
+            "client_email": client_email,
+            "client_id": client_id,
+            "auth_uri": auth_uri,
+            "token_uri": token_uri,
+            "auth_provider_x509_cert_url": auth_provider_x509_cert_url,
+            "client_x509_cert_url": client_x509_cert_url
+            or (
+                f"https://www.googleapis.com/robot/v1/metadata/x509/{client_email.replace('@', '%40')}"
+                if client_email
+                else None
+            ),
+            "universe_domain": universe_domain,
+        }
+
+    def _create_client(self) -> "gspread.Client":
+        """Создать клиент gspread и запомнить его credentials"""
+        import gspread
+        from google.oauth2.service_account import (
+            Credentials as ServiceAccountCredentials,
+        )
 
-    def _get_client(self) -> gspread.Client:
+        credentials_info = self._credentials_info()
+        if credentials_info:
+            try:
+                # Credentials собираются в памяти, без временного файла
+                credentials = ServiceAccountCredentials.from_service_account_info(
+                    credentials_info, scopes=gspread.auth.DEFAULT_SCOPES
+                )
+                client = gspread.authorize(credentials)
+                logfire.info(
+                    "Google Sheets client initialized from environment variables"
+                )
+                self._credentials = credentials
+                return client
+            except Exception as e:
+                logfire.error(
+                    f"Failed to create credentials from environment variables: {e}"
+                )
+                # Fallback на OAuth
+                client = gspread.oauth()
+                logfire.info("Google Sheets client initialized with OAuth (fallback)")
+        else:
+            # Fallback на OAuth (требует настройки)
+            client = gspread.oauth()
+            logfire.info("Google Sheets client initialized with OAuth")
+        # Credentials OAuth-клиента обновляются заранее, только если это
+        # google-auth Credentials с refresh; иначе токен обновит сам gspread
+        auth = getattr(getattr(client, "http_client", None), "auth", None)
+        self._credentials = auth if callable(getattr(auth, "refresh", None)) else None
+        return client
+
+    def _get_client(self) -> "gspread.Client":
         """Получить клиент gspread"""
         if self._client is None:
-            # Попробовать собрать credentials из отдельных переменных окружения
-            google_type = os.getenv("GOOGLE_TYPE", "service_account")
-            project_id = os.getenv("GOOGLE_PROJECT_ID")
-            private_key_id = os.getenv("GOOGLE_PRIVATE_KEY_ID")
-            private_key = os.getenv("GOOGLE_PRIVATE_KEY")
-            client_email = os.getenv("GOOGLE_CLIENT_EMAIL")
-            client_id = os.getenv("GOOGLE_CLIENT_ID")
-            auth_uri = os.getenv(
-                "GOOGLE_AUTH_URI", "https://accounts.google.com/o/oauth2/auth"
-            )
-            token_uri = os.getenv(
-                "GOOGLE_TOKEN_URI", "https://oauth2.googleapis.com/token"
-            )
-            auth_provider_x509_cert_url = os.getenv(
-                "GOOGLE_AUTH_PROVIDER_X509_CERT_URL",
-                "https://www.googleapis.com/oauth2/v1/certs",
+            with self._auth_lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    def token_expires_in(self) -> Optional[float]:
+        """Секунд до истечения access token, None если токена еще нет"""
+        credentials = self._credentials
+        expiry = getattr(credentials, "expiry", None)
+        if credentials is None or not credentials.token or expiry is None:
+            return None
+        # google-auth хранит expiry как naive UTC
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return (expiry - now).total_seconds()
+
+    def refresh_token(self, force: bool = False) -> bool:
+        """
+        Обновить access token, если до истечения осталось меньше
+        SHEETS_TOKEN_REFRESH_MARGIN секунд (или force). Returns: True если
+        токен обновлен
+        """
+        self._get_client()
+        credentials = self._credentials
+        if credentials is None:
+            return False
+        with self._auth_lock:
+            expires_in = self.token_expires_in()
+            if (
+                not force
+                and expires_in is not None
+                and expires_in > self.refresh_margin
+            ):
+                return False
+            from google.auth.transport.requests import Request as GoogleAuthRequest
+
+            with timed("sheets_token_refresh"):
+                credentials.refresh(GoogleAuthRequest())
+            self._token_refreshed_at = time.time()
+        return True
+
+    def warm_up(self):
+        """
+        Подготовить клиент до первого сохранения: credentials и токен,
+        open_by_key, хэндлы шардов и индекс строк
+        """
+        try:
+            with timed("sheets_warmup"):
+                self.refresh_token()
+                with self._lock:
+                    self._get_row_index()
+        except Exception as e:
+            self._last_error = str(e)
+            raise
+        self._ready = True
+        self._last_error = None
+
+    async def keep_warm(self):
+        """
+        Фоновая задача: прогрев клиента (с повторами при ошибке), затем
+        обновление токена заранее, за refresh_margin секунд до истечения
+        """
+        delay = 5.0
+        while not self._ready:
+            try:
+                await asyncio.to_thread(self.warm_up)
+                logfire.info("Google Sheets client is ready")
+            except Exception as e:
+                logfire.warn(
+                    "Google Sheets warm-up failed, retrying in {delay}s: {error}",
+                    delay=delay,
+                    error=str(e),
+                )
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 300)
+        if self._credentials is None:
+            # Заранее обновлять нечего: токен обновляет клиент gspread
+            return
+        while True:
+            expires_in = self.token_expires_in()
+            await asyncio.sleep(
+                max(30.0, expires_in - self.refresh_margin) if expires_in else 300.0
             )
-            client_x509_cert_url = os.getenv("GOOGLE_CLIENT_X509_CERT_URL")
-            universe_domain = os.getenv("GOOGLE_UNIVERSE_DOMAIN", "googleapis.com")
+            try:
+                await asyncio.to_thread(self.refresh_token)
+            except Exception as e:
+                self._last_error = str(e)
+                logfire.warn(
+                    "Google Sheets token refresh failed: {error}", error=str(e)
+                )
 
-            if all([project_id, private_key_id, private_key, client_email, client_id]):
-                try:
-                    # Собрать JSON из отдельных переменных
-                    credentials_data = {
-                        "type": google_type,
-                        "project_id": project_id,
-                        "private_key_id": private_key_id,
-                        "private_key": private_key,
-                        "client_email": client_email,
-                        "client_id": client_id,
-                        "auth_uri": auth_uri,
-                        "token_uri": token_uri,
-                        "auth_provider_x509_cert_url": auth_provider_x509_cert_url,
-                        "client_x509_cert_url": client_x509_cert_url
-                        or (
-                            f"https://www.googleapis.com/robot/v1/metadata/x509/{client_email.replace('@', '%40')}"
-                            if client_email
-                            else None
-                        ),
-                        "universe_domain": universe_domain,
-                    }
+    def health(self) -> Dict[str, Any]:
+        """Состояние клиента для /health"""
+        expires_in = self.token_expires_in()
+        return {
+            "ready": self._ready,
+            "token_age_s": (
+                round(time.time() - self._token_refreshed_at, 1)
+                if self._token_refreshed_at
+                else None
+            ),
+            "token_expires_in_s": round(expires_in, 1)
+            if expires_in is not None
+            else None,
+            "last_error": self._last_error,
+        }
 
-                    # Создать временный файл с credentials
-                    with tempfile.NamedTemporaryFile(
-                        mode="w", suffix=".json", delete=False
-                    ) as temp_file:
-                        json.dump(credentials_data, temp_file)
-                        temp_path = temp_file.name
-
-                    self._client = gspread.service_account(filename=temp_path)
-                    # Удалить временный файл
-                    os.unlink(temp_path)
-                    logfire.info(
-                        "Google Sheets client initialized from environment variables"
-                    )
-                except Exception as e:
-                    logfire.error(
-                        f"Failed to create credentials from environment variables: {e}"
-                    )
-                    # Fallback на OAuth
-                    self._client = gspread.oauth()
-                    logfire.info(
-                        "Google Sheets client initialized with OAuth (fallback)"
-                    )
-            else:
-                # Fallback на OAuth (требует настройки)
-                self._client = gspread.oauth()
-                logfire.info("Google Sheets client initialized with OAuth")
-        return self._client
+    def _get_spreadsheet(self) -> "gspread.Spreadsheet":
+        """Получить таблицу"""
+        if self._spreadsheet is None:
+            self._spreadsheet = self._get_client().open_by_key(self.spreadsheet_id)
+        return self._spreadsheet
+
+    def _get_sheet(self, worksheet_name: Optional[str] = None) -> "gspread.Worksheet":
+        """Получить лист таблицы (хэндлы кэшируются), создать если его нет"""
+        import gspread
 
-    def _get_sheet(self, worksheet_name: str = "Лист1") -> gspread.Worksheet:
-        """Получить лист таблицы"""
-        if self._sheet is None:
-            client = self._get_client()
-            spreadsheet = client.open_by_key(self.spreadsheet_id)
+        title = worksheet_name or self.worksheet
+        if title not in self._sheets:
+            spreadsheet = self._get_spreadsheet()
             try:
-                self._sheet = spreadsheet.worksheet(worksheet_name)
+                sheet = spreadsheet.worksheet(title)
             except gspread.WorksheetNotFound:
-                # Создать лист если не существует
-                self._sheet = spreadsheet.add_worksheet(
-                    title=worksheet_name, rows=1000, cols=10
-                )
-                # Добавить заголовки
-                headers = [
-                    "ID профиля",
-                    "Дата создания",
-                    "Позиция",
-                    "Hard skills",
-                    "Soft skills",
-                    "Условия работы",
-                ]
-                self._sheet.append_row(headers)
-        return self._sheet
+                rows = self.shard_rows + 1 if self.shard_by == "rows" else 1000
+                try:
+                    # Создать лист если не существует
+                    sheet = spreadsheet.add_worksheet(
+                        title=title, rows=rows, cols=len(HEADERS)
+                    )
+                except gspread.exceptions.APIError:
+                    # Лист успел создать другой воркер
+                    sheet = spreadsheet.worksheet(title)
+                else:
+                    # Добавить заголовки
+                    sheet.append_row(HEADERS)
+                    self._shard_rows[title] = 1
+                    logfire.info("Created worksheet {title}", title=title)
+            self._sheets[title] = sheet
+        return self._sheets[title]
 
-    def save_profile(self, profile: CandidateProfile, profile_id: str) -> bool:
+    def _month_shard(self, when: datetime) -> str:
+        return f"{self.worksheet} {when:%Y-%m}"
+
+    def _rows_shard(self, number: int) -> str:
+        return self.worksheet if number == 1 else f"{self.worksheet} ({number})"
+
+    def _shard_number(self, title: str) -> Optional[int]:
+        """Номер шарда по имени листа, None если лист не шард"""
+        if title == self.worksheet:
+            return 0 if self.shard_by == "month" else 1
+        suffix = title[len(self.worksheet) + 1 :]
+        if not title.startswith(self.worksheet + " "):
+            return None
+        if self.shard_by == "month" and re.fullmatch(r"\d{4}-\d{2}", suffix):
+            return int(suffix.replace("-", ""))
+        if self.shard_by == "rows" and re.fullmatch(r"\(\d+\)", suffix):
+            return int(suffix[1:-1])
+        return None
+
+    def shard_titles(self) -> List[str]:
         """
-        Сохранить профиль в Google Sheets
+        Существующие шарды по порядку (базовый лист со старыми строками -
+        первый); хэндлы всех шардов кэшируются одним запросом worksheets()
+        """
+        if self.shard_by == "none":
+            return [self._get_sheet().title]
+        for sheet in self._get_spreadsheet().worksheets():
+            if self._shard_number(sheet.title) is not None:
+                self._sheets.setdefault(sheet.title, sheet)
+        shards = []
+        for title in self._sheets:
+            number = self._shard_number(title)
+            if number is not None:
+                shards.append((number, title))
+        return [title for _, title in sorted(shards)]
 
-        Args:
-            profile: Профиль кандидата
-            profile_id: Уникальный ID профиля
+    def _read_shards(
+        self, range_name: Optional[str] = None
+    ) -> Dict[str, List[List[str]]]:
+        """Значения диапазона (или всего листа) каждого шарда одним values_batch_get"""
+        from gspread.utils import absolute_range_name
 
-        Returns:
-            bool: True если успешно сохранено
+        titles = self.shard_titles()
+        response = self._get_spreadsheet().values_batch_get(
+            [absolute_range_name(title, range_name) for title in titles]
+        )
+        return {
+            title: value_range.get("values", [])
+            for title, value_range in zip(titles, response["valueRanges"])
+        }
+
+    def _current_shard(self, incoming: int) -> Tuple[str, Optional[int]]:
         """
-        try:
-            sheet = self._get_sheet()
+        Шард для новых строк и сколько строк в него еще помещается (None -
+        без ограничения). Следующий шард создается заранее, чтобы
+        переключение не ждало add_worksheet
+        """
+        if self.shard_by == "month":
+            now = datetime.now()
+            next_month = (now.replace(day=1) + timedelta(days=32)).replace(day=1)
+            self._get_sheet(self._month_shard(next_month))
+            return self._get_sheet(self._month_shard(now)).title, None
 
-            # Форматирование данных
-            current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if self.shard_by == "rows":
+            # Текущий - последний шард с данными (следующий может быть уже создан)
+            filled = [
+                self._shard_number(title)
+                for title, last_row in self._shard_rows.items()
+                if last_row > 1
+            ]
+            number = max((shard for shard in filled if shard is not None), default=1)
+            used = self._shard_rows.get(self._rows_shard(number), 1) - 1
+            if used >= self.shard_rows:
+                number += 1
+                used = 0
+            if used + incoming >= self.shard_rows * SHARD_PRECREATE_FILL:
+                self._get_sheet(self._rows_shard(number + 1))
+            title = self._get_sheet(self._rows_shard(number)).title
+            return title, self.shard_rows - used
 
-            # Позиция
-            position_text = f"{profile.position.title or 'Не указано'} ({profile.position.experience_years or 0} лет опыта, {profile.position.company_field or 'Не указано'})"
+        return self._get_sheet().title, None
 
-            # Hard skills
-            hard_skills_parts = []
-            if profile.hard_skills.programming_languages:
-                hard_skills_parts.append(
-                    f"Языки: {', '.join(profile.hard_skills.programming_languages)}"
-                )
-            if profile.hard_skills.frameworks:
-                hard_skills_parts.append(
-                    f"Фреймворки: {', '.join(profile.hard_skills.frameworks)}"
-                )
-            if profile.hard_skills.tools:
-                hard_skills_parts.append(
-                    f"Инструменты: {', '.join(profile.hard_skills.tools)}"
-                )
-            if profile.hard_skills.certifications:
-                hard_skills_parts.append(
-                    f"Сертификации: {', '.join(profile.hard_skills.certifications)}"
-                )
-            hard_skills_text = (
-                "; ".join(hard_skills_parts) if hard_skills_parts else "Не указано"
-            )
+    def _append_new(self, rows: List[List[str]]):
+        """Добавить новые строки в текущий шард, переполнение - в следующий"""
+        while rows:
+            title, capacity = self._current_shard(len(rows))
+            chunk = rows[:capacity] if capacity else rows
+            self._append_indexed(title, chunk)
+            rows = rows[len(chunk) :]
 
-            # Soft skills
-            soft_skills_parts = []
-            if profile.soft_skills.personal_qualities:
-                soft_skills_parts.append(
-                    f"Качества: {', '.join(profile.soft_skills.personal_qualities)}"
-                )
-            if profile.soft_skills.communication_skills:
-                soft_skills_parts.append(
-                    f"Коммуникация: {', '.join(profile.soft_skills.communication_skills)}"
-                )
-            if profile.soft_skills.team_skills:
-                soft_skills_parts.append(
-                    f"Команда: {', '.join(profile.soft_skills.team_skills)}"
-                )
-            if profile.soft_skills.leadership_skills:
-                soft_skills_parts.append(
-                    f"Лидерство: {', '.join(profile.soft_skills.leadership_skills)}"
-                )
-            soft_skills_text = (
-                "; ".join(soft_skills_parts) if soft_skills_parts else "Не указано"
+    def _get_row_index(self) -> Dict[str, Tuple[str, int]]:
+        """
+        Индекс строк всех шардов: строится один раз по столбцам ID (один
+        запрос на все шарды), дальше ведется локально
+        """
+        if self._row_index is None:
+            return self._refresh_index()
+        return self._row_index
+
+    def _refresh_index(self) -> Dict[str, Tuple[str, int]]:
+        """Перечитать столбцы ID всех шардов одним values_batch_get"""
+        with timed("sheets_index"):
+            self._row_index = self._build_index(self._read_shards("A:A"))
+        return self._row_index
+
+    def _build_index(
+        self, values: Dict[str, List[List[str]]]
+    ) -> Dict[str, Tuple[str, int]]:
+        """Индекс по столбцу A прочитанных шардов (первая строка - заголовки)"""
+        index: Dict[str, Tuple[str, int]] = {}
+        for title, rows in values.items():
+            for number, row in enumerate(rows, start=1):
+                if row and row[0] and row[0] != HEADERS[0]:
+                    index[str(row[0])] = (title, number)
+            self._shard_rows[title] = max(len(rows), 1)
+        return index
+
+    def locate(self, profile_id: str) -> Optional[Tuple[str, int]]:
+        """Шард и номер строки профиля, None если профиля нет в таблице"""
+        with self._lock:
+            return self._get_row_index().get(profile_id)
+
+    def _append_indexed(self, title: str, rows: List[List[str]]):
+        """append_rows в шард с добавлением новых строк в индекс по updatedRange"""
+        from gspread.utils import a1_to_rowcol
+
+        try:
+            response = self._get_sheet(title).append_rows(rows)
+            updated_range = response["updates"]["updatedRange"]
+            first_row, _ = a1_to_rowcol(updated_range.split("!")[-1].split(":")[0])
+        except Exception:
+            # Неизвестно, какие строки записаны: индекс перечитается из листов
+            self._row_index = None
+            raise
+        if self._row_index is not None:
+            for offset, row in enumerate(rows):
+                self._row_index[row[0]] = (title, first_row + offset)
+        self._shard_rows[title] = max(
+            self._shard_rows.get(title, 1), first_row + len(rows) - 1
+        )
+
+    def _batch_update(self, updates: List[Dict[str, Any]]):
+        """Все обновления (в любых шардах) одним values_batch_update"""
+        if updates:
+            self._get_spreadsheet().values_batch_update(
+                {"valueInputOption": "RAW", "data": updates}
             )
 
-            # Условия работы
-            work_conditions_parts = []
-            if profile.work_conditions.work_format:
-                work_conditions_parts.append(
-                    f"Формат: {profile.work_conditions.work_format}"
-                )
-            if profile.work_conditions.salary_expectations:
-                work_conditions_parts.append(
-                    f"ЗП: {profile.work_conditions.salary_expectations}"
-                )
-            if profile.work_conditions.benefits:
-                work_conditions_parts.append(
-                    f"Бенефиты: {', '.join(profile.work_conditions.benefits)}"
-                )
-            if profile.work_conditions.travel_readiness is not None:
-                travel_text = (
-                    "Да" if profile.work_conditions.travel_readiness else "Нет"
+    def append_rows(self, rows: List[List[str]]):
+        """
+        Добавить несколько строк одним запросом к API
+
+        Ошибки (в том числе 429 при превышении квоты) пробрасываются вызывающему.
+        """
+        with self._lock:
+            self._get_row_index()
+            with timed("sheets_append"):
+                self._append_new(rows)
+
+    def upsert_rows(self, rows: List[List[str]]):
+        """
+        Обновить строки профилей с теми же ID на месте, остальные добавить
+
+        Шард и номер строки берутся из локального индекса, поэтому пакет
+        стоит одного batch-обновления известных профилей (в любых шардах) и
+        append_rows для новых в текущий шард. Профиль, которого нет в
+        индексе, мог добавить другой воркер, поэтому перед добавлением
+        столбцы ID перечитываются. Из нескольких строк одного профиля
+        берется последняя. Ошибки пробрасываются вызывающему.
+        """
+        from gspread.utils import absolute_range_name, rowcol_to_a1
+
+        latest = {row[0]: row for row in rows}
+        with self._lock:
+            fresh = self._row_index is None
+            index = self._get_row_index()
+            if not fresh and any(profile_id not in index for profile_id in latest):
+                index = self._refresh_index()
+            updates = []
+            new_rows = []
+            for profile_id, row in latest.items():
+                if profile_id not in index:
+                    new_rows.append(row)
+                    continue
+                title, number = index[profile_id]
+                updates.append(
+                    {
+                        "range": absolute_range_name(
+                            title, f"A{number}:{rowcol_to_a1(number, len(row))}"
+                        ),
+                        "values": [row],
+                    }
                 )
-                work_conditions_parts.append(f"Командировки: {travel_text}")
-            work_conditions_text = (
-                "; ".join(work_conditions_parts)
-                if work_conditions_parts
-                else "Не указано"
-            )
+            with timed("sheets_append"):
+                self._batch_update(updates)
+                if new_rows:
+                    self._append_new(new_rows)
 
-            # Добавить строку
-            row_data = [
-                profile_id,
-                current_date,
-                position_text,
-                hard_skills_text,
-                soft_skills_text,
-                work_conditions_text,
-            ]
+    def read_rows(self) -> Dict[str, List[List[str]]]:
+        """Прочитать все шарды (для сверки) и перестроить по ним индекс строк"""
+        with self._lock:
+            with timed("sheets_reconcile"):
+                values = self._read_shards()
+            self._row_index = self._build_index(values)
+            return values
+
+    def reconcile(
+        self,
+        values: Dict[str, List[List[str]]],
+        expected: Dict[str, List[str]],
+        dry_run: bool = False,
+    ) -> Dict[str, int]:
+        """
+        Сверить прочитанные шарды с ожидаемыми строками (profile_id -> строка)
 
-            sheet.append_row(row_data)
+        Отправляются только отличающиеся ячейки (одним batch-обновлением),
+        отсутствующие в таблице профили добавляются в текущий шард. Строки,
+        записанные после чтения ``values``, не трогаются: их уже записал экспорт.
+        """
+        from gspread.utils import absolute_range_name, rowcol_to_a1
+
+        with self._lock:
+            index = self._get_row_index()
+            updates = []
+            new_rows = []
+            for profile_id, row in expected.items():
+                if profile_id not in index:
+                    new_rows.append(row)
+                    continue
+                title, number = index[profile_id]
+                shard_values = values.get(title, [])
+                if number > len(shard_values):
+                    continue
+                actual = shard_values[number - 1]
+                for column, value in enumerate(row, start=1):
+                    current = actual[column - 1] if column <= len(actual) else ""
+                    if current != value:
+                        updates.append(
+                            {
+                                "range": absolute_range_name(
+                                    title, rowcol_to_a1(number, column)
+                                ),
+                                "values": [[value]],
+                            }
+                        )
+            if not dry_run:
+                with timed("sheets_reconcile"):
+                    self._batch_update(updates)
+                    if new_rows:
+                        self._append_new(new_rows)
+        return {
+            "checked": len(expected),
+            "cells_updated": len(updates),
+            "rows_appended": len(new_rows),
+        }
+
+    def save_profile(self, profile: CandidateProfile, profile_id: str) -> bool:
+        """
+        Сохранить профиль в Google Sheets
+
+        Args:
+            profile: Профиль кандидата
+            profile_id: Уникальный ID профиля
+
+        Returns:
+            bool: True если успешно сохранено
+        """
+        try:
+            self.append_rows([format_profile_row(profile, profile_id)])
             logfire.info(f"Profile {profile_id} saved to Google Sheets successfully")
             return True
 
@@ -236,3 +661,34 @@ def get_sheets_manager() -> Optional[GoogleSheetsManager]:
             _sheets_manager = GoogleSheetsManager(spreadsheet_id)
 
     return _sheets_manager
+
+
+# Фоновый прогрев клиента и обновление токена
+_keep_warm_task: Optional[asyncio.Task] = None
+
+
+def start_sheets_warmup() -> Optional[asyncio.Task]:
+    """
+    Прогреть клиент Google Sheets в фоне при старте приложения (SHEETS_WARMUP)
+    и добавить его состояние в /health
+    """
+    global _keep_warm_task
+
+    manager = get_sheets_manager()
+    if manager is None or os.getenv("SHEETS_WARMUP", "true").lower() != "true":
+        return None
+    if _keep_warm_task is None or _keep_warm_task.done():
+        register_health_check("sheets", manager.health)
+        _keep_warm_task = asyncio.get_running_loop().create_task(
+            manager.keep_warm(), name=SHEETS_WARMUP_TASK
+        )
+    return _keep_warm_task
+
+
+def stop_sheets_warmup():
+    """Остановить фоновое обновление токена"""
+    global _keep_warm_task
+
+    if _keep_warm_task is not None:
+        _keep_warm_task.cancel()
+        _keep_warm_task = None
@@ -1,10 +1,195 @@
 import os
-from typing import Optional
+import atexit
+import hashlib
+import queue
+import sys
+import threading
+import time
+import zlib
+from typing import Any, Callable, Optional, Tuple
 import logfire
 from dotenv import load_dotenv
+from opentelemetry import context as otel_context
+
+from .metrics import PhaseMetricsSpanProcessor, registry
 
 load_dotenv()
 
+# Строки длиннее этого лимита заменяются превью, длиной и хешем
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))
+LOG_PAYLOAD_PREVIEW_CHARS = int(os.getenv("LOG_PAYLOAD_PREVIEW_CHARS", "200"))
+# Доля сессий, для которых логируются сообщения и ответы (0.0 - 1.0)
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "1.0"))
+# Логи с содержимым диалога формируются в фоновом потоке
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() in ("1", "true", "yes")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+LOG_EMITTER_RECORDS = "ai_hr_log_emitter_records_total"
+# Не чаще одного предупреждения в stderr за этот интервал (секунды)
+LOG_EMITTER_WARN_INTERVAL = 60.0
+
+
+def compact_payload(value: Any, max_chars: Optional[int] = None) -> Any:
+    """Рекурсивно заменяет большие строки на превью, длину и sha256"""
+    max_chars = LOG_PAYLOAD_MAX_CHARS if max_chars is None else max_chars
+
+    if isinstance(value, str):
+        if len(value) <= max_chars:
+            return value
+        return {
+            "preview": value[:LOG_PAYLOAD_PREVIEW_CHARS],
+            "length": len(value),
+            "sha256": hashlib.sha256(value.encode("utf-8")).hexdigest()[:16],
+        }
+    if isinstance(value, dict):
+        return {key: compact_payload(item, max_chars) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [compact_payload(item, max_chars) for item in value]
+    return value
+
+
+def is_session_sampled(session_id: str, rate: Optional[float] = None) -> bool:
+    """Детерминированный сэмплинг: сессия логируется целиком или не логируется"""
+    rate = LOG_PAYLOAD_SAMPLE_RATE if rate is None else rate
+    if rate >= 1.0:
+        return True
+    if rate <= 0.0:
+        return False
+    return zlib.crc32(session_id.encode("utf-8")) % 10_000 < rate * 10_000
+
+
+def _snapshot_profile_context(profile_context: Any) -> Tuple[Optional[dict], Any]:
+    """
+    Дешевый снимок контекста профиля на пути запроса
+
+    Возвращает dump без company_info_pdf и сам текст PDF (строка неизменяема,
+    поэтому хешировать ее можно позже в фоновом потоке).
+    """
+    if profile_context is None:
+        return None, None
+    if hasattr(profile_context, "model_dump"):
+        return (
+            profile_context.model_dump(exclude={"company_info_pdf"}),
+            profile_context.company_info_pdf,
+        )
+    profile_context = dict(profile_context)
+    return profile_context, profile_context.pop("company_info_pdf", None)
+
+
+class BackgroundLogEmitter:
+    """
+    Очередь записей логов, которые фоновый поток формирует и передает в
+    logfire по одной: сжатие полей и хеширование текста PDF идут вне event
+    loop. Отправку пачками делает сам logfire (batch span processor).
+
+    Отброшенные при переполнении очереди и упавшие записи считаются в
+    ``dropped``/``failed`` и в метрике ai_hr_log_emitter_records_total;
+    о них пишется предупреждение в stderr (не чаще LOG_EMITTER_WARN_INTERVAL).
+    """
+
+    def __init__(self, max_queue_size: int = LOG_QUEUE_SIZE):
+        self.dropped = 0
+        self.failed = 0
+        self._queue: "queue.Queue[Tuple[Callable[[], None], Any]]" = queue.Queue(
+            maxsize=max_queue_size
+        )
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._warned_at: Optional[float] = None
+
+    def submit(self, emit: Callable[[], None]):
+        """Поставить запись в очередь; при переполнении запись отбрасывается"""
+        self._ensure_started()
+        try:
+            # Сохраняем OTel контекст, чтобы лог остался внутри span'а запроса
+            self._queue.put_nowait((emit, otel_context.get_current()))
+        except queue.Full:
+            self.dropped += 1
+            self._count("dropped")
+            self._warn(f"log queue is full, {self.dropped} records dropped so far")
+
+    def flush(self, timeout: float = 5.0):
+        """Дождаться, пока фоновый поток обработает все записи из очереди"""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        try:
+            self._queue.put((done.set, otel_context.get_current()), timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="log-emitter", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            emit, ctx = self._queue.get()
+            token = otel_context.attach(ctx)
+            try:
+                emit()
+            except Exception as e:
+                self.failed += 1
+                self._count("failed")
+                self._warn(
+                    f"log record failed ({self.failed} so far): {type(e).__name__}: {e}"
+                )
+            finally:
+                otel_context.detach(token)
+
+    def _count(self, result: str):
+        registry.counter(
+            LOG_EMITTER_RECORDS, "Payload log records not emitted, by reason"
+        ).inc(result=result)
+
+    def _warn(self, message: str):
+        """Предупреждение в stderr: logfire может быть причиной ошибки"""
+        now = time.monotonic()
+        if (
+            self._warned_at is not None
+            and now - self._warned_at < LOG_EMITTER_WARN_INTERVAL
+        ):
+            return
+        self._warned_at = now
+        print(f"log-emitter: {message}", file=sys.stderr)
+
+
+_emitter = BackgroundLogEmitter()
+
+
+def _emit_payload_log(
+    event: str, profile_snapshot: Tuple[Optional[dict], Any], **fields: Any
+):
+    """Логирование записи с содержимым диалога (в фоне, если включено)"""
+
+    def emit():
+        profile_context, company_info_pdf = profile_snapshot
+        payload = None
+        if profile_context is not None:
+            payload = {
+                **compact_payload(profile_context),
+                # Текст PDF никогда не логируется целиком
+                "company_info_pdf": (
+                    compact_payload(company_info_pdf, max_chars=0)
+                    if company_info_pdf
+                    else None
+                ),
+            }
+        logfire.info(event, profile_context=payload, **compact_payload(fields))
+
+    if LOG_ASYNC:
+        _emitter.submit(emit)
+    else:
+        emit()
+
 
 def setup_logfire():
     """Настройка логирования через Logfire"""
@@ -16,6 +201,8 @@ def setup_logfire():
         service_name=os.getenv("LOGFIRE_SERVICE_NAME", "hr-chatbot"),
         environment=os.getenv("LOGFIRE_ENV", "development"),
         send_to_logfire="if-token-present",  # Отправляет только при наличии токена
+        # Длительности запросов к LLM и вызовов tools попадают в гистограммы
+        additional_span_processors=[PhaseMetricsSpanProcessor()],
     )
 
     if logfire_token:
@@ -28,30 +215,35 @@ def setup_logfire():
         return False
 
 
-def log_user_message(
-    session_id: str, message: str, profile_context: Optional[dict] = None
-):
+def log_user_message(session_id: str, message: str, profile_context: Any = None):
     """Логирование пользовательского сообщения"""
-    logfire.info(
+    if not is_session_sampled(session_id):
+        return
+    _emit_payload_log(
         "User message received",
+        _snapshot_profile_context(profile_context),
         session_id=session_id,
         message=message,
-        profile_context=profile_context,
     )
 
 
-def log_agent_response(
-    session_id: str, response: str, profile_context: Optional[dict] = None
-):
+def log_agent_response(session_id: str, response: str, profile_context: Any = None):
     """Логирование ответа агента"""
-    logfire.info(
+    if not is_session_sampled(session_id):
+        return
+    _emit_payload_log(
         "Agent response sent",
+        _snapshot_profile_context(profile_context),
         session_id=session_id,
         response=response,
-        profile_context=profile_context,
     )
 
 
+def flush_logs(timeout: float = 5.0):
+    """Дождаться передачи фоновых логов в logfire (например, при остановке)"""
+    _emitter.flush(timeout)
+
+
 def log_database_operation(
     operation: str, session_id: str, success: bool, error: Optional[str] = None
 ):
@@ -113,3 +305,19 @@ def log_pdf_operation(
             error=error,
             session_id=session_id,
         )
+
+
+def log_token_usage(
+    session_id: str,
+    usage: dict,
+    user_identifier: Optional[str] = None,
+    model: Optional[str] = None,
+):
+    """Логирование расхода токенов за ход диалога"""
+    logfire.info(
+        "Token usage",
+        session_id=session_id,
+        user_identifier=user_identifier,
+        model=model,
+        **usage,
+    )
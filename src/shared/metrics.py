@@ -0,0 +1,316 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import logfire
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus (кумулятивные бакеты)"""
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        unit: str = "s",
+    ):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series: Dict[LabelKey, List[float]] = {}
+        self._otel = logfire.metric_histogram(name, unit=unit, description=description)
+
+    def observe(self, value: float, **labels: str):
+        """Записать наблюдение"""
+        key = _label_key(labels)
+        with self._lock:
+            # [count в каждом бакете..., +Inf, sum]
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+        self._otel.record(value, attributes=labels)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for key, series in snapshot.items():
+            for bound, count in zip(self.buckets, series):
+                labels = _format_labels(key, ("le", repr(bound)))
+                lines.append(f"{self.name}_bucket{labels} {int(count)}")
+            lines.append(
+                f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {int(series[-2])}"
+            )
+            lines.append(f"{self.name}_count{_format_labels(key)} {int(series[-2])}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """Текущее значение (в использовании, размер очереди и т.п.)"""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+        self._series: Dict[LabelKey, float] = {}
+        self._otel = logfire.metric_gauge(name, description=description)
+
+    def set(self, value: float, **labels: str):
+        """Установить значение"""
+        with self._lock:
+            self._series[_label_key(labels)] = value
+        self._otel.set(value, attributes=labels)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} gauge",
+        ]
+        with self._lock:
+            snapshot = dict(self._series)
+        for key, value in snapshot.items():
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Counter:
+    """Монотонно растущий счетчик"""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+        self._series: Dict[LabelKey, float] = {}
+        self._otel = logfire.metric_counter(name, description=description)
+
+    def inc(self, amount: float = 1, **labels: str):
+        """Увеличить счетчик"""
+        key = _label_key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+        self._otel.add(amount, attributes=labels)
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._series.get(_label_key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            snapshot = dict(self._series)
+        for key, value in snapshot.items():
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Union[Histogram, Gauge, Counter]] = {}
+
+    def _get_or_create(self, name: str, factory):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = factory()
+            return self._metrics[name]
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        unit: str = "s",
+    ) -> Histogram:
+        """Получить или создать гистограмму"""
+        return self._get_or_create(
+            name, lambda: Histogram(name, description, buckets, unit)
+        )
+
+    def gauge(self, name: str, description: str) -> Gauge:
+        """Получить или создать gauge"""
+        return self._get_or_create(name, lambda: Gauge(name, description))
+
+    def counter(self, name: str, description: str) -> Counter:
+        """Получить или создать счетчик"""
+        return self._get_or_create(name, lambda: Counter(name, description))
+
+    def render(self) -> str:
+        """Экспорт всех метрик в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+TURN_PHASE_SECONDS = "ai_hr_turn_phase_seconds"
+
+
+def observe_phase(phase: str, seconds: float, **labels: str):
+    """Записать длительность фазы обработки сообщения"""
+    registry.histogram(
+        TURN_PHASE_SECONDS, "Duration of chat turn phases in seconds"
+    ).observe(seconds, phase=phase, **labels)
+
+
+@contextmanager
+def timed(phase: str, **labels: str) -> Iterator[None]:
+    """Span в logfire и запись длительности фазы в гистограмму"""
+    started = time.perf_counter()
+    with logfire.span("phase {phase}", phase=phase, **labels):
+        try:
+            yield
+        finally:
+            observe_phase(phase, time.perf_counter() - started, **labels)
+
+
+class PhaseMetricsSpanProcessor(SpanProcessor):
+    """Переводит span'ы pydantic-ai (запросы к LLM и вызовы tools) в гистограммы"""
+
+    def on_end(self, span: ReadableSpan):
+        if span.start_time is None or span.end_time is None:
+            return
+        attributes = span.attributes or {}
+        seconds = (span.end_time - span.start_time) / 1e9
+
+        if span.name == "running tool" and "gen_ai.tool.name" in attributes:
+            observe_phase(
+                "tool_call", seconds, tool=str(attributes["gen_ai.tool.name"])
+            )
+        elif attributes.get("gen_ai.operation.name") == "chat":
+            observe_phase(
+                "llm_request",
+                seconds,
+                model=str(attributes.get("gen_ai.request.model", "unknown")),
+            )
+
+
+# Проверки готовности для /health: имя -> функция, возвращающая dict с "ready"
+_health_checks: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+
+def register_health_check(name: str, check: Callable[[], Dict[str, Any]]):
+    """Добавить компонент в ответ /health"""
+    _health_checks[name] = check
+
+
+def health_report() -> Dict[str, Any]:
+    """Состояние компонентов; status "ok" только если все готовы"""
+    checks: Dict[str, Any] = {}
+    for name, check in list(_health_checks.items()):
+        try:
+            checks[name] = check()
+        except Exception as e:
+            checks[name] = {"ready": False, "last_error": str(e)}
+    ready = all(result.get("ready") for result in checks.values())
+    return {"status": "ok" if ready else "starting", "checks": checks}
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            status = 200
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+            body = registry.render().encode("utf-8")
+        elif path == "/health":
+            report = health_report()
+            status = 200 if report["status"] == "ok" else 503
+            content_type = "application/json"
+            body = json.dumps(report).encode("utf-8")
+        else:
+            self.send_error(404)
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(
+    port: Optional[int] = None, host: Optional[str] = None
+) -> Optional[ThreadingHTTPServer]:
+    """
+    Запустить HTTP endpoints /metrics и /health в фоновом потоке
+
+    Порт берется из METRICS_PORT; если он не задан, endpoint не запускается.
+    """
+    global _metrics_server
+
+    if _metrics_server is not None:
+        return _metrics_server
+
+    port = port or int(os.getenv("METRICS_PORT", "0"))
+    if not port:
+        return None
+    host = host or os.getenv("METRICS_HOST") or "127.0.0.1"
+
+    _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(
+        target=_metrics_server.serve_forever, name="metrics-server", daemon=True
+    )
+    thread.start()
+    logfire.info("Metrics endpoint started", host=host, port=port)
+    return _metrics_server
@@ -1,12 +1,28 @@
 """PDF processing utility for company information extraction."""
 
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, Tuple
 
-import tiktoken
-from pypdf import PdfReader
-
 from .logger_config import log_pdf_operation
+from .metrics import timed
+
+# tiktoken and pypdf are imported on first use, not at app start-up
+
+
+@lru_cache(maxsize=None)
+def get_encoding():
+    """Tokenizer for token counting, loaded once per process"""
+    import tiktoken
+
+    return tiktoken.encoding_for_model("gpt-4o-mini")
+
+
+def prewarm():
+    """Load the tokenizer and the PDF reader ahead of the first upload"""
+    import pypdf  # noqa: F401
+
+    get_encoding()
 
 
 def process_pdf_file(pdf_path: str) -> Tuple[Optional[str], str]:
@@ -20,48 +36,51 @@ def process_pdf_file(pdf_path: str) -> Tuple[Optional[str], str]:
     Returns:
         Tuple of (extracted_text or None, status_message)
     """
-    try:
-        # Initialize tokenizer
-        encoding = tiktoken.encoding_for_model("gpt-4o-mini")
-
-        # Create PDF reader object
-        reader = PdfReader(pdf_path)
-
-        # Extract text from all pages
-        texts = []
-        for i in range(len(reader.pages)):
-            page = reader.pages[i]
-            text = page.extract_text() or ""  # важно: не добавляем None
-            texts.append(text)
-
-        # Join all texts
-        full_text = "\n\n".join(texts)
-
-        # Check token count
-        token_count = len(encoding.encode(full_text))
-        is_within_limit = token_count <= 100000
-
-        log_pdf_operation(
-            "process_pdf",
-            success=is_within_limit,
-            pdf_path=pdf_path,
-            token_count=token_count,
-        )
-
-        if not is_within_limit:
-            error_msg = f"Извините, но PDF слишком большой ({token_count:,} токенов). Максимум разрешено 100,000 токенов."
+    with timed("pdf_processing"):
+        try:
+            from pypdf import PdfReader
+
+            # Initialize tokenizer
+            encoding = get_encoding()
+
+            # Create PDF reader object
+            reader = PdfReader(pdf_path)
+
+            # Extract text from all pages
+            texts = []
+            for i in range(len(reader.pages)):
+                page = reader.pages[i]
+                text = page.extract_text() or ""  # важно: не добавляем None
+                texts.append(text)
+
+            # Join all texts
+            full_text = "\n\n".join(texts)
+
+            # Check token count
+            token_count = len(encoding.encode(full_text))
+            is_within_limit = token_count <= 100000
+
+            log_pdf_operation(
+                "process_pdf",
+                success=is_within_limit,
+                pdf_path=pdf_path,
+                token_count=token_count,
+            )
+
+            if not is_within_limit:
+                error_msg = f"Извините, но PDF слишком большой ({token_count:,} токенов). Максимум разрешено 100,000 токенов."
+                return None, error_msg
+
+            success_msg = f"PDF успешно обработан ({token_count:,} токенов)"
+            return full_text, success_msg
+
+        except Exception as e:
+            error_msg = f"Ошибка при обработке PDF: {str(e)}"
+            log_pdf_operation(
+                "process_pdf", success=False, pdf_path=pdf_path, error=error_msg
+            )
             return None, error_msg
 
-        success_msg = f"PDF успешно обработан ({token_count:,} токенов)"
-        return full_text, success_msg
-
-    except Exception as e:
-        error_msg = f"Ошибка при обработке PDF: {str(e)}"
-        log_pdf_operation(
-            "process_pdf", success=False, pdf_path=pdf_path, error=error_msg
-        )
-        return None, error_msg
-
 
 class PDFProcessor:
     """Simple wrapper for backward compatibility."""
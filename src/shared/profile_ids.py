@@ -0,0 +1,63 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from .schemas import CandidateProfile
+
+
+def profile_id_for(thread_id: str) -> str:
+    """
+    Стабильный ID профиля диалога: один и тот же при повторных сохранениях,
+    поэтому измененный профиль обновляет свою строку, а не добавляет новую
+    """
+    return hashlib.sha256(f"profile:{thread_id}".encode()).hexdigest()[:12]
+
+
+def content_hash(profile: CandidateProfile) -> str:
+    """Хэш канонического JSON профиля (ключи отсортированы)"""
+    canonical = json.dumps(
+        profile.model_dump(mode="json"),
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+def export_key(profile_id: str, profile_hash: str) -> str:
+    """Ключ идемпотентности экспорта: профиль + его содержимое"""
+    return f"{profile_id}:{profile_hash}"
+
+
+class ExportedIndex:
+    """
+    Профили, поставленные в очередь Google Sheets процесса: profile_id -> хэш.
+
+    Используется только без БД (очередь в памяти процесса), чтобы точный
+    повтор сохранения не отправлял профиль еще раз. С БД повтор определяется
+    по строке profile_outbox, общей для всех воркеров. Размер ограничен (LRU).
+    """
+
+    def __init__(self, max_size: int = 10_000):
+        self.max_size = max_size
+        self._hashes: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_exported(self, profile_id: str, profile_hash: str) -> bool:
+        with self._lock:
+            if self._hashes.get(profile_id) != profile_hash:
+                return False
+            self._hashes.move_to_end(profile_id)
+            return True
+
+    def mark(self, profile_id: str, profile_hash: str):
+        with self._lock:
+            self._hashes[profile_id] = profile_hash
+            self._hashes.move_to_end(profile_id)
+            while len(self._hashes) > self.max_size:
+                self._hashes.popitem(last=False)
+
+
+# Глобальный индекс экспортированных профилей
+exported_profiles = ExportedIndex()
@@ -1,6 +1,18 @@
+from datetime import datetime
 from typing import Optional
 import chainlit as cl
+import logfire
 from .schemas import ProfileContext
+from .metrics import timed
+from .profile_ids import export_key
+
+
+def current_thread_id() -> Optional[str]:
+    """Thread of the current Chainlit session, None outside a session"""
+    try:
+        return cl.context.session.thread_id
+    except Exception:
+        return None
 
 
 class ProfileContextSaver:
@@ -12,7 +24,7 @@ class ProfileContextSaver:
     async def _get_data_layer(self):
         """Get the same data layer instance that Chainlit uses"""
         if self.data_layer is None:
-            from database.data_layer import get_data_layer
+            from ..database.data_layer import get_data_layer
 
             self.data_layer = await get_data_layer()
         return self.data_layer
@@ -20,26 +32,74 @@ class ProfileContextSaver:
     async def save_profile_context(self, profile_context: ProfileContext):
         """Save ProfileContext to current thread metadata"""
         try:
-            session_id = cl.context.session.id
+            thread_id = cl.context.session.thread_id
             data_layer = await self._get_data_layer()
 
             # Update thread metadata with ProfileContext
-            await data_layer.update_thread(
-                thread_id=session_id,
-                metadata={"profile_context": profile_context.model_dump()},
-            )
+            with timed("db_write", operation="save_profile_context"):
+                await data_layer.update_thread_profile_context(
+                    thread_id, profile_context.model_dump()
+                )
         except Exception:
             # Fail silently if no session context or other errors
             pass
 
+    async def save_profile_export(
+        self, profile_context: ProfileContext, profile_id: str, profile_hash: str
+    ) -> bool:
+        """
+        Save ProfileContext and queue the profile export in one transaction
+
+        Returns True if the export was queued now, False if there is no
+        session, the export could not be queued or the same export is still
+        pending (nothing new was queued).
+        """
+        try:
+            thread_id = cl.context.session.thread_id
+            data_layer = await self._get_data_layer()
+            payload = {
+                "profile_id": profile_id,
+                "content_hash": profile_hash,
+                "thread_id": thread_id,
+                "created_at": datetime.now().isoformat(),
+                "profile": profile_context.profile.model_dump(),
+            }
+            with timed("db_write", operation="save_profile_export"):
+                return await data_layer.save_profile_export(
+                    thread_id,
+                    profile_context.model_dump(),
+                    export_key(profile_id, profile_hash),
+                    payload,
+                )
+        except Exception as e:
+            logfire.warn(
+                "Profile export not queued in the outbox: {error}", error=str(e)
+            )
+            return False
+
+    async def get_export_status(
+        self, profile_id: str, profile_hash: str
+    ) -> Optional[str]:
+        """
+        Состояние экспорта этой версии профиля в outbox: "delivered",
+        "pending" или None (не ставился, заменен новой версией, нет БД)
+        """
+        try:
+            thread_id = cl.context.session.thread_id
+            data_layer = await self._get_data_layer()
+            return await data_layer.get_profile_export_status(
+                thread_id, export_key(profile_id, profile_hash)
+            )
+        except Exception:
+            return None
+
     async def get_profile_context(self, session_id: str) -> Optional[ProfileContext]:
         """Get ProfileContext from thread metadata"""
         try:
             data_layer = await self._get_data_layer()
-            thread = await data_layer.get_thread(session_id)
+            profile_data = await data_layer.get_profile_context_from_thread(session_id)
 
-            if thread and thread.get("metadata", {}).get("profile_context"):
-                profile_data = thread["metadata"]["profile_context"]
+            if profile_data:
                 return ProfileContext(**profile_data)
 
             return None
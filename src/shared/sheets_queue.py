@@ -0,0 +1,214 @@
+import asyncio
+import os
+import random
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+import logfire
+
+from .export_sinks import error_status, retry_after
+from .google_sheets import format_profile_row, get_sheets_manager
+from .metrics import registry
+from .schemas import CandidateProfile
+
+SHEETS_QUEUE_TASK = "sheets-export-queue"
+
+SHEETS_ROWS_TOTAL = "ai_hr_sheets_rows_total"
+SHEETS_RETRIES_TOTAL = "ai_hr_sheets_retries_total"
+SHEETS_QUEUE_DEPTH = "ai_hr_sheets_queue_depth"
+
+# Квота Sheets API (429) и временные ошибки сервера повторяем с backoff
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class SheetsExportQueue:
+    """
+    Асинхронная очередь экспорта профилей в Google Sheets.
+
+    ``submit`` форматирует строку и сразу возвращает управление агенту;
+    фоновая задача собирает строки, пришедшие в течение ``SHEETS_FLUSH_INTERVAL``
+    секунд (до ``SHEETS_BATCH_SIZE``), и отправляет их через ``upsert_rows``
+    (новые профили одним append_rows) в отдельном потоке, не блокируя event
+    loop. При 429/5xx пакет повторяется с экспоненциальной задержкой от
+    ``SHEETS_BACKOFF_BASE`` секунд (не дольше ``SHEETS_BACKOFF_MAX``, Retry-After
+    учитывается), всего ``SHEETS_MAX_RETRIES`` попыток. Очередь в памяти: строки, не отправленные до остановки процесса,
+    теряются.
+
+    ``manager_factory`` возвращает объект с методом ``upsert_rows(rows)``
+    (GoogleSheetsManager или локальный fake для тестов).
+    """
+
+    def __init__(
+        self,
+        manager_factory: Callable[[], Any] = get_sheets_manager,
+        max_size: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        interval: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        backoff_base: Optional[float] = None,
+        max_backoff: Optional[float] = None,
+    ):
+        self.manager_factory = manager_factory
+        self.max_size = max_size or int(os.getenv("SHEETS_QUEUE_SIZE", "1000"))
+        self.batch_size = batch_size or int(os.getenv("SHEETS_BATCH_SIZE", "50"))
+        self.interval = (
+            interval
+            if interval is not None
+            else float(os.getenv("SHEETS_FLUSH_INTERVAL", "1.0"))
+        )
+        self.max_retries = max_retries or int(os.getenv("SHEETS_MAX_RETRIES", "6"))
+        self.backoff_base = (
+            backoff_base
+            if backoff_base is not None
+            else float(os.getenv("SHEETS_BACKOFF_BASE", "1.0"))
+        )
+        self.max_backoff = (
+            max_backoff
+            if max_backoff is not None
+            else float(os.getenv("SHEETS_BACKOFF_MAX", "64"))
+        )
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_started(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue(maxsize=self.max_size)
+            self._worker = loop.create_task(
+                self._run(self._queue), name=SHEETS_QUEUE_TASK
+            )
+            self._loop = loop
+        return self._queue  # type: ignore[return-value]
+
+    def submit(self, profile: CandidateProfile, profile_id: str) -> bool:
+        """
+        Поставить профиль в очередь на сохранение
+
+        Строка формируется сразу, поэтому последующие изменения профиля в
+        диалоге на нее не влияют. Returns: False если очередь переполнена.
+        """
+        queue = self._ensure_started()
+        try:
+            queue.put_nowait((profile_id, format_profile_row(profile, profile_id)))
+        except asyncio.QueueFull:
+            logfire.warn(
+                "Sheets export queue is full, profile {profile_id} rejected",
+                profile_id=profile_id,
+            )
+            self._count("rejected")
+            return False
+        self._set_depth(queue)
+        return True
+
+    def pending(self) -> int:
+        """Строки, еще не отправленные в таблицу"""
+        if self._queue is None:
+            return 0
+        return self._queue.qsize()
+
+    async def flush(self):
+        """Дождаться отправки всех поставленных в очередь строк"""
+        if self._queue is None or self._loop is not asyncio.get_running_loop():
+            return
+        await self._queue.join()
+
+    async def close(self):
+        """Отправить оставшиеся строки и остановить фоновую задачу"""
+        await self.flush()
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+        self._queue = None
+        self._loop = None
+
+    async def _run(self, queue: asyncio.Queue):
+        while True:
+            batch = [await queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._append_with_backoff(batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+                self._set_depth(queue)
+
+    async def _append_with_backoff(self, batch: List[Tuple[str, List[str]]]):
+        profile_ids = [profile_id for profile_id, _ in batch]
+        rows = [row for _, row in batch]
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                manager = self.manager_factory()
+                if manager is None:
+                    raise RuntimeError("Google Sheets is not configured")
+                # gspread синхронный: HTTP-запросы в отдельном потоке
+                await asyncio.to_thread(manager.upsert_rows, rows)
+            except Exception as e:
+                status = error_status(e)
+                if status not in RETRYABLE_STATUS or attempt == self.max_retries:
+                    logfire.error(
+                        "Failed to save {count} profiles to Google Sheets: {error}",
+                        count=len(rows),
+                        error=str(e),
+                        profile_ids=profile_ids,
+                        attempts=attempt,
+                    )
+                    self._count("failed", len(rows))
+                    return
+                # 1, 2, 4, ... * base с джиттером, чтобы воркеры не били в квоту разом
+                delay = retry_after(e) or min(
+                    self.max_backoff,
+                    self.backoff_base * (2 ** (attempt - 1) + random.uniform(0, 1)),
+                )
+                logfire.warn(
+                    "Google Sheets returned {status}, retrying in {delay}s",
+                    status=status,
+                    delay=round(delay, 1),
+                )
+                registry.counter(
+                    SHEETS_RETRIES_TOTAL, "Google Sheets append retries"
+                ).inc(status=str(status))
+                await asyncio.sleep(delay)
+            else:
+                logfire.info(
+                    "Saved {count} profiles to Google Sheets",
+                    count=len(rows),
+                    profile_ids=profile_ids,
+                )
+                self._count("saved", len(rows))
+                return
+
+    def _count(self, status: str, amount: int = 1):
+        registry.counter(
+            SHEETS_ROWS_TOTAL, "Profiles exported to Google Sheets by status"
+        ).inc(amount, status=status)
+
+    def _set_depth(self, queue: asyncio.Queue):
+        registry.gauge(
+            SHEETS_QUEUE_DEPTH, "Profiles waiting in the Google Sheets export queue"
+        ).set(queue.qsize())
+
+
+# Глобальная очередь экспорта
+_sheets_queue: Optional[SheetsExportQueue] = None
+
+
+def get_sheets_queue() -> SheetsExportQueue:
+    """Получить очередь экспорта профилей в Google Sheets"""
+    global _sheets_queue
+
+    if _sheets_queue is None:
+        _sheets_queue = SheetsExportQueue()
+    return _sheets_queue
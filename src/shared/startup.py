@@ -0,0 +1,88 @@
+"""
+Фоновый прогрев процесса после старта сервера
+"""
+
+import asyncio
+import os
+from typing import Dict, Optional
+
+import logfire
+
+from .metrics import timed
+
+STARTUP_PREWARM_TASK = "startup-prewarm"
+
+_prewarm_task: Optional[asyncio.Task] = None
+
+
+async def _prewarm_pdf():
+    from .pdf_processor import prewarm
+
+    await asyncio.to_thread(prewarm)
+
+
+async def _prewarm_model():
+    from ..hr_agent.agent import prewarm_model
+
+    await asyncio.to_thread(prewarm_model)
+
+
+async def _prewarm_db_pool():
+    from ..database.config import prewarm_pool
+
+    await prewarm_pool()
+
+
+PREWARM_STEPS = {
+    "tokenizer": _prewarm_pdf,
+    "model": _prewarm_model,
+    "db_pool": _prewarm_db_pool,
+}
+
+
+async def prewarm() -> Dict[str, bool]:
+    """
+    Загрузить то, что иначе грузится на первом запросе: токенизатор и pypdf,
+    провайдер OpenAI, соединения пула БД. Ошибки шагов не прерывают прогрев.
+    Returns: шаг -> успешен ли он
+    """
+    results = {}
+    for name, step in PREWARM_STEPS.items():
+        try:
+            with timed("startup_prewarm", step=name):
+                await step()
+            results[name] = True
+        except Exception as e:
+            logfire.warn("Prewarm step {step} failed: {error}", step=name, error=str(e))
+            results[name] = False
+    return results
+
+
+def _start_prewarm():
+    global _prewarm_task
+
+    _prewarm_task = asyncio.get_running_loop().create_task(
+        prewarm(), name=STARTUP_PREWARM_TASK
+    )
+
+
+def schedule_prewarm() -> bool:
+    """
+    Запланировать прогрев через STARTUP_PREWARM_DELAY секунд, когда сервер
+    уже принимает соединения (on_app_startup выполняется до этого).
+    Отключается через STARTUP_PREWARM=false.
+    """
+    if os.getenv("STARTUP_PREWARM", "true").lower() != "true":
+        return False
+    delay = float(os.getenv("STARTUP_PREWARM_DELAY", "1"))
+    asyncio.get_running_loop().call_later(delay, _start_prewarm)
+    return True
+
+
+def stop_prewarm():
+    """Прервать незавершенный прогрев (остановка приложения)"""
+    global _prewarm_task
+
+    if _prewarm_task is not None:
+        _prewarm_task.cancel()
+        _prewarm_task = None
@@ -0,0 +1,67 @@
+from typing import Dict, Optional
+import chainlit as cl
+from pydantic_ai.messages import ModelResponse
+from pydantic_ai.usage import RunUsage
+
+from .logger_config import log_token_usage
+
+
+def usage_to_dict(usage: RunUsage) -> Dict[str, int]:
+    """Token counters of an agent run that we account for"""
+    return {
+        "requests": usage.requests,
+        "input_tokens": usage.input_tokens,
+        "cached_input_tokens": usage.cache_read_tokens,
+        "output_tokens": usage.output_tokens,
+    }
+
+
+def get_response_model_name(result) -> Optional[str]:
+    """Model name of the last model response of an agent run"""
+    for message in reversed(result.new_messages()):
+        if isinstance(message, ModelResponse) and message.model_name:
+            return message.model_name
+    return None
+
+
+class TokenUsageTracker:
+    """Persist per-turn token usage of the agent per thread and user"""
+
+    def __init__(self):
+        self.data_layer = None
+
+    async def _get_data_layer(self):
+        if self.data_layer is None:
+            from ..database.data_layer import get_data_layer
+
+            self.data_layer = await get_data_layer()
+        return self.data_layer
+
+    async def record_run(self, result):
+        """Save usage of a finished agent run for the current Chainlit thread"""
+        usage = usage_to_dict(result.usage())
+        model = get_response_model_name(result)
+        try:
+            thread_id = cl.context.session.thread_id
+            user = cl.context.session.user
+            user_identifier = user.identifier if user else None
+        except Exception:
+            # Нет контекста Chainlit
+            return
+
+        log_token_usage(thread_id, usage, user_identifier=user_identifier, model=model)
+
+        try:
+            data_layer = await self._get_data_layer()
+            await data_layer.record_token_usage(
+                thread_id=thread_id,
+                usage=usage,
+                user_identifier=user_identifier,
+                model=model,
+            )
+        except Exception:
+            # Учет токенов не должен ломать ответ пользователю
+            pass
+
+
+usage_tracker = TokenUsageTracker()
@@ -0,0 +1,49 @@
+"""
+Database tests run on the embedded SQLite backend (src/database/dialect.py),
+so they need no PostgreSQL server. The process-wide engine is created from
+DATABASE_URL on import, so the URL is set before anything imports src.database.
+"""
+
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+_DATABASE_DIR = tempfile.mkdtemp(prefix="ai-hr-tests-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_DATABASE_DIR}/test.db"
+os.environ.setdefault("LOGFIRE_IGNORE_NO_CONFIG", "1")
+os.environ.setdefault("LOGFIRE_CONSOLE", "false")
+
+
+async def reset_database():
+    """Create the schema once and empty every table"""
+    from src.database.config import Base, engine, init_schema
+
+    await init_schema()
+    async with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            await conn.execute(table.delete())
+
+
+@pytest.fixture
+def run_db():
+    """
+    ``run_db(scenario)`` runs the coroutine function ``scenario`` on an empty
+    database in a new event loop, then closes the pooled connections (they
+    belong to that loop)
+    """
+
+    def run(scenario):
+        async def main():
+            from src.database.config import dispose_engine
+
+            await reset_database()
+            try:
+                return await scenario()
+            finally:
+                await dispose_engine()
+
+        return asyncio.run(main())
+
+    return run
@@ -0,0 +1,153 @@
+"""
+Archival of inactive threads into threads_archive and rehydration when a
+thread is opened again (src/database/archive.py).
+"""
+
+import os
+import uuid
+from uuid import UUID
+
+import pytest
+from sqlalchemy import func, select
+
+from src.database.archive import (
+    ARCHIVED_KEY,
+    archive_inactive_threads,
+    count_inactive_threads,
+    cutoff_for,
+    rehydrate_thread,
+)
+from src.database.config import AsyncSessionLocal
+from src.database.data_layer import CustomSQLAlchemyDataLayer
+from src.database.models import Element, Feedback, Step, Thread, ThreadArchive
+
+OLD = "2025-01-01T00:00:00"
+
+
+@pytest.fixture
+def data_layer(monkeypatch):
+    monkeypatch.setenv("DB_WRITE_BEHIND", "false")
+    monkeypatch.setenv("DB_CACHE_TTL", "0")
+    return CustomSQLAlchemyDataLayer(conninfo=os.environ["DATABASE_URL"])
+
+
+async def create_thread(data_layer, step_times):
+    """A thread created long ago with steps, an element and a feedback"""
+    thread_id = str(uuid.uuid4())
+    await data_layer.create_thread(
+        {  # type: ignore[typeddict-item]
+            "id": thread_id,
+            "name": "interview",
+            "createdAt": OLD,
+            "metadata": {"profile_context": {"stage": "b"}},
+            "tags": [],
+        }
+    )
+    step_ids = []
+    for index, created_at in enumerate(step_times):
+        step_id = str(uuid.uuid4())
+        await data_layer.create_step(
+            {  # type: ignore[typeddict-item]
+                "id": step_id,
+                "threadId": thread_id,
+                "name": f"step {index}",
+                "type": "user_message",
+                "output": str(index),
+                "metadata": {"index": index},
+                "createdAt": created_at,
+            }
+        )
+        step_ids.append(step_id)
+    async with AsyncSessionLocal() as session:
+        session.add(
+            Element(threadId=UUID(thread_id), name="cv.pdf", forId=UUID(step_ids[0]))
+        )
+        session.add(
+            Feedback(threadId=UUID(thread_id), forId=UUID(step_ids[0]), value=1)
+        )
+        await session.commit()
+    return thread_id
+
+
+async def child_rows(thread_id: str):
+    async with AsyncSessionLocal() as session:
+        return [
+            await session.scalar(
+                select(func.count()).where(model.threadId == UUID(thread_id))
+            )
+            for model in (Step, Element, Feedback)
+        ]
+
+
+def test_inactive_threads_are_archived_and_rehydrated(run_db, data_layer):
+    async def scenario():
+        inactive = await create_thread(data_layer, [OLD, "2025-01-02T00:00:00"])
+        # Created long ago, but with a step from today
+        active = await create_thread(data_layer, [OLD, cutoff_for(0)])
+
+        assert await count_inactive_threads(AsyncSessionLocal, cutoff_for(90)) == 1
+        assert await archive_inactive_threads(AsyncSessionLocal, 90, pause=0) == 1
+        # Archived threads are not candidates any more
+        assert await archive_inactive_threads(AsyncSessionLocal, 90, pause=0) == 0
+
+        archived = {
+            "children": await child_rows(inactive),
+            "active_children": await child_rows(active),
+        }
+        async with AsyncSessionLocal() as session:
+            stub = await session.get(Thread, UUID(inactive))
+            archived["metadata"] = stub.metadata_
+            archive = await session.get(ThreadArchive, UUID(inactive))
+            archived["archive"] = (archive.codec, archive.steps)
+
+        # Opening the thread brings the child rows back
+        thread = await data_layer.get_thread(inactive)
+        async with AsyncSessionLocal() as session:
+            left = await session.get(ThreadArchive, UUID(inactive))
+        return archived, thread, left
+
+    archived, thread, left = run_db(scenario)
+    assert archived["children"] == [0, 0, 0]
+    assert archived["active_children"] == [2, 1, 1]
+    assert archived["archive"] == ("gzip", 2)
+    # The stub keeps its metadata next to the marker
+    assert archived["metadata"]["profile_context"] == {"stage": "b"}
+    assert ARCHIVED_KEY in archived["metadata"]
+
+    assert [step["output"] for step in thread["steps"]] == ["0", "1"]
+    assert [step["metadata"] for step in thread["steps"]] == [
+        {"index": 0},
+        {"index": 1},
+    ]
+    assert [element["name"] for element in thread["elements"]] == ["cv.pdf"]
+    assert thread["metadata"] == {"profile_context": {"stage": "b"}}
+    assert left is None
+
+
+def test_rehydrate_skips_threads_that_are_not_archived(run_db, data_layer):
+    async def scenario():
+        thread_id = await create_thread(data_layer, [OLD])
+        await archive_inactive_threads(AsyncSessionLocal, 90, pause=0)
+        first = await rehydrate_thread(AsyncSessionLocal, UUID(thread_id))
+        # A second worker opening the same thread finds nothing to restore
+        second = await rehydrate_thread(AsyncSessionLocal, UUID(thread_id))
+        return first, second, await child_rows(thread_id)
+
+    assert run_db(scenario) == (True, False, [1, 1, 1])
+
+
+def test_archive_batches(run_db, data_layer):
+    async def scenario():
+        for _ in range(5):
+            await create_thread(data_layer, [OLD])
+        first = await archive_inactive_threads(
+            AsyncSessionLocal, 90, batch_size=2, max_batches=2, pause=0
+        )
+        rest = await archive_inactive_threads(
+            AsyncSessionLocal, 90, batch_size=2, pause=0
+        )
+        async with AsyncSessionLocal() as session:
+            stubs = await session.scalar(select(func.count()).select_from(Thread))
+        return first, rest, stubs
+
+    assert run_db(scenario) == (4, 1, 5)
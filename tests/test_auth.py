@@ -0,0 +1,230 @@
+"""
+AuthManager: rate limiting, shared checks, verified-password cache and
+overload shedding of the async login path (src/auth/auth.py).
+"""
+
+import asyncio
+import threading
+import time
+
+import bcrypt
+import pytest
+
+from src.auth.auth import AUTH_ATTEMPTS, AuthManager, LoginRateLimiter
+from src.auth.store import MemoryCredentialStore
+from src.shared.metrics import registry
+
+# Cheap hashes: the tests count bcrypt calls, they do not time them
+FAST_SALT = bcrypt.gensalt(4)
+
+
+def attempts(result: str) -> float:
+    return registry.counter(AUTH_ATTEMPTS, "Login attempts by result").value(
+        result=result
+    )
+
+
+class CountingAuthManager(AuthManager):
+    """AuthManager counting bcrypt checks; ``gate`` holds them until set"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.checks = 0
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def verify_password(self, plain_password: str, hashed_password: bytes) -> bool:
+        self.checks += 1
+        self.gate.wait(5)
+        return super().verify_password(plain_password, hashed_password)
+
+
+@pytest.fixture
+def auth(monkeypatch):
+    monkeypatch.setenv("AUTH_WORKERS", "4")
+    monkeypatch.setenv("AUTH_MAX_PENDING", "32")
+    monkeypatch.setenv("AUTH_MAX_FAILURES", "3")
+    monkeypatch.setenv("AUTH_FAILURE_WINDOW", "300")
+    monkeypatch.setenv("CHAINLIT_USER_PASSWORD_HASH", "")
+    manager = CountingAuthManager(store=MemoryCredentialStore())
+    yield manager
+    manager._executor.shutdown(wait=True)
+
+
+async def add_user(auth: AuthManager, username: str, password: str):
+    await auth.store.add(username, bcrypt.hashpw(password.encode(), FAST_SALT), "user")
+
+
+async def wait_for_checks(auth: CountingAuthManager, count: int):
+    """Until ``count`` bcrypt checks are running in the pool"""
+    for _ in range(500):
+        if auth.checks >= count:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"{auth.checks} checks started, expected {count}")
+
+
+def test_lockout_after_max_failures(auth):
+    async def scenario():
+        await add_user(auth, "alice", "secret")
+        for index in range(3):
+            assert await auth.authenticate_async("alice", f"wrong-{index}") is None
+        checks = auth.checks
+        limited = attempts("rate_limited")
+
+        # The right password is rejected too, without a bcrypt check
+        assert await auth.authenticate_async("alice", "secret") is None
+        assert auth.checks == checks
+        assert attempts("rate_limited") == limited + 1
+
+        # Other users are not affected
+        await add_user(auth, "bob", "secret")
+        assert await auth.authenticate_async("bob", "secret") is not None
+
+    asyncio.run(scenario())
+
+
+def test_lockout_does_not_block_a_recently_verified_password(auth):
+    async def scenario():
+        await add_user(auth, "alice", "secret")
+        assert await auth.authenticate_async("alice", "secret") is not None
+        checks = auth.checks
+        # Someone else guesses the password until the name is locked
+        for index in range(3):
+            assert await auth.authenticate_async("alice", f"wrong-{index}") is None
+        assert await auth.authenticate_async("alice", "wrong-3") is None
+
+        # The real user still gets in, from the cache and without bcrypt
+        assert await auth.authenticate_async("alice", "secret") is not None
+        assert auth.checks == checks + 3
+        # The lock still holds for every other password
+        assert auth.limiter.is_limited("alice")
+        assert await auth.authenticate_async("alice", "wrong-4") is None
+        assert auth.checks == checks + 3
+
+    asyncio.run(scenario())
+
+
+def test_failures_expire_and_success_resets():
+    limiter = LoginRateLimiter(max_failures=2, window=0.05)
+    limiter.failure("alice")
+    limiter.failure("alice")
+    assert limiter.is_limited("alice")
+    time.sleep(0.06)
+    assert not limiter.is_limited("alice")
+
+    limiter.failure("alice")
+    limiter.success("alice")
+    limiter.failure("alice")
+    assert not limiter.is_limited("alice")
+    # Checks still running count as failures
+    assert limiter.is_limited("alice", in_flight=1)
+
+
+def test_parallel_burst_is_capped_by_in_flight_checks(auth):
+    async def scenario():
+        await add_user(auth, "alice", "secret")
+        auth.gate.clear()
+        burst = [
+            asyncio.create_task(auth.authenticate_async("alice", f"wrong-{index}"))
+            for index in range(10)
+        ]
+        await wait_for_checks(auth, 3)
+        await asyncio.sleep(0.05)
+        auth.gate.set()
+        results = await asyncio.gather(*burst)
+
+        assert results == [None] * 10
+        # Only max_failures wrong passwords reach bcrypt, like a sequential attack
+        assert auth.checks == 3
+        assert auth._user_pending == {}
+        assert auth._pending == 0
+
+    asyncio.run(scenario())
+
+
+def test_identical_attempts_share_one_check(auth):
+    async def scenario():
+        await add_user(auth, "alice", "secret")
+        auth.gate.clear()
+        first = asyncio.create_task(auth.authenticate_async("alice", "secret"))
+        await wait_for_checks(auth, 1)
+        shared = attempts("shared")
+        others = [
+            asyncio.create_task(auth.authenticate_async("alice", "secret"))
+            for _ in range(4)
+        ]
+        await asyncio.sleep(0.05)
+        auth.gate.set()
+        users = await asyncio.gather(first, *others)
+
+        assert all(user is not None for user in users)
+        assert auth.checks == 1
+        assert attempts("shared") == shared + 4
+        assert auth._inflight == {}
+
+    asyncio.run(scenario())
+
+
+def test_verified_cache_skips_bcrypt(auth):
+    async def scenario():
+        await add_user(auth, "alice", "secret")
+        assert await auth.authenticate_async("alice", "secret") is not None
+        cached = attempts("cached")
+
+        assert await auth.authenticate_async("alice", "secret") is not None
+        assert auth.checks == 1
+        assert attempts("cached") == cached + 1
+
+        # A wrong password is never answered from the cache
+        assert await auth.authenticate_async("alice", "wrong") is None
+        assert auth.checks == 2
+
+    asyncio.run(scenario())
+
+
+def test_add_user_invalidates_caches(auth, monkeypatch):
+    monkeypatch.setattr(bcrypt, "gensalt", lambda: FAST_SALT)
+
+    async def scenario():
+        # A miss is cached as "no such user"
+        assert await auth.authenticate_async("carol", "secret") is None
+        # A stale verified entry, as if carol had logged in with another password
+        auth.verified.remember("carol", "old-password")
+
+        assert await auth.add_user("carol", "secret")
+        assert not auth.verified.is_verified("carol", "old-password")
+        assert await auth.authenticate_async("carol", "secret") is not None
+        assert await auth.authenticate_async("carol", "old-password") is None
+
+        # An existing login is not overwritten
+        assert not await auth.add_user("carol", "other")
+        assert await auth.authenticate_async("carol", "secret") is not None
+
+    asyncio.run(scenario())
+
+
+def test_overloaded_pool_sheds_logins(auth):
+    auth.max_pending = 2
+
+    async def scenario():
+        for index in range(5):
+            await add_user(auth, f"user{index}", "secret")
+        overloaded = attempts("overloaded")
+        auth.gate.clear()
+        logins = [
+            asyncio.create_task(auth.authenticate_async(f"user{index}", "secret"))
+            for index in range(5)
+        ]
+        await wait_for_checks(auth, 2)
+        await asyncio.sleep(0.05)
+        auth.gate.set()
+        users = await asyncio.gather(*logins)
+
+        assert sum(user is not None for user in users) == 2
+        assert auth.checks == 2
+        assert attempts("overloaded") == overloaded + 3
+        # Shed logins are not failures: the users are not locked out
+        assert await auth.authenticate_async("user4", "secret") is not None
+
+    asyncio.run(scenario())
@@ -0,0 +1,185 @@
+"""
+Data layer read caches: TTL/LRU, copies, version fencing of in-flight reads
+and invalidation by writes and by other workers (src/database/cache.py).
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+
+import pytest
+
+from src.database.cache import (
+    _MISSING,
+    InvalidationListener,
+    TTLCache,
+    copy_thread,
+    invalidation_payloads,
+    run_with_cache,
+)
+from src.database.data_layer import CustomSQLAlchemyDataLayer
+
+
+def test_ttl_and_lru_eviction():
+    cache = TTLCache("test", maxsize=2, ttl=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    # "b" is the least recently used one
+    cache.set("c", 3)
+    assert cache.get("b") is _MISSING
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a") is _MISSING
+
+
+def test_callers_get_copies():
+    cache = TTLCache("test", maxsize=10, ttl=60)
+    value = {"metadata": {"profile_context": {"stage": "a"}}}
+    cache.set("t", value)
+    value["metadata"]["profile_context"]["stage"] = "changed"
+    cached = cache.get("t")
+    cached["metadata"]["profile_context"]["stage"] = "changed again"
+    assert cache.get("t") == {"metadata": {"profile_context": {"stage": "a"}}}
+
+
+def test_copy_thread_copies_what_callers_change():
+    thread = {
+        "id": "t",
+        "metadata": {"profile_context": {"company_info_pdf": "x" * 1000}},
+        "steps": [{"id": "s", "metadata": {"k": 1}}],
+        "elements": None,
+    }
+    copied = copy_thread(thread)
+    copied["name"] = "renamed"
+    copied["metadata"].pop("profile_context")
+    copied["steps"][0]["output"] = "changed"
+    assert "name" not in thread
+    assert "profile_context" in thread["metadata"]
+    assert "output" not in thread["steps"][0]
+    # Below the step dicts everything is shared
+    assert copied["steps"][0]["metadata"] is thread["steps"][0]["metadata"]
+
+
+@pytest.mark.parametrize("invalidate", ["key", "clear"])
+def test_read_started_before_an_invalidation_is_not_stored(invalidate):
+    cache = TTLCache("test", maxsize=10, ttl=60)
+
+    async def scenario():
+        loading, release = asyncio.Event(), asyncio.Event()
+
+        async def load():
+            loading.set()
+            await release.wait()
+            return "stale"
+
+        reader = asyncio.create_task(run_with_cache(cache, "t", load))
+        await loading.wait()
+        # A write lands while the reader still holds the old row
+        if invalidate == "key":
+            cache.invalidate("t")
+        else:
+            cache.clear()
+        release.set()
+        assert await reader == "stale"
+
+        async def fresh():
+            return "fresh"
+
+        return await run_with_cache(cache, "t", fresh)
+
+    assert asyncio.run(scenario()) == "fresh"
+
+
+def test_misses_are_not_cached_by_default():
+    cache = TTLCache("test", maxsize=10, ttl=60)
+    calls = []
+
+    async def load():
+        calls.append(1)
+        return None
+
+    async def scenario():
+        await run_with_cache(cache, "missing", load)
+        await run_with_cache(cache, "missing", load)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+
+
+def test_data_layer_writes_invalidate_cached_threads(run_db, monkeypatch):
+    monkeypatch.setenv("DB_CACHE_TTL", "60")
+    data_layer = CustomSQLAlchemyDataLayer(conninfo=os.environ["DATABASE_URL"])
+    thread_id = str(uuid.uuid4())
+
+    async def scenario():
+        await data_layer.create_thread(
+            {"id": thread_id, "name": "before", "metadata": {}, "tags": []}  # type: ignore[typeddict-item]
+        )
+        assert (await data_layer.get_thread(thread_id))["name"] == "before"
+        assert data_layer.thread_cache.get(thread_id) is not _MISSING
+
+        await data_layer.update_thread_name(thread_id, "after")
+        assert (await data_layer.get_thread(thread_id))["name"] == "after"
+
+        # A buffered step is flushed and the cached thread dropped
+        await data_layer.create_step(
+            {  # type: ignore[typeddict-item]
+                "id": str(uuid.uuid4()),
+                "threadId": thread_id,
+                "name": "step",
+                "type": "user_message",
+                "output": "hello",
+            }
+        )
+        thread = await data_layer.get_thread(thread_id)
+        await data_layer.update_thread_profile_context(thread_id, {"stage": "b"})
+        metadata = (await data_layer.get_thread(thread_id))["metadata"]
+        await data_layer.close()
+        return thread, metadata
+
+    thread, metadata = run_db(scenario)
+    assert [step["output"] for step in thread["steps"]] == ["hello"]
+    assert metadata["profile_context"] == {"stage": "b"}
+
+
+def test_remote_invalidation_and_reconnect_clear_the_cache(monkeypatch):
+    monkeypatch.setenv("DB_CACHE_TTL", "60")
+    data_layer = CustomSQLAlchemyDataLayer(conninfo=os.environ["DATABASE_URL"])
+    listener = InvalidationListener(
+        "postgresql://unused",
+        data_layer._on_remote_invalidation,
+        on_reconnect=data_layer._clear_caches,
+    )
+    for key in ("t1", "t2", "t3"):
+        data_layer.thread_cache.set(key, {"id": key})
+    data_layer.user_cache.set("alice", {"identifier": "alice"})
+
+    def notify(payload: str):
+        listener._handle(None, 0, "channel", payload)
+
+    def cached(key: str) -> bool:
+        return data_layer.thread_cache.get(key) is not _MISSING
+
+    # Own notifications were applied locally already
+    for payload in invalidation_payloads("thread", ["t1"]):
+        notify(payload)
+    assert cached("t1")
+
+    notify(json.dumps({"origin": "other", "kind": "thread", "keys": ["t1"]}))
+    notify("not json")
+    assert not cached("t1")
+    assert cached("t2")
+
+    # No keys: the whole cache of that kind
+    notify(json.dumps({"origin": "other", "kind": "thread", "keys": []}))
+    assert not cached("t2")
+    assert data_layer.user_cache.get("alice") is not _MISSING
+
+    # Notifications may have been missed while the connection was down
+    data_layer.thread_cache.set("t3", {"id": "t3"})
+    data_layer._clear_caches()
+    assert not cached("t3")
+    assert data_layer.user_cache.get("alice") is _MISSING
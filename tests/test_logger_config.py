@@ -0,0 +1,56 @@
+"""
+BackgroundLogEmitter: failed and dropped payload log records are counted
+and reported instead of being swallowed (src/shared/logger_config.py).
+"""
+
+import threading
+
+from src.shared.logger_config import LOG_EMITTER_RECORDS, BackgroundLogEmitter
+from src.shared.metrics import registry
+
+
+def records(result: str) -> float:
+    return registry.counter(LOG_EMITTER_RECORDS, "").value(result=result)
+
+
+def test_failed_records_are_counted_and_warned_once(capsys):
+    emitter = BackgroundLogEmitter(max_queue_size=10)
+    failed = records("failed")
+
+    def broken():
+        raise ValueError("exporter is down")
+
+    for _ in range(3):
+        emitter.submit(broken)
+    emitted = []
+    emitter.submit(lambda: emitted.append(True))
+    emitter.flush()
+
+    # Later records are still emitted
+    assert emitted == [True]
+    assert emitter.failed == 3
+    assert records("failed") == failed + 3
+    # One warning per LOG_EMITTER_WARN_INTERVAL
+    assert capsys.readouterr().err.count("log-emitter:") == 1
+
+
+def test_full_queue_drops_and_counts():
+    emitter = BackgroundLogEmitter(max_queue_size=1)
+    dropped = records("dropped")
+    started, gate = threading.Event(), threading.Event()
+
+    def blocking():
+        started.set()
+        gate.wait(5)
+
+    # The first record blocks the thread, the second fills the queue
+    emitter.submit(blocking)
+    assert started.wait(5)
+    emitter.submit(lambda: None)
+    emitter.submit(lambda: None)
+    emitter.submit(lambda: None)
+    gate.set()
+    emitter.flush()
+
+    assert emitter.dropped == 2
+    assert records("dropped") == dropped + 2
@@ -0,0 +1,189 @@
+"""
+Transactional outbox of profile exports: leases, retries, superseded
+versions, re-exports under a new generation and retention (src/database/outbox.py).
+"""
+
+import json
+import os
+import uuid
+from datetime import timedelta
+from uuid import UUID
+
+import pytest
+from sqlalchemy import select
+
+from src.database.config import AsyncSessionLocal
+from src.database.data_layer import CustomSQLAlchemyDataLayer
+from src.database.models import ProfileOutbox
+from src.database.outbox import (
+    OutboxDispatcher,
+    _now,
+    delivery_key,
+    export_status,
+    outbox_insert,
+    prune_dispatched,
+)
+from src.shared.export_sinks import IDEMPOTENCY_KEY, FileSink
+
+
+class FlakySink:
+    """Sink failing the first ``failures`` deliveries"""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.records = []
+
+    async def deliver(self, records):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("sink unavailable")
+        self.records.extend(records)
+
+
+@pytest.fixture
+def data_layer(monkeypatch, tmp_path):
+    monkeypatch.setenv("DB_WRITE_BEHIND", "false")
+    monkeypatch.setenv("DB_CACHE_TTL", "0")
+    data_layer = CustomSQLAlchemyDataLayer(conninfo=os.environ["DATABASE_URL"])
+    data_layer.outbox = OutboxDispatcher(
+        AsyncSessionLocal,
+        {"file": FileSink("file", str(tmp_path / "profiles.jsonl"))},
+        batch_size=10,
+        backoff_base=60,
+    )
+    return data_layer
+
+
+async def save(data_layer, thread_id: str, version: str) -> bool:
+    return await data_layer.save_profile_export(
+        thread_id, {"stage": version}, version, {"profile_id": thread_id}
+    )
+
+
+def exported_keys(tmp_path):
+    with open(tmp_path / "profiles.jsonl", encoding="utf-8") as f:
+        return [json.loads(line)[IDEMPOTENCY_KEY] for line in f]
+
+
+def test_leased_rows_are_not_leased_again(run_db):
+    dispatcher = OutboxDispatcher(
+        AsyncSessionLocal, {"flaky": FlakySink()}, batch_size=2, lease=60
+    )
+
+    async def scenario():
+        async with AsyncSessionLocal() as session:
+            for index in range(3):
+                await session.execute(
+                    outbox_insert(uuid.uuid4(), f"key-{index}", {}, ["flaky"])
+                )
+            await session.commit()
+        # Another worker holds the first batch until its lease expires
+        first = await dispatcher._lease("flaky")
+        second = await dispatcher._lease("flaky")
+        third = await dispatcher._lease("flaky")
+        return first, second, third
+
+    first, second, third = run_db(scenario)
+    assert [row.idempotencyKey for row in first] == ["key-0", "key-1"]
+    assert [row.idempotencyKey for row in second] == ["key-2"]
+    assert [row.attempts for row in first + second] == [1, 1, 1]
+    assert third == []
+
+
+def test_failed_delivery_is_retried_after_backoff(run_db):
+    sink = FlakySink(failures=1)
+    dispatcher = OutboxDispatcher(AsyncSessionLocal, {"flaky": sink}, backoff_max=60)
+    thread_id = uuid.uuid4()
+
+    async def scenario():
+        async with AsyncSessionLocal() as session:
+            await session.execute(outbox_insert(thread_id, "a", {"v": 1}, ["flaky"]))
+            await session.commit()
+        assert await dispatcher.dispatch_sink("flaky") == 0
+        # Not due before the backoff is over
+        assert await dispatcher.dispatch_sink("flaky") == 0
+        async with AsyncSessionLocal() as session:
+            row = await session.scalar(select(ProfileOutbox))
+            failed = (row.lastError, row.attempts)
+            row.nextAttemptAt = _now() - timedelta(seconds=1)
+            await session.commit()
+        delivered = await dispatcher.dispatch_sink("flaky")
+        return failed, delivered, await export_status(AsyncSessionLocal, thread_id, "a")
+
+    assert run_db(scenario) == (("sink unavailable", 1), 1, "delivered")
+    assert sink.records == [{IDEMPOTENCY_KEY: "a", "v": 1}]
+
+
+def test_changed_profile_supersedes_and_old_version_is_exported_again(
+    run_db, data_layer, tmp_path
+):
+    thread_id = str(uuid.uuid4())
+    dispatcher = data_layer.outbox
+
+    async def status(version):
+        return await data_layer.get_profile_export_status(thread_id, version)
+
+    async def scenario():
+        statuses = []
+        assert await save(data_layer, thread_id, "A")
+        # Saving the same version again while it is pending queues nothing
+        assert not await save(data_layer, thread_id, "A")
+
+        # B replaces A before A was delivered
+        assert await save(data_layer, thread_id, "B")
+        statuses.append((await status("A"), await status("B")))
+        assert await dispatcher.dispatch_once() == 1
+        statuses.append((await status("A"), await status("B")))
+
+        # Back to A: queued again under a new generation
+        assert await save(data_layer, thread_id, "A")
+        statuses.append((await status("A"), await status("B")))
+        assert await dispatcher.dispatch_once() == 1
+        statuses.append((await status("A"), await status("B")))
+
+        metadata = await data_layer.get_thread_metadata(thread_id)
+        return statuses, metadata
+
+    statuses, metadata = run_db(scenario)
+    assert statuses == [
+        (None, "pending"),
+        (None, "delivered"),
+        ("pending", None),
+        ("delivered", None),
+    ]
+    assert exported_keys(tmp_path) == ["B", delivery_key("A", 1)]
+    assert delivery_key("A", 1) == "A#1"
+    assert metadata["profile_context"] == {"stage": "A"}
+
+
+def test_prune_keeps_the_latest_row_of_each_thread(run_db, data_layer):
+    thread_id = str(uuid.uuid4())
+    dispatcher = data_layer.outbox
+
+    async def scenario():
+        await save(data_layer, thread_id, "A")
+        await dispatcher.dispatch_once()
+        await save(data_layer, thread_id, "B")
+        await dispatcher.dispatch_once()
+        async with AsyncSessionLocal() as session:
+            # An export without a thread goes by age alone
+            await session.execute(outbox_insert(None, "orphan", {}, ["file"]))
+            await session.commit()
+        await dispatcher.dispatch_once()
+
+        kept = await prune_dispatched(AsyncSessionLocal, retention_days=1)
+        pruned = await prune_dispatched(AsyncSessionLocal, retention_days=0)
+        async with AsyncSessionLocal() as session:
+            left = (await session.scalars(select(ProfileOutbox.idempotencyKey))).all()
+        return kept, pruned, left
+
+    kept, pruned, left = run_db(scenario)
+    assert (kept, pruned) == (0, 2)
+    assert left == ["B"]
+
+
+def test_export_status_of_unknown_keys(run_db):
+    async def scenario():
+        return await export_status(AsyncSessionLocal, UUID(int=0), "missing")
+
+    assert run_db(scenario) is None
@@ -0,0 +1,126 @@
+"""
+Keyset pagination of thread listings (newest first) and thread steps
+(oldest first) by (createdAt, id) (src/database/data_layer.py).
+"""
+
+import os
+import uuid
+
+import pytest
+
+from src.database.data_layer import CustomSQLAlchemyDataLayer, decode_cursor
+
+SAME_TIME = "2026-01-01T12:00:00"
+
+
+@pytest.fixture
+def data_layer(monkeypatch):
+    monkeypatch.setenv("DB_WRITE_BEHIND", "false")
+    monkeypatch.setenv("DB_CACHE_TTL", "0")
+    return CustomSQLAlchemyDataLayer(conninfo=os.environ["DATABASE_URL"])
+
+
+async def create_threads(data_layer, user: str, created_at):
+    ids = []
+    for index, timestamp in enumerate(created_at):
+        thread_id = str(uuid.uuid4())
+        await data_layer.create_thread(
+            {  # type: ignore[typeddict-item]
+                "id": thread_id,
+                "name": f"thread {index}",
+                "userIdentifier": user,
+                "createdAt": timestamp,
+                "metadata": {},
+                "tags": [],
+            }
+        )
+        ids.append(thread_id)
+    return ids
+
+
+async def all_thread_pages(data_layer, user: str, limit: int):
+    pages, cursor = [], None
+    while True:
+        page = await data_layer.list_user_threads_page(user, limit=limit, cursor=cursor)
+        pages.append([thread["id"] for thread in page.data])
+        if not page.pageInfo.hasNextPage:
+            return pages
+        cursor = page.pageInfo.endCursor
+
+
+def test_thread_pages_split_ties_on_created_at(run_db, data_layer):
+    async def scenario():
+        # Seven threads share one createdAt: only the id orders them
+        created_at = [SAME_TIME] * 7 + ["2026-01-01T11:00:00", "2026-01-01T13:00:00"]
+        ids = await create_threads(data_layer, "alice", created_at)
+        await create_threads(data_layer, "bob", [SAME_TIME] * 3)
+        return ids, await all_thread_pages(data_layer, "alice", limit=3)
+
+    ids, pages = run_db(scenario)
+    newest, tied, oldest = ids[8], sorted(ids[:7], reverse=True), ids[7]
+    assert [len(page) for page in pages] == [3, 3, 3]
+    assert sum(pages, []) == [newest, *tied, oldest]
+
+
+def test_thread_page_after_new_threads_does_not_repeat_rows(run_db, data_layer):
+    async def scenario():
+        await create_threads(data_layer, "alice", [SAME_TIME] * 4)
+        first = await data_layer.list_user_threads_page("alice", limit=2)
+        # A thread started meanwhile sorts first and does not shift the next page
+        await create_threads(data_layer, "alice", ["2026-01-02T00:00:00"])
+        second = await data_layer.list_user_threads_page(
+            "alice", limit=2, cursor=first.pageInfo.endCursor
+        )
+        return first, second
+
+    first, second = run_db(scenario)
+    seen = [thread["id"] for thread in first.data + second.data]
+    assert len(set(seen)) == 4
+    assert not second.pageInfo.hasNextPage
+
+
+def test_step_pages_ascending_with_ties(run_db, data_layer):
+    thread_id = str(uuid.uuid4())
+
+    async def scenario():
+        await data_layer.create_thread(
+            {"id": thread_id, "name": "t", "metadata": {}, "tags": []}  # type: ignore[typeddict-item]
+        )
+        created_at = ["2026-01-01T11:00:00"] + [SAME_TIME] * 5
+        step_ids = []
+        for index, timestamp in enumerate(created_at):
+            step_id = str(uuid.uuid4())
+            await data_layer.create_step(
+                {  # type: ignore[typeddict-item]
+                    "id": step_id,
+                    "threadId": thread_id,
+                    "name": f"step {index}",
+                    "type": "user_message",
+                    "createdAt": timestamp,
+                }
+            )
+            step_ids.append(step_id)
+
+        first = await data_layer.get_thread_steps_page(thread_id, limit=4)
+        second = await data_layer.get_thread_steps_page(
+            thread_id, limit=4, cursor=first.pageInfo.endCursor
+        )
+        streamed = [
+            step["id"] async for step in data_layer.iter_thread_steps(thread_id, 2)
+        ]
+        return step_ids, first, second, streamed
+
+    step_ids, first, second, streamed = run_db(scenario)
+    expected = [step_ids[0], *sorted(step_ids[1:])]
+    assert [step["id"] for step in first.data] == expected[:4]
+    assert first.pageInfo.hasNextPage
+    assert [step["id"] for step in second.data] == expected[4:]
+    assert not second.pageInfo.hasNextPage
+    assert streamed == expected
+    # The cursor carries the last row's key
+    assert decode_cursor(first.pageInfo.endCursor)[1] == uuid.UUID(expected[3])
+
+
+def test_malformed_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
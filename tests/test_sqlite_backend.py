@@ -0,0 +1,69 @@
+"""
+SQLite backend: in-place JSON merges and the column additions that replace
+migrations on SQLite (src/database/dialect.py, src/database/config.py).
+"""
+
+import os
+import uuid
+
+from sqlalchemy import text
+
+from src.database.config import _add_missing_columns, engine
+from src.database.data_layer import CustomSQLAlchemyDataLayer
+
+
+def make_data_layer(monkeypatch) -> CustomSQLAlchemyDataLayer:
+    monkeypatch.setenv("DB_WRITE_BEHIND", "false")
+    return CustomSQLAlchemyDataLayer(conninfo=os.environ["DATABASE_URL"])
+
+
+def test_profile_context_is_merged_into_metadata(run_db, monkeypatch):
+    data_layer = make_data_layer(monkeypatch)
+    thread_id = str(uuid.uuid4())
+
+    async def scenario():
+        await data_layer.create_thread(
+            {"id": thread_id, "name": "t", "metadata": {"env": "test"}, "tags": []}  # type: ignore[typeddict-item]
+        )
+        await data_layer.update_thread_profile_context(thread_id, {"stage": "a"})
+        await data_layer.update_thread_profile_context(thread_id, {"stage": "b"})
+        return await data_layer.get_thread_metadata(thread_id)
+
+    assert run_db(scenario) == {"env": "test", "profile_context": {"stage": "b"}}
+
+
+def test_update_thread_creates_missing_thread(run_db, monkeypatch):
+    data_layer = make_data_layer(monkeypatch)
+    thread_id = str(uuid.uuid4())
+
+    async def scenario():
+        await data_layer.update_thread(thread_id, name="new", metadata={"k": 1})
+        await data_layer.update_thread(thread_id, metadata={"other": 2})
+        return await data_layer.get_thread(thread_id)
+
+    thread = run_db(scenario)
+    assert thread["name"] == "new"
+    assert thread["metadata"] == {"k": 1, "other": 2}
+
+
+def test_missing_columns_are_added(run_db):
+    async def scenario():
+        async with engine.begin() as conn:
+            # A database created before profile_outbox.generation existed
+            await conn.execute(
+                text("ALTER TABLE profile_outbox DROP COLUMN generation")
+            )
+            added = await conn.run_sync(_add_missing_columns)
+            await conn.execute(
+                text(
+                    "INSERT INTO profile_outbox "
+                    '(id, sink, "idempotencyKey", payload, attempts) '
+                    "VALUES ('x', 'sheets', 'k', '{}', 0)"
+                )
+            )
+            generation = await conn.scalar(
+                text("SELECT generation FROM profile_outbox")
+            )
+        return added, generation
+
+    assert run_db(scenario) == (["profile_outbox.generation"], 0)
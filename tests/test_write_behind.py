@@ -0,0 +1,227 @@
+"""
+WriteBehindBuffer: flush and shutdown durability, retries of transient
+errors, isolation of writes that can never commit (src/database/write_behind.py).
+"""
+
+import asyncio
+import sqlite3
+import uuid
+from contextlib import asynccontextmanager
+from uuid import UUID
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+from src.database.config import AsyncSessionLocal
+from src.database.data_layer import _step_values
+from src.database.models import Step, Thread
+from src.database.write_behind import (
+    WRITE_BEHIND_DEAD_LETTERS,
+    WriteBehindBuffer,
+    is_transient_error,
+)
+from src.shared.metrics import registry
+
+
+class ScriptedSessions:
+    """
+    Session factory that fails the first ``failures`` sessions with a
+    transient error and holds every session until ``gate`` is set
+    """
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.calls = 0
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    @asynccontextmanager
+    async def __call__(self):
+        self.calls += 1
+        await self.gate.wait()
+        if self.calls <= self.failures:
+            raise OperationalError(
+                "INSERT", {}, sqlite3.OperationalError("database is locked")
+            )
+        async with AsyncSessionLocal() as session:
+            yield session
+
+
+def step(thread_id: str, index: int, **overrides):
+    return _step_values(
+        {  # type: ignore[typeddict-item]
+            "id": str(uuid.uuid4()),
+            "threadId": thread_id,
+            "name": f"step {index}",
+            "type": "user_message",
+            "input": "",
+            "output": str(index),
+            "createdAt": f"2026-01-01T00:00:{index:02d}",
+            **overrides,
+        }
+    )
+
+
+async def stored_outputs(thread_id: str):
+    async with AsyncSessionLocal() as session:
+        rows = await session.execute(
+            select(Step.output)
+            .where(Step.threadId == UUID(thread_id))
+            .order_by(Step.createdAt)
+        )
+        return [output for (output,) in rows.all()]
+
+
+def dead_letters() -> float:
+    return registry.counter(WRITE_BEHIND_DEAD_LETTERS, "").value(kind="step")
+
+
+def test_close_commits_everything_buffered(run_db):
+    thread_id = str(uuid.uuid4())
+
+    async def scenario():
+        buffer = WriteBehindBuffer(AsyncSessionLocal, batch_size=7, interval=0.01)
+        for index in range(20):
+            await buffer.put_step(step(thread_id, index))
+        await buffer.put_profile_context(thread_id, {"stage": "a"})
+        await buffer.put_profile_context(thread_id, {"stage": "b"})
+        await buffer.close()
+
+        assert buffer.pending() == 0
+        async with AsyncSessionLocal() as session:
+            thread = await session.get(Thread, UUID(thread_id))
+        return await stored_outputs(thread_id), thread.metadata_
+
+    outputs, metadata = run_db(scenario)
+    assert outputs == [str(index) for index in range(20)]
+    assert metadata["profile_context"] == {"stage": "b"}
+
+
+def test_flush_waits_for_one_thread(run_db):
+    thread_id, other_id = str(uuid.uuid4()), str(uuid.uuid4())
+
+    async def scenario():
+        buffer = WriteBehindBuffer(AsyncSessionLocal, interval=0.05)
+        await buffer.put_step(step(other_id, 0))
+        await buffer.put_step(step(thread_id, 0))
+        await buffer.put_step(step(thread_id, 1))
+        assert buffer.pending(thread_id) == 2
+
+        await buffer.flush(thread_id)
+        assert buffer.pending(thread_id) == 0
+        outputs = await stored_outputs(thread_id)
+        await buffer.close()
+        return outputs
+
+    assert run_db(scenario) == ["0", "1"]
+
+
+def test_bad_write_is_dead_lettered_and_the_rest_commits(run_db):
+    thread_id = str(uuid.uuid4())
+    before = dead_letters()
+
+    async def scenario():
+        # One batch: the JSON column cannot store the bad step's metadata
+        buffer = WriteBehindBuffer(AsyncSessionLocal, interval=0.2)
+        for index in range(10):
+            metadata = {"bad": object()} if index == 5 else {}
+            await buffer.put_step(step(thread_id, index, metadata=metadata))
+        await asyncio.wait_for(buffer.flush(), 10)
+
+        assert buffer.pending() == 0
+        assert len(buffer.dead_letters) == 1
+        (kind, values), _ = buffer.dead_letters[0]
+        assert (kind, values["output"]) == ("step", "5")
+        assert "dead-lettered" in buffer.last_error
+        outputs = await stored_outputs(thread_id)
+        await buffer.close()
+        return outputs
+
+    assert run_db(scenario) == [str(index) for index in range(10) if index != 5]
+    assert dead_letters() == before + 1
+
+
+def test_transient_errors_are_retried(run_db):
+    thread_id = str(uuid.uuid4())
+    sessions = ScriptedSessions(failures=3)
+
+    async def scenario():
+        buffer = WriteBehindBuffer(sessions, interval=0.01, backoff_max=0.01)
+        for index in range(3):
+            await buffer.put_step(step(thread_id, index))
+        await asyncio.wait_for(buffer.flush(), 10)
+
+        assert buffer.last_error is None
+        assert not buffer.dead_letters
+        outputs = await stored_outputs(thread_id)
+        await buffer.close()
+        return outputs
+
+    assert run_db(scenario) == ["0", "1", "2"]
+    assert sessions.calls == 4
+
+
+def test_flush_reports_a_failing_database(run_db):
+    sessions = ScriptedSessions(failures=1000)
+
+    async def scenario():
+        buffer = WriteBehindBuffer(
+            sessions, interval=0.01, backoff_max=0.01, flush_timeout=0.2
+        )
+        await buffer.put_step(step(str(uuid.uuid4()), 0))
+        with pytest.raises(Exception, match="database is locked"):
+            await buffer.flush()
+        # Still queued, not dropped
+        assert buffer.pending() == 1
+        assert not buffer.dead_letters
+
+        sessions.failures = 0
+        await asyncio.wait_for(buffer.flush(), 10)
+        await buffer.close()
+
+    run_db(scenario)
+
+
+def test_cancelled_put_does_not_block_flush(run_db):
+    thread_id = str(uuid.uuid4())
+    sessions = ScriptedSessions()
+
+    async def scenario():
+        buffer = WriteBehindBuffer(sessions, max_size=1, interval=0)
+        sessions.gate.clear()
+        # The worker holds the first write, the second one fills the queue
+        await buffer.put_step(step(thread_id, 0))
+        await asyncio.sleep(0.05)
+        await buffer.put_step(step(thread_id, 1))
+        blocked = asyncio.create_task(buffer.put_step(step(thread_id, 2)))
+        await asyncio.sleep(0.05)
+        blocked.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await blocked
+        assert buffer.pending(thread_id) == 2
+
+        sessions.gate.set()
+        await asyncio.wait_for(buffer.flush(thread_id), 5)
+        await asyncio.wait_for(buffer.close(), 5)
+        return await stored_outputs(thread_id)
+
+    assert run_db(scenario) == ["0", "1"]
+
+
+def test_error_classification():
+    locked = OperationalError("x", {}, sqlite3.OperationalError("database is locked"))
+    assert is_transient_error(locked)
+    assert is_transient_error(ConnectionResetError())
+    assert not is_transient_error(TypeError("not JSON serializable"))
+
+    class PostgresError(Exception):
+        def __init__(self, sqlstate: str):
+            self.sqlstate = sqlstate
+
+    from sqlalchemy.exc import DBAPIError
+
+    # Deadlock and admin shutdown are retried, a too long value is not
+    assert is_transient_error(DBAPIError("x", {}, PostgresError("40P01")))
+    assert is_transient_error(DBAPIError("x", {}, PostgresError("57P01")))
+    assert not is_transient_error(DBAPIError("x", {}, PostgresError("22001")))